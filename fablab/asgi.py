@@ -12,5 +12,11 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'fablab.settings')
+os.environ.setdefault('JOBS_ASYNC_VIEWS', '1')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# Needs the apps loaded by get_asgi_application().
+from jobs.events import EventsApplication  # noqa: E402
+
+application = EventsApplication(django_application)
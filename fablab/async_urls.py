@@ -0,0 +1,14 @@
+from django.contrib import admin
+from django.urls import path
+
+from fablab.urls import api_patterns, job_patterns, media_patterns
+from jobs import async_views, views
+
+urlpatterns = [
+    path('admin/', admin.site.urls),
+    path('cache/stats', views.cache_stats, name='cache_stats'),
+    path('metrics', views.metrics, name='metrics'),
+    path('events', async_views.events, name='events'),
+    path('reports/sales', views.sales, name='sales_report'),
+    path('reports/workload', views.workload, name='workload_report'),
+] + job_patterns(async_views) + api_patterns() + media_patterns()
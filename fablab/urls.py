@@ -3,13 +3,53 @@ from django.conf.urls.static import static
 from django.contrib import admin
 from django.urls import path
 
-from jobs import views
+from jobs import api, views
+
+
+def job_patterns(views):
+    return [
+        path('', views.index, name='index'),
+        path('jobs/page', views.jobs_page, name='jobs_page'),
+        path('jobs/<int:pk>', views.job_detail, name='job'),
+        path('jobs/<int:pk>/add', views.add_to_printing,
+             name='add_to_printing'),
+        path('printings/draft/add', views.add_many_to_printing,
+             name='add_many_to_printing'),
+        path('printings/draft/form', views.form_printing,
+             name='form_printing'),
+        path('printings/<int:pk>', views.printing_detail, name='printing'),
+        path('printings/<int:pk>/delete', views.delete_printing,
+             name='delete_printing'),
+        path('moderation/queue', views.queue, name='moderation_queue'),
+        path('moderation/complete', views.moderate, {'action': 'complete'},
+             name='complete_printings'),
+        path('moderation/reject', views.moderate, {'action': 'reject'},
+             name='reject_printings'),
+    ]
+
+
+def api_patterns():
+    return [
+        path('api/v1/jobs', api.jobs, name='api_jobs'),
+        path('api/v1/jobs/<int:pk>', api.job, name='api_job'),
+        path('api/v1/printings/<int:pk>', api.printing, name='api_printing'),
+        path('api/v1/cart', api.cart, name='api_cart'),
+    ]
+
+
+def media_patterns():
+    # static() is a no-op unless DEBUG; with object storage the bucket or CDN
+    # serves media even then, so Django never streams image bytes.
+    if settings.STORAGES['default']['BACKEND'] != \
+            'jobs.storage.LocalObjectStorage':
+        return []
+    return static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+
 
 urlpatterns = [
     path('admin/', admin.site.urls),
-    path('', views.index, name='index'),
-    path('jobs/<int:pk>', views.job_detail, name='job'),
-    path('jobs/<int:pk>/add', views.add_to_printing, name='add_to_printing'),
-    path('printings/<int:pk>', views.printing_detail, name='printing'),
-    path('printings/<int:pk>/delete', views.delete_printing, name='delete_printing'),
-] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+    path('cache/stats', views.cache_stats, name='cache_stats'),
+    path('metrics', views.metrics, name='metrics'),
+    path('reports/sales', views.sales, name='sales_report'),
+    path('reports/workload', views.workload, name='workload_report'),
+] + job_patterns(views) + api_patterns() + media_patterns()
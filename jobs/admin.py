@@ -1,18 +1,260 @@
-from django.contrib import admin
+import io
 
-from jobs.models import Job, Printing, PrintingJob
+from django import forms
+from django.contrib import admin, messages
+from django.contrib.admin.utils import (get_fields_from_path,
+                                        lookup_spawns_duplicates)
+from django.core.exceptions import PermissionDenied, ValidationError
+from django.core.paginator import Paginator
+from django.db.models import Q
+from django.http import StreamingHttpResponse
+from django.shortcuts import redirect
+from django.template.response import TemplateResponse
+from django.urls import path
+from django.utils import timezone
+from django.utils.functional import cached_property
+from django.utils.text import smart_split, unescape_string_literal
+
+from jobs.cart import forget_cart
+from jobs.catalog_io import (InvalidRow, detect_format, export_chunks,
+                             import_jobs)
+from jobs.explain import estimated_count
+from jobs.images import upload_image
+from jobs.models import (ArchivedPrinting, ArchivedPrintingJob, Job,
+                         Printing, PrintingJob, Task)
+from jobs.totals import recompute_totals
+
+# Below this many estimated rows an exact count is cheap enough.
+ESTIMATE_THRESHOLD = 10000
+
+
+class JobForm(forms.ModelForm):
+    image_file = forms.ImageField(required=False,
+                                  label='Загрузить изображение')
+
+    class Meta:
+        model = Job
+        fields = '__all__'
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Changelist paginator that takes the planner estimate instead of a
+    COUNT(*) for big result sets on PostgreSQL. Page numbers past the
+    estimate may come out short; that is the price of not counting.
+    """
+
+    @cached_property
+    def count(self):
+        estimate = estimated_count(self.object_list)
+        if estimate is not None and estimate > ESTIMATE_THRESHOLD:
+            return estimate
+        return super().count
+
+
+class ExactSearchMixin:
+    """
+    Search the ``exact_search_fields`` with plain equality, so their
+    indexes serve it. The admin's '=field' is iexact, UPPER(col::text) =
+    UPPER(%s) on PostgreSQL, which no index does. A term is only compared
+    with the fields it is a valid value of, e.g. 'abc' skips id; the other
+    search_fields get icontains.
+    """
+    exact_search_fields = ()
+
+    def exact_search_q(self, path, term):
+        field = get_fields_from_path(self.model, path)[-1]
+        try:
+            value = field.to_python(term)
+            field.run_validators(value)
+        except ValidationError:
+            return Q(pk__in=[])
+        return Q((path, value))
+
+    def get_search_results(self, request, queryset, search_term):
+        search_fields = self.get_search_fields(request)
+        if not search_term or not search_fields:
+            return queryset, False
+        term_queries = []
+        for bit in smart_split(search_term):
+            if bit.startswith(('"', "'")) and bit[0] == bit[-1]:
+                bit = unescape_string_literal(bit)
+            term_q = Q(pk__in=[])
+            for path in search_fields:
+                if path in self.exact_search_fields:
+                    term_q |= self.exact_search_q(path, bit)
+                else:
+                    term_q |= Q(('%s__icontains' % path, bit))
+            term_queries.append(term_q)
+        may_have_duplicates = any(
+            lookup_spawns_duplicates(self.opts, path)
+            for path in search_fields)
+        return (queryset.filter(Q.create(term_queries)),
+                may_have_duplicates)
+
+
+class ImportForm(forms.Form):
+    file = forms.FileField(label='Файл')
 
 
 @admin.register(Job)
-class JobAdmin(admin.ModelAdmin):
-    list_display = ('name', 'info')
+class JobAdmin(ExactSearchMixin, admin.ModelAdmin):
+    list_display = ('name', 'code', 'price', 'status')
+    list_filter = ('status',)
+    ordering = ('-id',)
+    # name__icontains is served by the trigram index on UPPER(name).
+    search_fields = ('code', 'name')
+    exact_search_fields = ('code',)
+    show_full_result_count = False
+    paginator = EstimatedCountPaginator
+    form = JobForm
+    actions = ['export_csv', 'export_jsonl']
+
+    def save_model(self, request, obj, form, change):
+        if form.cleaned_data.get('image_file'):
+            obj.image = upload_image(form.cleaned_data['image_file'])
+        super().save_model(request, obj, form, change)
+
+    def get_urls(self):
+        return [
+            path('import/', self.admin_site.admin_view(self.import_view),
+                 name='jobs_job_import'),
+        ] + super().get_urls()
+
+    def import_view(self, request):
+        if not self.has_change_permission(request):
+            raise PermissionDenied
+        form = ImportForm(request.POST or None, request.FILES or None)
+        if form.is_valid():
+            upload = form.cleaned_data['file']
+            # Uploads above FILE_UPLOAD_MAX_MEMORY_SIZE are already on disk;
+            # read them as a stream either way.
+            stream = io.TextIOWrapper(upload.file, encoding='utf-8',
+                                      newline='')
+            try:
+                imported, skipped = import_jobs(stream,
+                                                detect_format(upload.name))
+            except (InvalidRow, UnicodeDecodeError) as exc:
+                form.add_error('file', str(exc))
+            else:
+                self.message_user(
+                    request, 'Импортировано: %d, пропущено: %d'
+                    % (imported, skipped), messages.SUCCESS)
+                return redirect('admin:jobs_job_changelist')
+        return TemplateResponse(request, 'admin/jobs/job/import.html', {
+            **self.admin_site.each_context(request),
+            'opts': self.model._meta,
+            'title': 'Импорт работ',
+            'form': form,
+        })
+
+    def export(self, queryset, fmt):
+        response = StreamingHttpResponse(
+            export_chunks(queryset, fmt),
+            content_type='text/csv' if fmt == 'csv' else 'application/jsonl')
+        response['Content-Disposition'] = \
+            'attachment; filename="jobs.%s"' % fmt
+        return response
+
+    @admin.action(description='Экспорт в CSV')
+    def export_csv(self, request, queryset):
+        return self.export(queryset, 'csv')
+
+    @admin.action(description='Экспорт в JSONL')
+    def export_jsonl(self, request, queryset):
+        return self.export(queryset, 'jsonl')
 
 
 @admin.register(Printing)
-class PrintingAdmin(admin.ModelAdmin):
-    list_display = ('id', 'status', 'name')
+class PrintingAdmin(ExactSearchMixin, admin.ModelAdmin):
+    list_display = ('id', 'status', 'name', 'author', 'moderator',
+                    'formed_at', 'total_price', 'item_count')
+    list_select_related = ('author', 'moderator')
+    list_filter = ('status', 'formed_at')
+    ordering = ('-id',)
+    search_fields = exact_search_fields = ('id', 'author__username')
+    autocomplete_fields = ('author', 'moderator')
+    readonly_fields = ('total_price', 'item_count')
+    show_full_result_count = False
+    paginator = EstimatedCountPaginator
 
 
 @admin.register(PrintingJob)
-class PrintingJobAdmin(admin.ModelAdmin):
-    list_display = ('printing', 'job')
+class PrintingJobAdmin(ExactSearchMixin, admin.ModelAdmin):
+    list_display = ('printing', 'job', 'quantity', 'price')
+    list_select_related = ('printing', 'job')
+    ordering = ('-id',)
+    search_fields = exact_search_fields = ('printing__id', 'job__code')
+    autocomplete_fields = ('printing', 'job')
+    show_full_result_count = False
+    paginator = EstimatedCountPaginator
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        recompute_totals([obj.printing_id])
+        forget_cart(obj.printing.author_id)
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        recompute_totals([obj.printing_id])
+        forget_cart(obj.printing.author_id)
+
+    def delete_queryset(self, request, queryset):
+        printings = dict(queryset.values_list('printing_id',
+                                              'printing__author_id'))
+        super().delete_queryset(request, queryset)
+        recompute_totals(list(printings))
+        for author_id in set(printings.values()):
+            forget_cart(author_id)
+
+
+class ArchivedPrintingJobInline(admin.TabularInline):
+    model = ArchivedPrintingJob
+    fields = ('job', 'quantity', 'price')
+    readonly_fields = fields
+    extra = 0
+    can_delete = False
+
+
+@admin.register(ArchivedPrinting)
+class ArchivedPrintingAdmin(ExactSearchMixin, admin.ModelAdmin):
+    """Read only, rows get here through archive_printings."""
+    list_display = ('id', 'status', 'name', 'author', 'moderator',
+                    'complete_at', 'total_price', 'archived_at')
+    list_select_related = ('author', 'moderator')
+    list_filter = ('status',)
+    ordering = ('-id',)
+    search_fields = exact_search_fields = ('id', 'author__username')
+    show_full_result_count = False
+    paginator = EstimatedCountPaginator
+    inlines = [ArchivedPrintingJobInline]
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(Task)
+class TaskAdmin(ExactSearchMixin, admin.ModelAdmin):
+    list_display = ('id', 'name', 'args', 'status', 'attempts', 'run_at',
+                    'finished_at')
+    list_filter = ('status', 'name')
+    ordering = ('-id',)
+    search_fields = exact_search_fields = ('id', 'key')
+    readonly_fields = ('name', 'args', 'key', 'attempts', 'created_at',
+                       'started_at', 'finished_at', 'last_error')
+    show_full_result_count = False
+    paginator = EstimatedCountPaginator
+    actions = ['retry']
+
+    def has_add_permission(self, request):
+        return False
+
+    @admin.action(description='Повторить')
+    def retry(self, request, queryset):
+        retried = queryset.filter(status='failed').update(
+            status='queued', attempts=0, run_at=timezone.now())
+        self.message_user(request, 'Повторено: %d' % retried,
+                          messages.SUCCESS)
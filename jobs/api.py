@@ -0,0 +1,291 @@
+"""
+Versioned JSON API under /api/v1/ over the catalog, printings and the cart.
+
+Rows are read as .values() projections of the requested ``?fields=`` only,
+so no model instances are built, and serialized with orjson when it is
+installed (json otherwise). Every response carries a strong ETag, answers
+If-None-Match with 304 and is compressed with brotli (when installed) or
+gzip if the client accepts it; each content coding gets its own ETag, as a
+strong validator must differ between encodings. Catalog bodies are cached
+per catalog version like the HTML pages, and their compressed forms by ETag,
+so a hot catalog request compresses nothing.
+"""
+import hashlib
+import json
+from operator import itemgetter
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models.functions import Coalesce
+from django.http import HttpResponse, JsonResponse
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.text import compress_string
+from django.views.decorators.http import require_safe
+
+from jobs.cache import catalog_cache, catalog_version, make_key, read_through
+from jobs.images import media_url, variant_sources
+from jobs.models import Job, Printing, PrintingJob
+from jobs.pagination import (InvalidCursor, clamp_page_size, page_queryset,
+                             page_result)
+from jobs.routers import catalog_reads
+from jobs.search import normalize
+from jobs.views import catalog
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Smaller bodies are not worth compressing.
+MIN_COMPRESS_SIZE = 256
+BROTLI_QUALITY = 5
+
+
+def column(name):
+    return (name,), itemgetter(name)
+
+
+def sources_json(row):
+    return [{'type': mime, 'srcset': srcset}
+            for mime, srcset in variant_sources(row['image_variants'])]
+
+
+# API field -> (columns it is read from, value from the .values() row).
+JOB_FIELDS = {
+    'id': column('id'),
+    'code': column('code'),
+    'name': column('name'),
+    'info': column('info'),
+    'price': column('price'),
+    'image': (('image',), lambda row: media_url(row['image'])),
+    'sources': (('image_variants',), sources_json),
+}
+JOB_DEFAULT_FIELDS = ('id', 'name', 'price', 'image', 'sources')
+
+PRINTING_FIELDS = {
+    'id': column('id'),
+    'name': column('name'),
+    'status': column('status'),
+    'author': column('author__username'),
+    'moderator': column('moderator__username'),
+    'created_at': column('created_at'),
+    'formed_at': column('formed_at'),
+    'complete_at': column('complete_at'),
+    'total_price': column('total_price'),
+    'item_count': column('item_count'),
+}
+PRINTING_DEFAULT_FIELDS = tuple(PRINTING_FIELDS)
+
+
+class UnknownFields(ValueError):
+    pass
+
+
+def parse_fields(request, available, default):
+    value = request.GET.get('fields')
+    if not value:
+        return default
+    fields = tuple(dict.fromkeys(name.strip() for name in value.split(',')
+                                 if name.strip()))
+    unknown = [name for name in fields if name not in available]
+    if unknown or not fields:
+        raise UnknownFields(unknown)
+    return fields
+
+
+def columns(available, fields, extra=()):
+    return list(dict.fromkeys(
+        [column for name in fields for column in available[name][0]]
+        + list(extra)))
+
+
+def project(available, fields, row):
+    return {name: available[name][1](row) for name in fields}
+
+
+def dumps(data):
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data, cls=DjangoJSONEncoder, ensure_ascii=False,
+                      separators=(',', ':')).encode()
+
+
+def accepted_codings(request):
+    codings = set()
+    for item in request.headers.get('Accept-Encoding', '').split(','):
+        coding, _, params = item.partition(';')
+        quality = params.replace(' ', '').lower()
+        if quality.startswith('q=') and not quality[2:].strip('0.'):
+            continue
+        codings.add(coding.strip().lower())
+    return codings
+
+
+def content_coding(request, size):
+    if size < MIN_COMPRESS_SIZE:
+        return None
+    codings = accepted_codings(request)
+    if brotli is not None and 'br' in codings:
+        return 'br'
+    if 'gzip' in codings:
+        return 'gzip'
+    return None
+
+
+def encode(body, coding):
+    if coding == 'br':
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    if coding == 'gzip':
+        return compress_string(body)
+    return body
+
+
+def encoded_body(body, coding, etag):
+    """encode(), cached under the ETag, which names the body and coding."""
+    cache = catalog_cache()
+    key = 'jobs:api-encoded:%s' % etag.strip('"')
+    encoded = cache.get(key)
+    if encoded is None:
+        encoded = encode(body, coding)
+        cache.set(key, encoded, timeout=settings.JOBS_CACHE_TIMEOUT)
+    return encoded
+
+
+def api_response(request, body, shared=False):
+    """
+    The JSON body as a conditional, compressed response. The compressed
+    forms of ``shared`` bodies, the same for every client, are cached.
+    """
+    coding = content_coding(request, len(body))
+    digest = hashlib.md5(body).hexdigest()
+    etag = '"%s%s"' % (digest, '-' + coding if coding else '')
+    # Nothing is compressed for a 304.
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        if coding and shared:
+            body = encoded_body(body, coding, etag)
+        else:
+            body = encode(body, coding)
+        response = HttpResponse(body, content_type='application/json')
+        if coding:
+            response['Content-Encoding'] = coding
+        response['ETag'] = etag
+    patch_vary_headers(response, ['Accept-Encoding'])
+    return response
+
+
+def api_error(message, status, **extra):
+    return JsonResponse({'error': message, **extra}, status=status)
+
+
+def fields_or_error(request, available, default):
+    try:
+        return parse_fields(request, available, default), None
+    except UnknownFields as exc:
+        return None, api_error('Unknown fields', 400, fields=exc.args[0],
+                               available=list(available))
+
+
+@require_safe
+@catalog_reads
+def jobs(request):
+    fields, error = fields_or_error(request, JOB_FIELDS, JOB_DEFAULT_FIELDS)
+    if error:
+        return error
+    queryset, ordering = catalog(request)
+    cursor = request.GET.get('cursor')
+    size = clamp_page_size(request.GET.get('size'))
+    params = (normalize(request.GET.get('job_name', '')), ordering, cursor,
+              size, fields)
+
+    def build():
+        rows = queryset.values(*columns(
+            JOB_FIELDS, fields, [field.lstrip('-') for field in ordering]))
+        page, next_cursor = page_result(
+            list(page_queryset(rows, ordering, cursor, size)), ordering,
+            size)
+        return dumps({'results': [project(JOB_FIELDS, fields, row)
+                                  for row in page],
+                      'next_cursor': next_cursor})
+
+    try:
+        body = read_through(make_key(catalog_version(), 'api-jobs', params),
+                            build)
+    except InvalidCursor:
+        return api_error('Invalid cursor', 400)
+    return api_response(request, body, shared=True)
+
+
+@require_safe
+@catalog_reads
+def job(request, pk):
+    fields, error = fields_or_error(request, JOB_FIELDS, JOB_DEFAULT_FIELDS)
+    if error:
+        return error
+
+    def build():
+        row = (Job.objects.filter(pk=pk)
+               .values(*columns(JOB_FIELDS, fields)).first())
+        # False, unlike None, is cached.
+        return dumps(project(JOB_FIELDS, fields, row)) if row else False
+
+    body = read_through(make_key(catalog_version(), 'api-job', pk, fields),
+                        build)
+    if not body:
+        return api_error('Not found', 404)
+    return api_response(request, body, shared=True)
+
+
+def line_rows(printing_id):
+    return (PrintingJob.objects.filter(printing_id=printing_id)
+            .annotate(line_price=Coalesce('price', 'job__price'))
+            .order_by('id')
+            .values_list('job_id', 'job__name', 'quantity', 'line_price'))
+
+
+def lines_json(printing_id):
+    return [{'job': job_id, 'name': name, 'quantity': quantity,
+             'price': price, 'subtotal': (quantity or 0) * price}
+            for job_id, name, quantity, price in line_rows(printing_id)]
+
+
+def printing_body(request, printings, empty=None):
+    """The first of printings with its lines, or empty if there is none."""
+    fields, error = fields_or_error(request, PRINTING_FIELDS,
+                                    PRINTING_DEFAULT_FIELDS)
+    if error:
+        return error
+    row = printings.values(*columns(PRINTING_FIELDS, fields, ['id'])).first()
+    if row is not None:
+        data = project(PRINTING_FIELDS, fields, row)
+        data['lines'] = lines_json(row['id'])
+    elif empty is not None:
+        data = empty
+    else:
+        return api_error('Not found', 404)
+    return api_response(request, dumps(data))
+
+
+@require_safe
+def printing(request, pk):
+    if not request.user.is_authenticated:
+        return api_error('Authentication required', 403)
+    printings = Printing.objects.filter(pk=pk)
+    if not request.user.is_staff:
+        printings = printings.filter(author_id=request.user.pk)
+    return printing_body(request, printings)
+
+
+@require_safe
+def cart(request):
+    if not request.user.is_authenticated:
+        return api_error('Authentication required', 403)
+    # An empty cart has no draft yet.
+    return printing_body(request, Printing.objects.filter(
+        author_id=request.user.pk, status='draft'),
+        empty={'id': None, 'total_price': 0, 'item_count': 0, 'lines': []})
@@ -1,6 +1,37 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save
 
 
 class JobsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'jobs'
+
+    def ready(self):
+        from django.contrib.auth import get_user_model
+
+        from jobs.auth import forget_user
+        from jobs.cache import invalidate_catalog, printing_changed
+        from jobs.cart import forget_author_cart
+        from jobs.images import schedule_variants
+        from jobs.instrumentation import install_query_recorder
+        from jobs.search import register_sqlite_functions
+        from jobs.totals import reprice_drafts
+
+        connection_created.connect(register_sqlite_functions)
+        connection_created.connect(install_query_recorder)
+        User = get_user_model()
+        post_save.connect(forget_user, sender=User)
+        post_delete.connect(forget_user, sender=User)
+        Job = self.get_model('Job')
+        post_save.connect(invalidate_catalog, sender=Job)
+        post_delete.connect(invalidate_catalog, sender=Job)
+        post_save.connect(reprice_drafts, sender=Job)
+        post_save.connect(schedule_variants, sender=Job)
+        Printing = self.get_model('Printing')
+        post_save.connect(forget_author_cart, sender=Printing)
+        post_delete.connect(forget_author_cart, sender=Printing)
+        # Moderated printings are cached as rendered pages.
+        for sender in (Printing, self.get_model('PrintingJob')):
+            post_save.connect(printing_changed, sender=sender)
+            post_delete.connect(printing_changed, sender=sender)
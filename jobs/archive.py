@@ -0,0 +1,57 @@
+"""
+Moves old finished and deleted printings with their lines out of the hot
+tables into jobs_archivedprinting and jobs_archivedprintingjob, same ids,
+one batch per transaction. Run by the archive_printings command.
+"""
+from django.db import connection, transaction
+from django.db.models import Case, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from jobs.cache import catalog_cache, catalog_version, printing_page_key
+from jobs.models import Printing
+
+STATUSES = ('deleted', 'complete', 'rejected')
+
+PRINTING_COLUMNS = ('id, name, author_id, moderator_id, status, created_at, '
+                    'formed_at, complete_at, total_price, item_count')
+LINE_COLUMNS = 'id, job_id, printing_id, quantity, price'
+
+
+def archivable(cutoff, statuses=STATUSES):
+    """Printings in statuses whose last status change is older than cutoff."""
+    return (Printing.all_objects.filter(status__in=statuses)
+            .alias(changed_at=Case(
+                # mark_deleted stamps updated_at, nothing else records when.
+                When(status='deleted', then='updated_at'),
+                default=Coalesce('complete_at', 'formed_at', 'created_at')))
+            .filter(changed_at__lt=cutoff))
+
+
+def archive_batch(cutoff, statuses=STATUSES, batch_size=1000):
+    """Archive up to batch_size printings, return their ids."""
+    with transaction.atomic():
+        ids = list(archivable(cutoff, statuses).order_by('id')
+                   .values_list('id', flat=True)[:batch_size])
+        if not ids:
+            return ids
+        placeholders = ', '.join(['%s'] * len(ids))
+        archived_at = connection.ops.adapt_datetimefield_value(timezone.now())
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'INSERT INTO jobs_archivedprinting (%s, archived_at) '
+                'SELECT %s, %%s FROM jobs_printing WHERE id IN (%s)'
+                % (PRINTING_COLUMNS, PRINTING_COLUMNS, placeholders),
+                [archived_at, *ids])
+            cursor.execute(
+                'INSERT INTO jobs_archivedprintingjob (%s) '
+                'SELECT %s FROM jobs_printingjob WHERE printing_id IN (%s)'
+                % (LINE_COLUMNS, LINE_COLUMNS, placeholders), ids)
+            cursor.execute('DELETE FROM jobs_printingjob '
+                           'WHERE printing_id IN (%s)' % placeholders, ids)
+            cursor.execute('DELETE FROM jobs_printing WHERE id IN (%s)'
+                           % placeholders, ids)
+    version = catalog_version()
+    catalog_cache().delete_many([printing_page_key(version, pk)
+                                 for pk in ids])
+    return ids
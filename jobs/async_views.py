@@ -0,0 +1,246 @@
+"""
+Native async versions of the views in jobs.views, served under ASGI (see
+fablab/async_urls.py). Raw SQL in a transaction has no async API in Django,
+so the cart writes still run in a worker thread through sync_to_async.
+"""
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import (Http404, HttpResponse, HttpResponseBadRequest,
+                         HttpResponseForbidden, JsonResponse,
+                         StreamingHttpResponse)
+from django.middleware.csrf import get_token
+from django.shortcuts import redirect, render
+from django.template.loader import render_to_string
+from django.views.decorators.http import require_POST
+
+from jobs.cache import (CSRF_PLACEHOLDER, acached_job, acached_page,
+                        acached_page_response, acatalog_version, arender_cards,
+                        page_cacheable, printing_page_key)
+from jobs.cart import (aforget_cart, aget_cart, form_draft, set_quantities,
+                       toggle_job)
+from jobs.events import event_stream, user_channels
+from jobs.models import Job, Printing
+from jobs.moderation import (QUEUE_ORDERING, moderation_queue, parse_ids,
+                             transition)
+from jobs.pagination import InvalidCursor, apaginate, clamp_page_size
+from jobs.routers import catalog_reads
+from jobs.views import (FINAL_STATUSES, STREAM_MARKER, catalog, mark_deleted,
+                        moderation_page, page_args, page_json,
+                        parse_quantities, printing_lines, render_printing)
+
+
+async def catalog_page(request, version):
+    jobs, ordering, cursor, size, params = page_args(request)
+    return await acached_page(
+        version, params, lambda: apaginate(jobs, ordering, cursor, size))
+
+
+def stream_index(request, context, jobs, version):
+    page = render_to_string('index.html',
+                            {**context, 'stream_marker': STREAM_MARKER},
+                            request)
+    head, tail = page.split(STREAM_MARKER)
+    csrf_token = get_token(request)
+
+    async def chunks():
+        yield head
+        size = settings.JOBS_STREAM_CHUNK_SIZE
+        batch = []
+        async for job in jobs.aiterator(chunk_size=size):
+            batch.append(job)
+            if len(batch) == size:
+                yield ''.join(await arender_cards(version, batch, csrf_token))
+                batch = []
+        if batch:
+            yield ''.join(await arender_cards(version, batch, csrf_token))
+        yield tail
+
+    return StreamingHttpResponse(chunks())
+
+
+async def render_index(request, context, jobs, ordering, version,
+                       csrf_token):
+    try:
+        page, next_cursor = await catalog_page(request, version)
+    except InvalidCursor:
+        page, next_cursor = await apaginate(jobs, ordering)
+    cards = await arender_cards(version, page, csrf_token)
+    return render(
+        request,
+        'index.html',
+        context={**context,
+                 'jobs': page,
+                 'cards': cards,
+                 'next_cursor': next_cursor,
+                 'csrf_token': csrf_token}
+    )
+
+
+@catalog_reads
+async def index(request):
+    jobs, ordering = catalog(request)
+    user = await request.auser()
+    context = {'cart': await aget_cart(user)}
+    version = await acatalog_version()
+    if settings.JOBS_INDEX_STREAMING:
+        return stream_index(request, context, jobs.order_by(*ordering),
+                            version)
+    if page_cacheable(request, user):
+        return await acached_page_response(
+            request, version, lambda: render_index(
+                request, context, jobs, ordering, version, CSRF_PLACEHOLDER))
+    return await render_index(request, context, jobs, ordering, version,
+                              get_token(request))
+
+
+@catalog_reads
+async def jobs_page(request):
+    try:
+        page, next_cursor = await catalog_page(request,
+                                               await acatalog_version())
+    except InvalidCursor:
+        return HttpResponseBadRequest('Invalid cursor')
+    return JsonResponse(page_json(page, next_cursor))
+
+
+async def render_job(request, version, pk):
+    job = await acached_job(version, pk,
+                            lambda: Job.objects.filter(pk=pk).afirst())
+    if job is None:
+        if await Job.all_objects.filter(pk=pk).aexists():
+            return redirect('/')
+        return HttpResponse(status=404)
+    return render(
+        request,
+        'job.html',
+        context={'job': job}
+    )
+
+
+@catalog_reads
+async def job_detail(request, pk):
+    version = await acatalog_version()
+    if page_cacheable(request, await request.auser()):
+        return await acached_page_response(
+            request, version, lambda: render_job(request, version, pk))
+    return await render_job(request, version, pk)
+
+
+async def load_printing(pk):
+    lines = [line async for line in printing_lines(pk)]
+    if lines:
+        return lines[0].printing, lines
+    printing = await (Printing.objects.select_related('author', 'moderator')
+                      .filter(pk=pk).afirst())
+    return printing, []
+
+
+async def printing_detail(request, pk):
+    if not settings.JOBS_PAGE_CACHE:
+        return render_printing(request, *await load_printing(pk),
+                               get_token(request))
+
+    async def build():
+        printing, lines = await load_printing(pk)
+        final = printing is not None and printing.status in FINAL_STATUSES
+        return render_printing(request, printing, lines,
+                               CSRF_PLACEHOLDER if final
+                               else get_token(request))
+
+    version = await acatalog_version()
+    return await acached_page_response(request, version, build,
+                                       key=printing_page_key(version, pk))
+
+
+async def add_to_printing(request, pk):
+    if request.method == 'POST':
+        user = await request.auser()
+        if not user.is_authenticated:
+            return HttpResponseForbidden()
+        try:
+            await sync_to_async(toggle_job)(user.pk, pk)
+        except Job.DoesNotExist:
+            raise Http404
+        await aforget_cart(user.pk)
+        return redirect('/')
+
+
+@require_POST
+async def add_many_to_printing(request):
+    user = await request.auser()
+    if not user.is_authenticated:
+        return HttpResponseForbidden()
+    try:
+        quantities = parse_quantities(request.body)
+    except (ValueError, KeyError, TypeError):
+        return HttpResponseBadRequest('Expected {"jobs": [{"id", "quantity"}]}')
+    try:
+        draft_id = await sync_to_async(set_quantities)(user.pk, quantities)
+    except Job.DoesNotExist as exc:
+        return JsonResponse({'missing': exc.args[0]}, status=404)
+    await aforget_cart(user.pk)
+    return JsonResponse({'id': draft_id, 'jobs': quantities})
+
+
+@require_POST
+async def form_printing(request):
+    user = await request.auser()
+    if not user.is_authenticated:
+        return HttpResponseForbidden()
+    printing_id = await sync_to_async(form_draft)(user.pk)
+    if printing_id is None:
+        return redirect('/')
+    await aforget_cart(user.pk)
+    return redirect('printing', pk=printing_id)
+
+
+async def queue(request):
+    user = await request.auser()
+    if not user.is_staff:
+        return HttpResponseForbidden()
+    try:
+        page, next_cursor = await apaginate(
+            moderation_queue(), QUEUE_ORDERING, request.GET.get('cursor'),
+            clamp_page_size(request.GET.get('size')))
+    except InvalidCursor:
+        return HttpResponseBadRequest('Invalid cursor')
+    return JsonResponse(moderation_page(page, next_cursor))
+
+
+@require_POST
+async def moderate(request, action):
+    user = await request.auser()
+    if not user.is_staff:
+        return HttpResponseForbidden()
+    try:
+        ids = parse_ids(request.body)
+    except (ValueError, KeyError, TypeError):
+        return HttpResponseBadRequest('Expected {"ids": [...]}')
+    moved = await sync_to_async(transition)(action, ids, user.pk)
+    return JsonResponse({action: moved,
+                         'skipped': sorted(set(ids) - set(moved))})
+
+
+async def delete_printing(request, pk):
+    if request.method == 'POST':
+        author_id = await sync_to_async(mark_deleted)(pk)
+        if author_id is not None:
+            await aforget_cart(author_id)
+        return redirect('/')
+
+
+async def events(request):
+    """
+    Server-sent events of the printings of the user and, for staff, of the
+    moderation queue. Under uvicorn and other ASGI servers
+    events.EventsApplication answers this URL instead, without holding a
+    thread per stream.
+    """
+    channels = user_channels(await request.auser())
+    if channels is None:
+        return HttpResponseForbidden()
+    response = StreamingHttpResponse(event_stream(channels),
+                                     content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
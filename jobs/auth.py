@@ -0,0 +1,118 @@
+"""
+Authentication with fewer queries per request and a bound on concurrent
+password hashing.
+
+CachedModelBackend keeps the users that sessions point to in a per-process
+cache for JOBS_USER_CACHE_TTL seconds, so a logged-in request costs no user
+SELECT. Saving or deleting a user drops it from the cache of the process
+that did it; other processes see the change within the TTL, which is also
+how long a password change takes to log out sessions handled elsewhere.
+Every request gets its own copy of the cached user.
+
+Sessions created before it was configured name ModelBackend, which stays
+in AUTHENTICATION_BACKENDS so they still resolve, uncached until the next
+login. CachedModelBackend refuses failed logins with PermissionDenied so
+that ModelBackend does not hash the same password a second time.
+
+LimitedArgon2PasswordHasher lets at most JOBS_PASSWORD_HASHES argon2 hashes
+(about 100 MB of memory each with Django's parameters) run at once; a burst
+of logins waits for a slot instead of hashing on every request thread at
+once. It only limits: the hash still runs on the calling thread, which on
+the async login path is the thread Django's acheck_password runs it in,
+not the event loop. argon2-cffi releases the GIL while hashing.
+"""
+import copy
+import threading
+import time
+
+from django.conf import settings
+from django.contrib.auth.backends import ModelBackend
+from django.contrib.auth.hashers import Argon2PasswordHasher
+from django.core.exceptions import PermissionDenied
+
+# Beyond this many users the cache starts over.
+MAX_CACHED_USERS = 10000
+
+_users = {}
+_users_lock = threading.Lock()
+_hashes = None
+_hashes_lock = threading.Lock()
+
+
+def cached_user(user_id):
+    entry = _users.get(str(user_id))
+    if entry is None or entry[0] < time.monotonic():
+        return None
+    return copy.copy(entry[1])
+
+
+def cache_user(user_id, user):
+    with _users_lock:
+        if len(_users) >= MAX_CACHED_USERS:
+            _users.clear()
+        _users[str(user_id)] = (
+            time.monotonic() + settings.JOBS_USER_CACHE_TTL, user)
+    return copy.copy(user)
+
+
+def forget_user(sender, instance, **kwargs):
+    with _users_lock:
+        _users.pop(str(instance.pk), None)
+
+
+def clear_users():
+    with _users_lock:
+        _users.clear()
+
+
+class CachedModelBackend(ModelBackend):
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        user = super().authenticate(request, username, password, **kwargs)
+        if user is None and password is not None:
+            raise PermissionDenied
+        return user
+
+    async def aauthenticate(self, request, username=None, password=None,
+                            **kwargs):
+        user = await super().aauthenticate(request, username, password,
+                                           **kwargs)
+        if user is None and password is not None:
+            raise PermissionDenied
+        return user
+
+    def get_user(self, user_id):
+        user = cached_user(user_id)
+        if user is None:
+            user = super().get_user(user_id)
+            if user is not None:
+                user = cache_user(user_id, user)
+        return user
+
+    async def aget_user(self, user_id):
+        user = cached_user(user_id)
+        if user is None:
+            user = await super().aget_user(user_id)
+            if user is not None:
+                user = cache_user(user_id, user)
+        return user
+
+
+def hash_slots():
+    global _hashes
+    with _hashes_lock:
+        if _hashes is None:
+            _hashes = threading.BoundedSemaphore(
+                settings.JOBS_PASSWORD_HASHES)
+        return _hashes
+
+
+class LimitedArgon2PasswordHasher(Argon2PasswordHasher):
+    """Argon2PasswordHasher within hash_slots(); the same hashes."""
+
+    def encode(self, password, salt):
+        with hash_slots():
+            return super().encode(password, salt)
+
+    def verify(self, password, encoded):
+        with hash_slots():
+            return super().verify(password, encoded)
@@ -0,0 +1,360 @@
+import http.client
+import json
+import os
+import platform
+import random
+import shlex
+import socket
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import timedelta
+from http.cookies import SimpleCookie
+from urllib.parse import urlencode, urlsplit
+
+import django
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import UNUSABLE_PASSWORD_PREFIX
+from django.core.management.base import CommandError
+from django.db import connection
+from django.utils import timezone
+
+from jobs.models import Job, Printing, PrintingJob
+
+NAME_WORDS = [
+    '3D', 'печать', 'фрезеровка', 'лазерная', 'резка', 'гравировка',
+    'пайка', 'сканирование', 'моделирование', 'прототип', 'корпус',
+    'printing', 'milling', 'laser', 'cutting', 'engraving', 'soldering',
+    'scanning', 'modeling', 'prototype', 'enclosure', 'PLA', 'PETG', 'ABS',
+]
+INFO_WORDS = NAME_WORDS + [
+    'деталь', 'изделие', 'срок', 'материал', 'точность', 'part', 'product',
+    'deadline', 'material', 'accuracy', 'fast', 'быстро',
+]
+SEARCH_TERMS = ['печать', 'пичать', 'laser', 'lazer', 'PLA', 'корпус',
+                'prototyp', 'гравировка', 'soldering', 'фрезировка']
+
+
+def make_job(rng):
+    return Job(
+        name=' '.join(rng.sample(NAME_WORDS, 3)),
+        info=' '.join(rng.choices(INFO_WORDS, k=30)),
+        price=rng.randint(100, 50000),
+        status='deleted' if rng.random() < 0.05 else 'visible',
+    )
+
+
+def seed_jobs(count, batch_size=5000, seed=0):
+    rng = random.Random(seed)
+    created = 0
+    while created < count:
+        size = min(batch_size, count - created)
+        Job.objects.bulk_create(make_job(rng) for _ in range(size))
+        created += size
+    return created
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = max(0, round(pct / 100 * len(ordered)) - 1)
+    return ordered[index]
+
+
+def measure(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def summary(samples):
+    return {
+        'p50_ms': round(percentile(samples, 50), 3),
+        'p95_ms': round(percentile(samples, 95), 3),
+        'max_ms': round(max(samples), 3),
+    }
+
+
+def seed_users(count, batch_size=5000, prefix='bench'):
+    User = get_user_model()
+    start = User.objects.count()
+    User.objects.bulk_create(
+        (User(username='%s-%d' % (prefix, start + i),
+              password=UNUSABLE_PASSWORD_PREFIX)
+         for i in range(count)),
+        batch_size=batch_size,
+    )
+    return list(User.objects.order_by('-id')
+                .values_list('id', flat=True)[:count])
+
+
+PRINTING_STATUSES = ['complete'] * 6 + ['rejected', 'deleted', 'formed']
+
+
+def seed_printings(user_ids, count, batch_size=5000, seed=0):
+    """
+    Seed ``count`` printings spread over ``user_ids``: one draft for every
+    user, the rest with formed, complete, rejected or deleted status.
+    """
+    rng = random.Random(seed)
+    now = timezone.now()
+    printings = [Printing(author_id=user_id, status='draft')
+                 for user_id in user_ids[:count]]
+    for _ in range(count - len(printings)):
+        status = rng.choice(PRINTING_STATUSES)
+        formed_at = now - timedelta(minutes=rng.randint(1, 500_000))
+        printings.append(Printing(
+            author_id=rng.choice(user_ids),
+            status=status,
+            formed_at=formed_at,
+            complete_at=(formed_at + timedelta(days=1)
+                         if status == 'complete' else None),
+        ))
+    Printing.objects.bulk_create(printings, batch_size=batch_size)
+    return len(printings)
+
+
+def seed_printing_jobs(printings, jobs, max_lines=5, batch_size=5000,
+                       seed=0):
+    """
+    Give each of ``printings``, (id, status) pairs, between 1 and
+    ``max_lines`` distinct jobs out of ``jobs``, (id, price) pairs. Lines of
+    formed printings carry the price snapshot like form_draft() leaves them.
+    Totals are not updated, see recompute_totals().
+    """
+    rng = random.Random(seed)
+    lines = []
+    created = 0
+    for printing_id, status in printings:
+        for job_id, price in rng.sample(jobs,
+                                        rng.randint(1, min(max_lines,
+                                                           len(jobs)))):
+            lines.append(PrintingJob(
+                printing_id=printing_id, job_id=job_id,
+                quantity=rng.randint(1, 5),
+                price=None if status == 'draft' else price,
+            ))
+        if len(lines) >= batch_size:
+            PrintingJob.objects.bulk_create(lines)
+            created += len(lines)
+            lines = []
+    PrintingJob.objects.bulk_create(lines)
+    return created + len(lines)
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR,
+            capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def write_results(path, command, options, results):
+    """
+    Store benchmark results with what is needed to compare them across
+    commits: the commit, the database and the options of the run.
+    """
+    document = {
+        'command': command,
+        'commit': git_commit(),
+        'time': timezone.now().isoformat(),
+        'database': connection.vendor,
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'options': {name: value for name, value in options.items()
+                    if name not in ('stdout', 'stderr', 'no_color',
+                                    'force_color', 'skip_checks')},
+        'results': results,
+    }
+    with open(path, 'w', encoding='utf-8') as output:
+        json.dump(document, output, indent=2, ensure_ascii=False)
+
+
+SERVERS = {
+    'wsgi': ('gunicorn fablab.wsgi:application --bind 127.0.0.1:{port} '
+             '--workers 1 --threads 16'),
+    'asgi': 'uvicorn fablab.asgi:application --port {port} --workers 1',
+}
+
+
+def wait_for_port(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise CommandError('Server did not start on port %s' % port)
+
+
+@contextmanager
+def running_server(name, command, port):
+    """Run ``command`` (see SERVERS) on ``port`` for the duration."""
+    env = {**os.environ,
+           'JOBS_ASYNC_VIEWS': '1' if name == 'asgi' else '0'}
+    try:
+        server = subprocess.Popen(
+            shlex.split(command.format(port=port)), env=env,
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    except FileNotFoundError as exc:
+        raise CommandError('%s is not installed: %s' % (name, exc))
+    try:
+        wait_for_port(port)
+        yield 'http://127.0.0.1:%s' % port
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def http_load(base_url, paths, concurrency=16, duration=10.0):
+    """
+    Hit ``paths`` round robin from ``concurrency`` keep-alive connections for
+    ``duration`` seconds and report throughput and latency.
+    """
+    url = urlsplit(base_url)
+    deadline = time.monotonic() + duration
+    samples, errors = [], []
+    lock = threading.Lock()
+
+    def worker(offset):
+        conn = http.client.HTTPConnection(url.hostname, url.port, timeout=30)
+        local, failed, i = [], 0, offset
+        while time.monotonic() < deadline:
+            path = paths[i % len(paths)]
+            i += 1
+            start = time.perf_counter()
+            try:
+                conn.request('GET', path)
+                response = conn.getresponse()
+                response.read()
+                if response.status >= 500:
+                    failed += 1
+            except (OSError, http.client.HTTPException):
+                failed += 1
+                conn.close()
+                conn = http.client.HTTPConnection(url.hostname, url.port,
+                                                  timeout=30)
+                continue
+            local.append((time.perf_counter() - start) * 1000)
+        conn.close()
+        with lock:
+            samples.extend(local)
+            errors.append(failed)
+
+    started = time.monotonic()
+    with ThreadPoolExecutor(concurrency) as pool:
+        list(pool.map(worker, range(concurrency)))
+    elapsed = time.monotonic() - started
+    result = {'requests': len(samples), 'errors': sum(errors),
+              'rps': round(len(samples) / elapsed, 1)}
+    if samples:
+        result.update(summary(samples))
+    return result
+
+
+SCENARIO_STEPS = ('browse', 'search', 'add', 'cart')
+
+
+class ScenarioUser:
+    """One logged-in visitor of scenario_load() on a keep-alive connection."""
+
+    def __init__(self, url, session_cookie, draft_id, job_ids, rng):
+        self.url = url
+        self.cookies = dict([session_cookie])
+        self.draft_id = draft_id
+        self.job_ids = job_ids
+        self.rng = rng
+        self.connect()
+
+    def connect(self):
+        self.conn = http.client.HTTPConnection(self.url.hostname,
+                                               self.url.port, timeout=30)
+
+    def request(self, method, path, expect):
+        headers = {'Cookie': '; '.join('%s=%s' % item
+                                       for item in self.cookies.items())}
+        if method == 'POST':
+            headers['X-CSRFToken'] = self.cookies.get(
+                settings.CSRF_COOKIE_NAME, '')
+        self.conn.request(method, path, headers=headers)
+        response = self.conn.getresponse()
+        response.read()
+        for header in response.msg.get_all('Set-Cookie') or []:
+            for name, morsel in SimpleCookie(header).items():
+                self.cookies[name] = morsel.value
+        if response.status != expect:
+            raise http.client.HTTPException('%s %s: %s' % (
+                method, path, response.status))
+
+    def step(self, name):
+        if name == 'browse':
+            self.request('GET', '/', 200)
+        elif name == 'search':
+            self.request('GET', '/?' + urlencode(
+                {'job_name': self.rng.choice(SEARCH_TERMS)}), 200)
+        elif name == 'add':
+            self.request('POST', '/jobs/%d/add' % self.rng.choice(
+                self.job_ids), 302)
+        else:
+            self.request('GET', '/printings/%d' % self.draft_id, 200)
+
+    def close(self):
+        self.conn.close()
+
+
+def scenario_load(base_url, visitors, job_ids, duration=10.0, seed=0):
+    """
+    Run browse, search, add to cart and view cart in a loop, one thread per
+    ``visitors`` entry ((session cookie name, value), draft id), for
+    ``duration`` seconds. Report throughput and the latency of every step.
+    """
+    url = urlsplit(base_url)
+    deadline = time.monotonic() + duration
+    samples = {name: [] for name in SCENARIO_STEPS}
+    errors = []
+    lock = threading.Lock()
+
+    def worker(index):
+        session_cookie, draft_id = visitors[index]
+        user = ScenarioUser(url, session_cookie, draft_id, job_ids,
+                            random.Random(seed + index))
+        local = {name: [] for name in SCENARIO_STEPS}
+        failed = 0
+        while time.monotonic() < deadline:
+            for name in SCENARIO_STEPS:
+                start = time.perf_counter()
+                try:
+                    user.step(name)
+                except (OSError, http.client.HTTPException):
+                    failed += 1
+                    user.close()
+                    user.connect()
+                    break
+                local[name].append((time.perf_counter() - start) * 1000)
+        user.close()
+        with lock:
+            for name in SCENARIO_STEPS:
+                samples[name].extend(local[name])
+            errors.append(failed)
+
+    started = time.monotonic()
+    with ThreadPoolExecutor(len(visitors)) as pool:
+        list(pool.map(worker, range(len(visitors))))
+    elapsed = time.monotonic() - started
+    requests = sum(len(values) for values in samples.values())
+    return {
+        'requests': requests,
+        'scenarios': len(samples['cart']),
+        'errors': sum(errors),
+        'rps': round(requests / elapsed, 1),
+        'steps': {name: summary(values)
+                  for name, values in samples.items() if values},
+    }
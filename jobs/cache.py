@@ -0,0 +1,285 @@
+import hashlib
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+from django.http import HttpResponse
+from django.middleware.csrf import get_token
+from django.template.loader import get_template
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+from django.utils.safestring import mark_safe
+
+VERSION_KEY = 'jobs:catalog:version'
+# Set for JOBS_REPLICA_LAG seconds by every bump of the version.
+CHANGED_KEY = 'jobs:catalog:changed'
+CSRF_PLACEHOLDER = '__jobs_csrf_token__'
+
+_stats = Counter()
+_stats_lock = threading.Lock()
+
+
+def count(name, amount=1):
+    with _stats_lock:
+        _stats[name] += amount
+
+
+def cache_stats():
+    with _stats_lock:
+        stats = dict(_stats)
+    for name in ('hits', 'misses', 'page_hits', 'page_misses',
+                 'not_modified', 'invalidations', 'evictions'):
+        stats.setdefault(name, 0)
+    stats['backend'] = settings.CACHES[settings.JOBS_CACHE_ALIAS]['BACKEND']
+    stats['version'] = catalog_version()
+    return stats
+
+
+class CountingLocMemCache(LocMemCache):
+    """LocMemCache that reports entries dropped by culling as evictions."""
+
+    def _cull(self):
+        before = len(self._cache)
+        super()._cull()
+        count('evictions', before - len(self._cache))
+
+
+def catalog_cache():
+    return caches[settings.JOBS_CACHE_ALIAS]
+
+
+def catalog_version():
+    cache = catalog_cache()
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, 1, timeout=None)
+        version = cache.get(VERSION_KEY, 1)
+    return version
+
+
+async def acatalog_version():
+    cache = catalog_cache()
+    version = await cache.aget(VERSION_KEY)
+    if version is None:
+        await cache.aadd(VERSION_KEY, 1, timeout=None)
+        version = await cache.aget(VERSION_KEY, 1)
+    return version
+
+
+def _bump():
+    cache = catalog_cache()
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.add(VERSION_KEY, 2, timeout=None)
+    cache.set(CHANGED_KEY, True, timeout=settings.JOBS_REPLICA_LAG)
+    count('invalidations')
+
+
+def bump_catalog_version():
+    """
+    Invalidate every cached catalog entry. Bumped right away for readers in
+    the writing transaction and again on commit, so nothing read before the
+    commit can stay cached under the new version.
+    """
+    _bump()
+    transaction.on_commit(_bump)
+
+
+def recently_changed():
+    """Whether the catalog changed less than JOBS_REPLICA_LAG seconds ago."""
+    return bool(catalog_cache().get(CHANGED_KEY))
+
+
+def invalidate_catalog(sender, **kwargs):
+    bump_catalog_version()
+
+
+def make_key(version, *parts):
+    digest = hashlib.md5(repr(parts).encode()).hexdigest()
+    return 'jobs:%s:%s' % (version, digest)
+
+
+def read_through(key, build):
+    cache = catalog_cache()
+    value = cache.get(key)
+    if value is not None:
+        count('hits')
+        return value
+    count('misses')
+    value = build()
+    cache.set(key, value, timeout=settings.JOBS_CACHE_TIMEOUT)
+    return value
+
+
+async def aread_through(key, build):
+    cache = catalog_cache()
+    value = await cache.aget(key)
+    if value is not None:
+        count('hits')
+        return value
+    count('misses')
+    value = await build()
+    await cache.aset(key, value, timeout=settings.JOBS_CACHE_TIMEOUT)
+    return value
+
+
+def cached_page(version, params, build):
+    return read_through(make_key(version, 'page', params), build)
+
+
+async def acached_page(version, params, build):
+    return await aread_through(make_key(version, 'page', params), build)
+
+
+def cached_job(version, pk, build):
+    return read_through(make_key(version, 'job', pk), build)
+
+
+async def acached_job(version, pk, build):
+    return await aread_through(make_key(version, 'job', pk), build)
+
+
+def page_cacheable(request, user):
+    return (settings.JOBS_PAGE_CACHE and request.method in ('GET', 'HEAD')
+            and not user.is_authenticated)
+
+
+def page_key(version, request):
+    # The raw values: pages echo the search term back into the form.
+    params = sorted(request.GET.items())
+    return make_key(version, 'full-page', request.path, params)
+
+
+def printing_page_key(version, pk):
+    return make_key(version, 'printing-page', pk)
+
+
+def forget_printing_page(pk):
+    catalog_cache().delete(printing_page_key(catalog_version(), pk))
+
+
+def printing_changed(sender, instance, **kwargs):
+    # Printing or one of its PrintingJob lines.
+    forget_printing_page(getattr(instance, 'printing_id', instance.pk))
+
+
+def storable(response):
+    # Views mark pages that must not be reused with Cache-Control: no-store.
+    return (response.status_code == 200 and not response.streaming
+            and 'no-store' not in response.get('Cache-Control', ''))
+
+
+def page_entry(response):
+    body = response.content.decode(response.charset)
+    return {
+        'body': body,
+        'content_type': response['Content-Type'],
+        'etag': quote_etag(hashlib.md5(body.encode()).hexdigest()),
+        'last_modified': int(time.time()),
+    }
+
+
+def page_response(request, entry):
+    response = HttpResponse(content_type=entry['content_type'])
+    response['ETag'] = entry['etag']
+    response['Last-Modified'] = http_date(entry['last_modified'])
+    # Each visitor gets their own CSRF token: browsers may keep the page but
+    # must revalidate it, shared caches must not keep it at all.
+    patch_cache_control(response, private=True, no_cache=True)
+    conditional = get_conditional_response(
+        request, etag=entry['etag'], last_modified=entry['last_modified'],
+        response=response)
+    if conditional is not response:
+        count('not_modified')
+        return conditional
+    response.content = entry['body'].replace(CSRF_PLACEHOLDER,
+                                             get_token(request))
+    return response
+
+
+def cached_page_response(request, version, render, key=None):
+    """
+    Serve a page from the cache, keyed on the catalog version, the path and
+    the query unless ``key`` is given. ``render`` renders the page with
+    CSRF_PLACEHOLDER for the token, which is patched per request; answers
+    304 to conditional requests that still match.
+    """
+    key = key or page_key(version, request)
+    cache = catalog_cache()
+    entry = cache.get(key)
+    if entry is None:
+        count('page_misses')
+        response = render()
+        if not storable(response):
+            return response
+        entry = page_entry(response)
+        cache.set(key, entry, timeout=settings.JOBS_CACHE_TIMEOUT)
+    else:
+        count('page_hits')
+    return page_response(request, entry)
+
+
+async def acached_page_response(request, version, render, key=None):
+    key = key or page_key(version, request)
+    cache = catalog_cache()
+    entry = await cache.aget(key)
+    if entry is None:
+        count('page_misses')
+        response = await render()
+        if not storable(response):
+            return response
+        entry = page_entry(response)
+        await cache.aset(key, entry, timeout=settings.JOBS_CACHE_TIMEOUT)
+    else:
+        count('page_hits')
+    return page_response(request, entry)
+
+
+def card_keys(version, jobs):
+    return {job.pk: make_key(version, 'card', job.pk) for job in jobs}
+
+
+def render_missing_cards(jobs, keys, cards):
+    count('hits', len(cards))
+    count('misses', len(keys) - len(cards))
+    template = get_template('job_card.html')
+    return {keys[job.pk]: template.render({'job': job,
+                                           'csrf_token': CSRF_PLACEHOLDER})
+            for job in jobs if keys[job.pk] not in cards}
+
+
+def patch_cards(jobs, keys, cards, csrf_token):
+    return [mark_safe(cards[keys[job.pk]].replace(CSRF_PLACEHOLDER,
+                                                  csrf_token))
+            for job in jobs]
+
+
+def render_cards(version, jobs, csrf_token):
+    """
+    Render job_card.html for every job, reusing cached fragments. The CSRF
+    token is the only per-user part of a card and is patched in afterwards.
+    """
+    cache = catalog_cache()
+    keys = card_keys(version, jobs)
+    cards = cache.get_many(keys.values())
+    missing = render_missing_cards(jobs, keys, cards)
+    if missing:
+        cache.set_many(missing, timeout=settings.JOBS_CACHE_TIMEOUT)
+        cards.update(missing)
+    return patch_cards(jobs, keys, cards, csrf_token)
+
+
+async def arender_cards(version, jobs, csrf_token):
+    cache = catalog_cache()
+    keys = card_keys(version, jobs)
+    cards = await cache.aget_many(keys.values())
+    missing = render_missing_cards(jobs, keys, cards)
+    if missing:
+        await cache.aset_many(missing, timeout=settings.JOBS_CACHE_TIMEOUT)
+        cards.update(missing)
+    return patch_cards(jobs, keys, cards, csrf_token)
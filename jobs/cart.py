@@ -0,0 +1,178 @@
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connection, transaction
+from django.utils import timezone
+
+from jobs.events import printing_changed, printing_queued
+from jobs.models import Job, Printing, PrintingJob
+from jobs.notifications import notify_status
+from jobs.totals import adjust_totals, freeze_prices, recompute_totals
+
+# One statement for "get or create the draft". The partial unique index on
+# (author_id) WHERE status = 'draft' makes it race free, and the no-op
+# DO UPDATE returns the existing row and keeps it locked until commit.
+UPSERT_DRAFT = '''
+    INSERT INTO jobs_printing (author_id, status, created_at, updated_at,
+                               total_price, item_count)
+    VALUES (%s, 'draft', %s, %s, 0, 0)
+    ON CONFLICT (author_id) WHERE status = 'draft'
+    DO UPDATE SET status = excluded.status
+    RETURNING id
+'''
+INSERT_JOB = '''
+    INSERT INTO jobs_printingjob (printing_id, job_id, quantity)
+    SELECT %s, id, 1 FROM jobs_job WHERE id = %s AND status <> 'deleted'
+    ON CONFLICT (job_id, printing_id) DO NOTHING
+    RETURNING id
+'''
+DELETE_JOB = '''
+    DELETE FROM jobs_printingjob WHERE printing_id = %s AND job_id = %s
+    RETURNING COALESCE(quantity, 0)
+'''
+FORM_DRAFT = '''
+    UPDATE jobs_printing SET status = 'formed', formed_at = %s,
+                             updated_at = %s
+    WHERE author_id = %s AND status = 'draft' AND item_count > 0
+    RETURNING id, name
+'''
+
+
+class Cart:
+    """Draft printing of a user: its id and the ids of the jobs in it."""
+
+    def __init__(self, draft_id=None, job_ids=()):
+        self.id = draft_id
+        self.job_ids = frozenset(job_ids)
+
+    @property
+    def count(self):
+        return len(self.job_ids)
+
+
+def cart_key(user_id):
+    return 'jobs:cart:%s' % user_id
+
+
+def cart_rows(user_id):
+    # LEFT JOIN draft -> printing jobs: one row per job, or a single row with
+    # a NULL job id for an empty draft.
+    return (Printing.objects.filter(author_id=user_id, status='draft')
+            .order_by('id')
+            .values_list('id', 'printingjob__job_id'))
+
+
+def cart_from_rows(rows):
+    if not rows:
+        return Cart()
+    draft_id = rows[0][0]
+    return Cart(draft_id, (job_id for printing_id, job_id in rows
+                           if printing_id == draft_id and job_id is not None))
+
+
+def load_cart(user_id):
+    return cart_from_rows(list(cart_rows(user_id)))
+
+
+async def aload_cart(user_id):
+    return cart_from_rows([row async for row in cart_rows(user_id)])
+
+
+def get_cart(user):
+    if not user.is_authenticated:
+        return Cart()
+    cache = caches[settings.JOBS_CACHE_ALIAS]
+    cart = cache.get(cart_key(user.pk))
+    if cart is None:
+        cart = load_cart(user.pk)
+        cache.set(cart_key(user.pk), cart, timeout=settings.JOBS_CART_TIMEOUT)
+    return cart
+
+
+async def aget_cart(user):
+    if not user.is_authenticated:
+        return Cart()
+    cache = caches[settings.JOBS_CACHE_ALIAS]
+    cart = await cache.aget(cart_key(user.pk))
+    if cart is None:
+        cart = await aload_cart(user.pk)
+        await cache.aset(cart_key(user.pk), cart,
+                         timeout=settings.JOBS_CART_TIMEOUT)
+    return cart
+
+
+def forget_cart(user_id):
+    caches[settings.JOBS_CACHE_ALIAS].delete(cart_key(user_id))
+
+
+async def aforget_cart(user_id):
+    await caches[settings.JOBS_CACHE_ALIAS].adelete(cart_key(user_id))
+
+
+def forget_author_cart(sender, instance, **kwargs):
+    forget_cart(instance.author_id)
+
+
+def upsert_draft(cursor, user_id):
+    now = timezone.now()
+    cursor.execute(UPSERT_DRAFT, [user_id, now, now])
+    return cursor.fetchone()[0]
+
+
+def toggle_job(user_id, job_id):
+    """
+    Add the job to the user's draft, or remove it if it is already there.
+    Return the draft id and whether the job was added.
+    """
+    with transaction.atomic(), connection.cursor() as cursor:
+        draft_id = upsert_draft(cursor, user_id)
+        cursor.execute(INSERT_JOB, [draft_id, job_id])
+        if cursor.fetchone():
+            printing_changed([adjust_totals(cursor, draft_id, job_id, 1)])
+            return draft_id, True
+        cursor.execute(DELETE_JOB, [draft_id, job_id])
+        row = cursor.fetchone()
+        if row is None:
+            raise Job.DoesNotExist(job_id)
+        printing_changed([adjust_totals(cursor, draft_id, job_id, -row[0])])
+        return draft_id, False
+
+
+def set_quantities(user_id, quantities):
+    """
+    Put every job of ``quantities`` (job id -> quantity) into the user's
+    draft with that quantity, in one transaction.
+    """
+    with transaction.atomic(), connection.cursor() as cursor:
+        draft_id = upsert_draft(cursor, user_id)
+        live = set(Job.objects.filter(id__in=quantities)
+                   .values_list('id', flat=True))
+        if live != set(quantities):
+            raise Job.DoesNotExist(sorted(set(quantities) - live))
+        PrintingJob.objects.bulk_create(
+            [PrintingJob(printing_id=draft_id, job_id=job_id,
+                         quantity=quantity)
+             for job_id, quantity in quantities.items()],
+            update_conflicts=True,
+            unique_fields=['job', 'printing'],
+            update_fields=['quantity'],
+        )
+        printing_changed(recompute_totals([draft_id], returning=True))
+    return draft_id
+
+
+def form_draft(user_id):
+    """
+    Turn the user's non-empty draft into a formed printing with its prices
+    frozen and queue the email to the user. Return its id, or None when
+    there is nothing to form.
+    """
+    with transaction.atomic(), connection.cursor() as cursor:
+        now = timezone.now()
+        cursor.execute(FORM_DRAFT, [now, now, user_id])
+        row = cursor.fetchone()
+        if row is None:
+            return None
+        printing_id, name = row
+        printing_queued(freeze_prices(printing_id), name, now)
+        notify_status([printing_id], 'formed')
+    return printing_id
@@ -0,0 +1,260 @@
+"""
+Streaming CSV/JSONL import and export of the catalog.
+
+Rows are matched on Job.code. A file with name and price columns upserts:
+new codes are inserted and known ones get the columns of the file. On
+PostgreSQL every batch is COPYed into a temporary table and merged with one
+INSERT ... ON CONFLICT; elsewhere it is a bulk_create with update_conflicts.
+A file without them, e.g. code and price only, updates known codes with
+UPDATE ... FROM a VALUES list and skips the rest. Input and output are
+streamed in batches, so memory does not grow with the file.
+"""
+import csv
+import io
+import json
+from itertools import islice
+
+from django.db import connection, transaction
+
+from jobs.cache import bump_catalog_version
+from jobs.images import build_variants
+from jobs.models import Job, Printing
+from jobs.tasks import enqueue_many
+from jobs.totals import recompute_totals
+
+FIELDS = ('code', 'name', 'info', 'price', 'image', 'status')
+DEFAULTS = {'info': '', 'image': None, 'status': 'visible'}
+STATUSES = {status for status, label in Job.statuses}
+MAX_LENGTHS = {field: Job._meta.get_field(field).max_length
+               for field in ('code', 'name', 'image')}
+# PositiveIntegerField, an integer column (see COPY_TABLE).
+MAX_PRICE = 2147483647
+BATCH_SIZE = 5000
+UPDATE_BATCH_SIZE = 1000
+
+COPY_TABLE = '''
+    CREATE TEMPORARY TABLE jobs_import (
+        code varchar(50), name varchar(100), info text, price integer,
+        image varchar(200), status varchar(10)
+    ) ON COMMIT DROP
+'''
+COPY_MERGE = '''
+    INSERT INTO jobs_job (%(columns)s)
+    SELECT %(columns)s FROM jobs_import
+    ON CONFLICT (code) DO UPDATE SET %(updates)s
+'''
+# Partial rows, e.g. a price list: update known codes, skip the rest.
+UPDATE_FROM = '''
+    WITH imported (%(columns)s) AS (VALUES %(values)s)
+    UPDATE jobs_job SET %(updates)s
+    FROM imported WHERE jobs_job.code = imported.code
+    RETURNING jobs_job.id
+'''
+
+
+class InvalidRow(ValueError):
+    def __init__(self, line, message):
+        super().__init__('line %s: %s' % (line, message))
+
+
+def detect_format(path):
+    return 'jsonl' if str(path).endswith(('.jsonl', '.ndjson')) else 'csv'
+
+
+def read_rows(stream, fmt):
+    """Yield (line number, row dict) from a CSV or JSONL text stream."""
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+        return
+    for line, text in enumerate(stream, 1):
+        if text.strip():
+            try:
+                yield line, json.loads(text)
+            except ValueError as exc:
+                raise InvalidRow(line, exc) from exc
+
+
+def check_columns(line, row):
+    columns = set(row)
+    if 'code' not in columns or len(columns) < 2 or \
+            not columns <= set(FIELDS):
+        raise InvalidRow(line, 'columns must be code and some of %s'
+                         % ', '.join(FIELDS[1:]))
+    return columns
+
+
+def clean_row(line, row, columns):
+    if not isinstance(row, dict) or set(row) != columns:
+        raise InvalidRow(line, 'expected columns %s' % sorted(columns))
+    code = str(row['code'] or '').strip()
+    if not code:
+        raise InvalidRow(line, 'empty code')
+    if len(code) > MAX_LENGTHS['code']:
+        raise InvalidRow(line, 'code longer than %d characters'
+                         % MAX_LENGTHS['code'])
+    cleaned = {'code': code}
+    for field in columns - {'code'}:
+        value = row[field]
+        if field == 'price':
+            try:
+                value = int(value)
+            except (TypeError, ValueError):
+                raise InvalidRow(line, 'bad price %r' % value) from None
+            if not 0 <= value <= MAX_PRICE:
+                raise InvalidRow(line, 'bad price %r' % value)
+        elif field == 'status' and value not in STATUSES:
+            raise InvalidRow(line, 'bad status %r' % value)
+        elif field == 'image':
+            value = value or None
+        if field in ('name', 'info') or (field == 'image' and value):
+            if not isinstance(value, str):
+                raise InvalidRow(line, 'bad %s %r' % (field, value))
+            if len(value) > MAX_LENGTHS.get(field, len(value)):
+                raise InvalidRow(line, '%s longer than %d characters'
+                                 % (field, MAX_LENGTHS[field]))
+        cleaned[field] = value
+    return cleaned
+
+
+def cleaned_batches(stream, fmt, batch_size):
+    """Yield the columns and cleaned rows of every ``batch_size`` rows."""
+    rows = read_rows(stream, fmt)
+    columns = None
+    while True:
+        # The same code twice in one statement is an error on PostgreSQL;
+        # the later row wins, as it does across batches.
+        batch = {}
+        for line, row in islice(rows, batch_size):
+            if columns is None:
+                columns = check_columns(line, row)
+            cleaned = clean_row(line, row, columns)
+            batch[cleaned['code']] = cleaned
+        if not batch:
+            return
+        yield columns, list(batch.values())
+
+
+def upsert_orm(batch, columns):
+    Job.objects.bulk_create(
+        [Job(**{**DEFAULTS, **row}) for row in batch],
+        update_conflicts=True,
+        unique_fields=['code'],
+        update_fields=sorted(columns - {'code'}),
+    )
+
+
+def copy_rows(cursor, sql, buffer):
+    raw = cursor.cursor
+    if hasattr(raw, 'copy_expert'):
+        raw.copy_expert(sql, buffer)
+    else:
+        with raw.copy(sql) as copy:
+            copy.write(buffer.getvalue())
+
+
+def upsert_copy(batch, columns):
+    insert = [field for field in FIELDS if field in columns or
+              field in DEFAULTS]
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in batch:
+        row = {**DEFAULTS, **row}
+        writer.writerow(['\\N' if row[field] is None else row[field]
+                         for field in insert])
+    buffer.seek(0)
+    with connection.cursor() as cursor:
+        cursor.execute(COPY_TABLE)
+        copy_rows(cursor, "COPY jobs_import (%s) FROM STDIN WITH (FORMAT "
+                  "csv, NULL '\\N')" % ', '.join(insert), buffer)
+        cursor.execute(COPY_MERGE % {
+            'columns': ', '.join(insert),
+            'updates': ', '.join('%s = excluded.%s' % (field, field)
+                                 for field in FIELDS
+                                 if field in columns and field != 'code'),
+        })
+
+
+def update_known(batch, columns):
+    """UPDATE ... FROM the rows of the batch; return how many codes matched."""
+    fields = [field for field in FIELDS if field in columns]
+    row_sql = '(%s)' % ', '.join('CAST(%s AS integer)' if field == 'price'
+                                 else '%s' for field in fields)
+    updated = 0
+    with connection.cursor() as cursor:
+        for start in range(0, len(batch), UPDATE_BATCH_SIZE):
+            chunk = batch[start:start + UPDATE_BATCH_SIZE]
+            cursor.execute(UPDATE_FROM % {
+                'columns': ', '.join(fields),
+                'values': ', '.join([row_sql] * len(chunk)),
+                'updates': ', '.join('%s = imported.%s' % (field, field)
+                                     for field in fields if field != 'code'),
+            }, [row[field] for row in chunk for field in fields])
+            # rowcount is -1 for WITH ... UPDATE on sqlite3.
+            updated += len(cursor.fetchall())
+    return updated
+
+
+def schedule_builds(codes):
+    ids = list(Job.all_objects.filter(code__in=codes).exclude(image=None)
+               .values_list('id', flat=True))
+    enqueue_many(build_variants, [((pk,), None) for pk in ids])
+
+
+def import_jobs(stream, fmt='csv', batch_size=BATCH_SIZE, method='auto'):
+    """
+    Import jobs from a text stream, one transaction per batch. Return the
+    number of rows imported and the number skipped (unknown codes in update
+    mode).
+    """
+    if method == 'auto':
+        method = 'copy' if connection.vendor == 'postgresql' else 'orm'
+    imported = skipped = 0
+    for columns, batch in cleaned_batches(stream, fmt, batch_size):
+        with transaction.atomic():
+            if {'name', 'price'} <= columns:
+                if method == 'copy':
+                    upsert_copy(batch, columns)
+                else:
+                    upsert_orm(batch, columns)
+                done = len(batch)
+            else:
+                done = update_known(batch, columns)
+            codes = [row['code'] for row in batch]
+            if 'price' in columns:
+                # Drafts are priced live; formed printings keep their snapshot.
+                recompute_totals(Printing.objects.filter(
+                    status='draft', printingjob__job__code__in=codes))
+            if 'image' in columns:
+                schedule_builds(codes)
+        imported += done
+        skipped += len(batch) - done
+    if imported:
+        # bulk writes send no post_save: invalidate the catalog once.
+        bump_catalog_version()
+    return imported, skipped
+
+
+def export_rows(queryset, chunk_size=BATCH_SIZE):
+    return queryset.order_by('id').values_list(*FIELDS).iterator(
+        chunk_size=chunk_size)
+
+
+def export_chunks(queryset, fmt='csv', chunk_size=BATCH_SIZE):
+    """Yield the jobs of ``queryset`` as CSV or JSONL text, chunk by chunk."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if fmt == 'csv':
+        writer.writerow(FIELDS)
+    for position, values in enumerate(export_rows(queryset, chunk_size), 1):
+        if fmt == 'csv':
+            writer.writerow(values)
+        else:
+            buffer.write(json.dumps(dict(zip(FIELDS, values)),
+                                    ensure_ascii=False) + '\n')
+        if position % chunk_size == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
@@ -0,0 +1,342 @@
+"""
+Push of printing changes to the browsers that watch them, as server-sent
+events (see async_views.events).
+
+Writers call printing_changed() or printing_queued() inside their
+transaction with the rows their UPDATE returned (see EVENT_COLUMNS); nothing
+is read back. Once it commits, a 'printing' event with the status and
+totals goes to the channel of the author and, for printings entering or
+leaving the moderation queue, a 'queue' event to the moderators.
+
+Streams are served by EventsApplication in front of Django (see
+fablab/asgi.py): an idle one is an asyncio.Queue and two suspended tasks,
+no thread and no database connection. Events fan out to them through the
+in-process Broker. On PostgreSQL they are sent with pg_notify instead, all
+events of a transaction in one statement, and every process with
+subscribers LISTENs on a connection of its own, so an event published by a
+WSGI worker reaches streams served by any ASGI process. Publishing errors
+are logged, the write is committed by then.
+"""
+import asyncio
+import json
+import logging
+import select
+import threading
+from importlib import import_module
+
+from django.conf import settings
+from django.contrib.auth import aget_user
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, connections, transaction
+from django.http import HttpRequest
+from django.http.cookie import parse_cookie
+from django.urls import NoReverseMatch, reverse
+
+from jobs.models import Printing
+
+logger = logging.getLogger(__name__)
+
+NOTIFY_CHANNEL = 'jobs_events'
+QUEUE = 'queue'
+# What writers return for printing_changed(), in this order.
+EVENT_COLUMNS = 'id, author_id, status, total_price, item_count'
+NOTIFY_ALL = 'SELECT pg_notify(%s, message) FROM unnest(%s::text[]) message'
+STATUS_DISPLAY = dict(Printing.statuses)
+HEADERS = [
+    (b'content-type', b'text/event-stream'),
+    (b'cache-control', b'no-cache'),
+    # Tells nginx not to buffer the stream.
+    (b'x-accel-buffering', b'no'),
+]
+
+
+def author_channel(user_id):
+    return 'author:%s' % user_id
+
+
+class Subscription:
+    """Events of some channels for one stream; None once it fell behind."""
+
+    def __init__(self, broker, channels, loop):
+        self.broker = broker
+        self.channels = channels
+        self.loop = loop
+        self.queue = asyncio.Queue(settings.JOBS_EVENTS_QUEUE_SIZE)
+        self.lost = False
+
+    def put(self, event):
+        # In the event loop of the subscriber.
+        if self.lost:
+            return
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # The client does not keep up. End the stream; the browser
+            # reconnects and reloads the state.
+            self.lost = True
+            self.queue.get_nowait()
+            self.queue.put_nowait(None)
+
+    async def get(self):
+        return await self.queue.get()
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+def put_all(subscriptions, event):
+    for subscription in subscriptions:
+        subscription.put(event)
+
+
+class Broker:
+    def __init__(self):
+        self.channels = {}
+        self.lock = threading.Lock()
+
+    def subscribe(self, channels):
+        subscription = Subscription(self, channels,
+                                    asyncio.get_running_loop())
+        with self.lock:
+            for channel in channels:
+                self.channels.setdefault(channel, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            for channel in subscription.channels:
+                subscribers = self.channels.get(channel)
+                if subscribers is not None:
+                    subscribers.discard(subscription)
+                    if not subscribers:
+                        del self.channels[channel]
+
+    def deliver(self, message):
+        """Hand a published message to the local subscribers of its
+        channel; from any thread."""
+        channel, event = message.split(' ', 1)
+        loops = {}
+        with self.lock:
+            for subscription in self.channels.get(channel, ()):
+                loops.setdefault(subscription.loop, []).append(subscription)
+        # One wakeup per event loop, not per subscriber.
+        for loop, subscriptions in loops.items():
+            try:
+                loop.call_soon_threadsafe(put_all, subscriptions, event)
+            except RuntimeError:
+                # The loop is closed.
+                for subscription in subscriptions:
+                    self.unsubscribe(subscription)
+
+    def active(self):
+        return bool(self.channels)
+
+
+broker = Broker()
+_listener = None
+_listener_lock = threading.Lock()
+
+
+def uses_notify():
+    return connection.vendor == 'postgresql'
+
+
+def format_event(name, data):
+    """A server-sent event: its name and JSON data."""
+    return 'event: %s\ndata: %s\n\n' % (
+        name, json.dumps(data, cls=DjangoJSONEncoder, separators=(',', ':')))
+
+
+def publish(messages):
+    """Send ``messages`` ('channel event' strings) in one round trip."""
+    if uses_notify():
+        with connection.cursor() as cursor:
+            cursor.execute(NOTIFY_ALL, [NOTIFY_CHANNEL, messages])
+    else:
+        for message in messages:
+            broker.deliver(message)
+
+
+def printing_event(row):
+    pk, author_id, status, total_price, item_count = row
+    return author_channel(author_id), 'printing', {
+        'id': pk,
+        'status': status,
+        'status_display': STATUS_DISPLAY.get(status, status),
+        'total_price': total_price,
+        'item_count': item_count,
+    }
+
+
+def publish_on_commit(events):
+    if not events or not uses_notify() and not broker.active():
+        return
+    messages = ['%s %s' % (channel, format_event(name, data))
+                for channel, name, data in events]
+    # Logs a failure instead of raising it from a committed request.
+    transaction.on_commit(lambda: publish(messages), robust=True)
+
+
+def printing_changed(rows, left_queue=False):
+    """
+    Publish the state of printings, ``rows`` of EVENT_COLUMNS, to their
+    authors once the current transaction commits; ``left_queue`` tells the
+    moderators they left the moderation queue.
+    """
+    events = []
+    for row in rows:
+        events.append(printing_event(row))
+        if left_queue:
+            events.append((QUEUE, 'queue', {'action': 'removed',
+                                            'id': row[0]}))
+    publish_on_commit(events)
+
+
+def printing_queued(row, name, formed_at):
+    """printing_changed() for a printing that entered the queue."""
+    pk, author_id, _, total_price, item_count = row
+    publish_on_commit([printing_event(row), (QUEUE, 'queue', {
+        # The fields of moderation.queue_json, with the author's id.
+        'action': 'added',
+        'id': pk,
+        'name': name,
+        'author_id': author_id,
+        'formed_at': formed_at,
+        'total_price': total_price,
+        'item_count': item_count,
+    })])
+
+
+def listen():
+    """Deliver the pg_notify messages of every process to this one."""
+    while True:
+        wrapper = connections.create_connection('default')
+        try:
+            wrapper.ensure_connection()
+            wrapper.set_autocommit(True)
+            with wrapper.cursor() as cursor:
+                cursor.execute('LISTEN %s' % NOTIFY_CHANNEL)
+            raw = wrapper.connection
+            if callable(raw.notifies):
+                # psycopg 3
+                for notify in raw.notifies():
+                    broker.deliver(notify.payload)
+            else:
+                # psycopg2
+                while True:
+                    select.select([raw], [], [], 60)
+                    raw.poll()
+                    while raw.notifies:
+                        broker.deliver(raw.notifies.pop(0).payload)
+        except Exception:
+            logger.exception('Listening to %s failed', NOTIFY_CHANNEL)
+        finally:
+            wrapper.close()
+        threading.Event().wait(1)
+
+
+def user_channels(user):
+    """The channels ``user`` follows; None for anonymous users."""
+    if not user.is_authenticated:
+        return None
+    channels = [author_channel(user.pk)]
+    if user.is_staff:
+        channels.append(QUEUE)
+    return channels
+
+
+def subscribe(channels):
+    """Subscribe the running event loop to ``channels``."""
+    global _listener
+    if uses_notify():
+        with _listener_lock:
+            if _listener is None:
+                _listener = threading.Thread(target=listen, daemon=True,
+                                             name='jobs-events')
+                _listener.start()
+    return broker.subscribe(channels)
+
+
+async def event_stream(channels):
+    """Server-sent events of ``channels``, until the client falls behind."""
+    subscription = subscribe(channels)
+    try:
+        yield 'retry: %d\n\n' % (settings.JOBS_EVENTS_RETRY * 1000)
+        while True:
+            try:
+                event = await asyncio.wait_for(
+                    subscription.get(), settings.JOBS_EVENTS_KEEPALIVE)
+            except TimeoutError:
+                # Keeps proxies from closing an idle stream.
+                yield ': keepalive\n\n'
+                continue
+            if event is None:
+                return
+            yield event
+    finally:
+        subscription.close()
+
+
+async def scope_user(scope):
+    """The user of the session cookie of an ASGI scope."""
+    cookies = parse_cookie(b'; '.join(
+        value for name, value in scope['headers'] if name == b'cookie'
+    ).decode('latin-1'))
+    request = HttpRequest()
+    request.session = import_module(settings.SESSION_ENGINE).SessionStore(
+        cookies.get(settings.SESSION_COOKIE_NAME))
+    return await aget_user(request)
+
+
+async def wait_for_disconnect(receive):
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+
+
+class EventsApplication:
+    """
+    ASGI application that streams the events URL itself and hands every
+    other request to Django. Django's handler keeps a thread per request
+    until its response is sent, which for a stream is hours. Neither the
+    middleware nor async_views.events, the view that runserver and the test
+    client use, run for these requests.
+    """
+
+    def __init__(self, application):
+        self.application = application
+        try:
+            self.path = reverse('events')
+        except NoReverseMatch:
+            # The sync URLconf, without events.
+            self.path = None
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or scope['path'] != self.path:
+            return await self.application(scope, receive, send)
+        channels = user_channels(await scope_user(scope))
+        if channels is None:
+            await send({'type': 'http.response.start', 'status': 403,
+                        'headers': [(b'content-type', b'text/plain')]})
+            await send({'type': 'http.response.body', 'body': b'Forbidden'})
+            return
+        stream = event_stream(channels)
+        await send({'type': 'http.response.start', 'status': 200,
+                    'headers': HEADERS})
+
+        async def pump():
+            async for event in stream:
+                await send({'type': 'http.response.body',
+                            'body': event.encode(), 'more_body': True})
+            await send({'type': 'http.response.body'})
+
+        pumping = asyncio.ensure_future(pump())
+        disconnected = asyncio.ensure_future(wait_for_disconnect(receive))
+        try:
+            await asyncio.wait([pumping, disconnected],
+                               return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            pumping.cancel()
+            disconnected.cancel()
+            await asyncio.gather(pumping, disconnected,
+                                 return_exceptions=True)
+            await stream.aclose()
@@ -0,0 +1,44 @@
+import json
+import re
+
+from django.db import connections
+
+INDEX_SCANS = [
+    # SQLite: "SEARCH t USING INDEX i (...)", "SCAN t USING COVERING INDEX i"
+    re.compile(r'USING (?:COVERING )?INDEX (\w+)'),
+    # PostgreSQL: "Index Scan using i on t", "Bitmap Index Scan on i"
+    re.compile(r'Index (?:Only )?Scan (?:Backward )?using (\w+)'),
+    re.compile(r'Bitmap Index Scan on (\w+)'),
+]
+FULL_SCANS = [
+    re.compile(r'\bSCAN (\w+)$', re.MULTILINE),
+    re.compile(r'Seq Scan on (\w+)'),
+]
+
+
+def query_plan(queryset):
+    return queryset.explain()
+
+
+def used_indexes(queryset):
+    plan = query_plan(queryset)
+    return {name for pattern in INDEX_SCANS for name in pattern.findall(plan)}
+
+
+def full_scans(queryset):
+    plan = query_plan(queryset)
+    return {table for pattern in FULL_SCANS for table in pattern.findall(plan)}
+
+
+def estimated_count(queryset):
+    """Planner estimate of the rows of ``queryset``; None if not on PG."""
+    if connections[queryset.db].vendor != 'postgresql':
+        return None
+    plan = json.loads(queryset.order_by().explain(format='json'))
+    return plan[0]['Plan']['Plan Rows']
+
+
+def analyze(using='default'):
+    """Refresh planner statistics after seeding a test dataset."""
+    with connections[using].cursor() as cursor:
+        cursor.execute('ANALYZE')
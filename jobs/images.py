@@ -0,0 +1,158 @@
+"""
+Resized WebP/AVIF derivatives of Job images for responsive srcsets.
+
+Derivatives are stored under ``derivatives/<hash>/<width>.<ext>`` in the
+default storage, keyed on the hash of the source bytes: re-saving a job or
+sharing one image between jobs never renders the same set twice. Rendering
+is a background task (see jobs/tasks.py) queued after the job is committed
+and the result is recorded in Job.image_variants.
+"""
+import hashlib
+import logging
+import os
+from io import BytesIO
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import close_old_connections
+from PIL import Image, ImageOps
+
+from jobs.cache import bump_catalog_version
+from jobs.storage import content_hash
+from jobs.models import Job
+from jobs.tasks import task
+
+logger = logging.getLogger(__name__)
+
+WIDTHS = (320, 480, 640, 960, 1280)
+# Preferred format first; <source> order is the browser's preference order.
+FORMATS = {
+    'avif': ('image/avif', {'quality': 50}),
+    'webp': ('image/webp', {'quality': 80, 'method': 4}),
+}
+
+
+def supported_formats():
+    Image.init()
+    return [name for name in FORMATS if name.upper() in Image.SAVE]
+
+
+def source_name(url):
+    """Storage name of a media URL, or None for images hosted elsewhere."""
+    path = urlsplit(url or '').path
+    if not path.startswith(settings.MEDIA_URL):
+        return None
+    return path[len(settings.MEDIA_URL):]
+
+
+def media_url(url):
+    """Public URL of a stored image: CDN or presigned for object storage."""
+    name = source_name(url)
+    return default_storage.url(name) if name else url
+
+
+def upload_image(file):
+    """
+    Store an uploaded image under a name derived from its content and return
+    the URL to put into Job.image. Uploading the same file twice stores it
+    once.
+    """
+    extension = os.path.splitext(file.name)[1].lower()
+    name = default_storage.save(
+        'jobs/%s%s' % (content_hash(file)[:32], extension), file)
+    return settings.MEDIA_URL + name
+
+
+def derivative_name(key, width, fmt):
+    return 'derivatives/%s/%d.%s' % (key, width, fmt)
+
+
+def target_widths(width):
+    return [w for w in WIDTHS if w < width] + [min(width, WIDTHS[-1])]
+
+
+def encode(image, width, fmt):
+    height = max(1, round(image.height * width / image.width))
+    resized = image.resize((width, height), Image.LANCZOS)
+    buffer = BytesIO()
+    resized.save(buffer, fmt.upper(), **FORMATS[fmt][1])
+    return buffer.getvalue()
+
+
+def render_derivatives(data):
+    """
+    Store every derivative of the image ``data`` and return the variants
+    record for Job.image_variants.
+    """
+    key = hashlib.sha256(data).hexdigest()[:32]
+    image = ImageOps.exif_transpose(Image.open(BytesIO(data)))
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'transparency' in image.info
+                              or image.mode in ('LA', 'PA') else 'RGB')
+    widths = target_widths(image.width)
+    formats = supported_formats()
+    for width in widths:
+        for fmt in formats:
+            name = derivative_name(key, width, fmt)
+            if not default_storage.exists(name):
+                default_storage.save(name,
+                                     ContentFile(encode(image, width, fmt)))
+    return {'key': key, 'widths': widths, 'formats': formats,
+            'size': [image.width, image.height]}
+
+
+@task(max_attempts=3)
+def build_variants(job_id):
+    """Render the derivatives of a job's image and record them on the job."""
+    job = (Job.all_objects.filter(pk=job_id).only('image', 'image_variants')
+           .first())
+    name = source_name(job.image) if job else None
+    if name is None or not default_storage.exists(name):
+        variants = None
+    else:
+        with default_storage.open(name) as source:
+            variants = render_derivatives(source.read())
+    if job is None or variants == job.image_variants:
+        return variants
+    # Only if the image did not change meanwhile; update() skips post_save,
+    # so this does not schedule another build.
+    if Job.all_objects.filter(pk=job_id, image=job.image).update(
+            image_variants=variants):
+        bump_catalog_version()
+    return variants
+
+
+def run_build(job_id):
+    try:
+        build_variants(job_id)
+    except Exception:
+        logger.exception('Building image derivatives of job %s failed',
+                         job_id)
+    finally:
+        close_old_connections()
+
+
+def schedule_variants(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and 'image' not in update_fields:
+        return
+    # Queued in the same transaction: a rolled back save builds nothing.
+    build_variants.delay(instance.pk)
+
+
+def sources(job):
+    """(mime type, srcset) pairs of a job's derivatives, best format first."""
+    return variant_sources(job.image_variants)
+
+
+def variant_sources(variants):
+    if not variants:
+        return []
+    return [
+        (FORMATS[fmt][0], ', '.join(
+            '%s %dw' % (default_storage.url(
+                derivative_name(variants['key'], width, fmt)), width)
+            for width in variants['widths']))
+        for fmt in FORMATS if fmt in variants['formats']
+    ]
@@ -0,0 +1,256 @@
+"""
+Per-request performance counters: SQL queries, DB time, duplicate queries,
+template render time and total latency.
+
+``instrument()`` collects them for a block of code and
+InstrumentationMiddleware for every request. Queries are counted by an
+execute wrapper installed on each connection as it is created and templates
+are timed by the InstrumentedTemplates backend; both only look up a context
+variable when nothing is being instrumented, so the cost outside a request
+is one lookup per query. The middleware reports the numbers in a
+Server-Timing header, aggregates them per view for the Prometheus text
+endpoint (per process, like the cache stats) and appends a sample of slow
+requests to a JSONL file.
+"""
+import json
+import random
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.template.backends.django import DjangoTemplates, Template
+from django.utils.crypto import constant_time_compare
+
+# Upper bounds of the latency histogram, in seconds.
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+_current = ContextVar('jobs_request_metrics', default=None)
+_registry = {}
+_registry_lock = threading.Lock()
+_log_lock = threading.Lock()
+
+
+class RequestMetrics:
+    __slots__ = ('queries', 'db_ms', 'render_ms', 'total_ms', 'statements',
+                 'rendering')
+
+    def __init__(self):
+        self.queries = 0
+        self.db_ms = 0.0
+        self.render_ms = 0.0
+        self.total_ms = 0.0
+        self.statements = Counter()
+        self.rendering = False
+
+    @property
+    def duplicates(self):
+        """Queries that repeat an earlier statement, N+1 loops included."""
+        return self.queries - len(self.statements)
+
+    def duplicate_statements(self, limit=5):
+        return [(sql, count)
+                for sql, count in self.statements.most_common(limit)
+                if count > 1]
+
+
+def current_metrics():
+    return _current.get()
+
+
+@contextmanager
+def instrument():
+    metrics = RequestMetrics()
+    token = _current.set(metrics)
+    start = time.perf_counter()
+    try:
+        yield metrics
+    finally:
+        metrics.total_ms = (time.perf_counter() - start) * 1000
+        _current.reset(token)
+
+
+def record_query(execute, sql, params, many, context):
+    metrics = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.db_ms += (time.perf_counter() - start) * 1000
+        metrics.queries += 1
+        metrics.statements[sql] += 1
+
+
+def install_query_recorder(sender, connection, **kwargs):
+    # connection_created fires again when a dropped connection reconnects.
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+class TimedTemplate(Template):
+    def render(self, context=None, request=None):
+        metrics = _current.get()
+        # Templates rendered by a template ({% include %}, inclusion tags)
+        # are part of the outer render.
+        if metrics is None or metrics.rendering:
+            return super().render(context, request)
+        metrics.rendering = True
+        start = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            metrics.render_ms += (time.perf_counter() - start) * 1000
+            metrics.rendering = False
+
+
+class InstrumentedTemplates(DjangoTemplates):
+    """DjangoTemplates backend that reports render time to instrument()."""
+
+    def from_string(self, template_code):
+        return TimedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        return TimedTemplate(super().get_template(template_name).template,
+                             self)
+
+
+def has_metrics_token(request):
+    """Whether the request bears JOBS_METRICS_TOKEN, when one is set."""
+    token = settings.JOBS_METRICS_TOKEN
+    return bool(token) and constant_time_compare(
+        request.headers.get('Authorization', ''), 'Bearer ' + token)
+
+
+def server_timing(metrics):
+    return ('db;dur=%.1f;desc="%d queries, %d duplicates", tpl;dur=%.1f, '
+            'total;dur=%.1f' % (metrics.db_ms, metrics.queries,
+                                metrics.duplicates, metrics.render_ms,
+                                metrics.total_ms))
+
+
+def view_name(request):
+    match = getattr(request, 'resolver_match', None)
+    return match.view_name if match else 'unresolved'
+
+
+def record(view, metrics):
+    seconds = metrics.total_ms / 1000
+    with _registry_lock:
+        stats = _registry.get(view)
+        if stats is None:
+            stats = _registry[view] = Counter()
+        stats['requests'] += 1
+        stats['seconds'] += seconds
+        stats['db_seconds'] += metrics.db_ms / 1000
+        stats['render_seconds'] += metrics.render_ms / 1000
+        stats['queries'] += metrics.queries
+        stats['duplicate_queries'] += metrics.duplicates
+        for bound in BUCKETS:
+            if seconds <= bound:
+                stats[bound] += 1
+
+
+def reset_metrics():
+    with _registry_lock:
+        _registry.clear()
+
+
+def prometheus_text():
+    """The per-view counters in the Prometheus text exposition format."""
+    with _registry_lock:
+        snapshot = {view: Counter(stats) for view, stats in _registry.items()}
+    lines = []
+
+    def family(name, kind, help_text):
+        lines.append('# HELP jobs_%s %s' % (name, help_text))
+        lines.append('# TYPE jobs_%s %s' % (name, kind))
+
+    family('request_duration_seconds', 'histogram', 'Request latency.')
+    for view, stats in sorted(snapshot.items()):
+        for bound in BUCKETS:
+            lines.append('jobs_request_duration_seconds_bucket{view="%s",'
+                         'le="%s"} %d' % (view, bound, stats[bound]))
+        lines.append('jobs_request_duration_seconds_bucket{view="%s",'
+                     'le="+Inf"} %d' % (view, stats['requests']))
+        lines.append('jobs_request_duration_seconds_sum{view="%s"} %.6f'
+                     % (view, stats['seconds']))
+        lines.append('jobs_request_duration_seconds_count{view="%s"} %d'
+                     % (view, stats['requests']))
+    for name, key, help_text in (
+            ('db_seconds_total', 'db_seconds', 'Time spent in SQL queries.'),
+            ('render_seconds_total', 'render_seconds',
+             'Time spent rendering templates.'),
+            ('queries_total', 'queries', 'SQL queries executed.'),
+            ('duplicate_queries_total', 'duplicate_queries',
+             'SQL queries repeating a statement of the same request.')):
+        family(name, 'counter', help_text)
+        for view, stats in sorted(snapshot.items()):
+            value = stats[key]
+            lines.append('jobs_%s{view="%s"} %s' % (
+                name, view, '%.6f' % value if 'seconds' in key else value))
+    return '\n'.join(lines) + '\n'
+
+
+def log_slow_request(request, response, view, metrics):
+    path = settings.JOBS_SLOW_REQUEST_LOG
+    if not path or metrics.total_ms < settings.JOBS_SLOW_REQUEST_MS or \
+            random.random() >= settings.JOBS_SLOW_REQUEST_SAMPLE:
+        return
+    line = json.dumps({
+        'time': time.time(),
+        'method': request.method,
+        'path': request.get_full_path(),
+        'view': view,
+        'status': response.status_code,
+        'total_ms': round(metrics.total_ms, 3),
+        'db_ms': round(metrics.db_ms, 3),
+        'render_ms': round(metrics.render_ms, 3),
+        'queries': metrics.queries,
+        'duplicates': metrics.duplicates,
+        'duplicate_statements': metrics.duplicate_statements(),
+    }, ensure_ascii=False)
+    with _log_lock, open(path, 'a', encoding='utf-8') as log:
+        log.write(line + '\n')
+
+
+class InstrumentationMiddleware:
+    """
+    Put it first in MIDDLEWARE so that the session and user queries of the
+    other middleware are counted too.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.JOBS_INSTRUMENTATION:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        with instrument() as metrics:
+            response = self.get_response(request)
+        return self.finish(request, response, metrics)
+
+    async def __acall__(self, request):
+        with instrument() as metrics:
+            response = await self.get_response(request)
+        return self.finish(request, response, metrics)
+
+    def finish(self, request, response, metrics):
+        view = view_name(request)
+        if settings.JOBS_SERVER_TIMING or has_metrics_token(request):
+            response['Server-Timing'] = server_timing(metrics)
+        record(view, metrics)
+        log_slow_request(request, response, view, metrics)
+        return response
@@ -0,0 +1,30 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from jobs.archive import STATUSES, archive_batch
+
+
+class Command(BaseCommand):
+    help = ('Move printings that were deleted, completed or rejected more '
+            'than --older-than days ago, with their lines, into the archive '
+            'tables, one transaction per batch.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than', type=int, default=180,
+                            help='Days since the last status change.')
+        parser.add_argument('--status', nargs='+', choices=STATUSES,
+                            default=list(STATUSES))
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options['older_than'])
+        archived = 0
+        while True:
+            ids = archive_batch(cutoff, options['status'],
+                                options['batch_size'])
+            if not ids:
+                break
+            archived += len(ids)
+        self.stdout.write('%d printings archived' % archived)
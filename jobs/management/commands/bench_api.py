@@ -0,0 +1,106 @@
+import json
+
+from django.core.management.base import BaseCommand
+from django.core.serializers.json import DjangoJSONEncoder
+from django.template.loader import get_template
+from django.utils.text import compress_string
+
+from jobs import api
+from jobs.benchmarking import measure, seed_jobs, summary, write_results
+from jobs.cache import CSRF_PLACEHOLDER
+from jobs.models import Job
+from jobs.views import page_json
+
+FIELDS = api.JOB_DEFAULT_FIELDS
+
+
+def html(jobs):
+    template = get_template('job_card.html')
+    context = {'csrf_token': CSRF_PLACEHOLDER}
+    return ''.join(template.render({**context, 'job': job})
+                   for job in jobs).encode()
+
+
+def json_models(jobs):
+    # What jobs_page sends: model instances through JsonResponse's encoder.
+    return json.dumps(page_json(jobs, None), cls=DjangoJSONEncoder).encode()
+
+
+def json_values(rows):
+    return json.dumps({'results': [api.project(api.JOB_FIELDS, FIELDS, row)
+                                   for row in rows]},
+                      cls=DjangoJSONEncoder, ensure_ascii=False,
+                      separators=(',', ':')).encode()
+
+
+def api_values(rows):
+    # orjson when installed.
+    return api.dumps({'results': [api.project(api.JOB_FIELDS, FIELDS, row)
+                                  for row in rows]})
+
+
+def models(count):
+    return list(Job.objects.order_by('id')[:count])
+
+
+def values(count):
+    return list(Job.objects.order_by('id')
+                .values(*api.columns(api.JOB_FIELDS, FIELDS))[:count])
+
+
+# name, rows loader, serializer
+PATHS = [
+    ('html cards', models, html),
+    ('json models', models, json_models),
+    ('json values', values, json_values),
+    ('api values', values, api_values),
+]
+
+
+class Command(BaseCommand):
+    help = ('Compare the cost of turning 1000 catalog jobs into HTML cards '
+            '(the HTML pages) and into JSON: from model instances as '
+            'jobs_page does and from .values() rows with json and with '
+            'the API serializer (orjson when installed). Reports load + '
+            'serialize and serialize only, and the body sizes.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--jobs', type=int, default=1000)
+        parser.add_argument('--repeat', type=int, default=50)
+        parser.add_argument('--keep', action='store_true',
+                            help='Do not delete the seeded jobs afterwards.')
+        parser.add_argument('--json', help='Write the results to this file.')
+
+    def handle(self, *args, **options):
+        count = options['jobs']
+        first_id = (Job.all_objects.order_by('-id')
+                    .values_list('id', flat=True).first() or 0)
+        self.stdout.write('serializer: %s, brotli: %s' % (
+            'orjson' if api.orjson else 'json',
+            'yes' if api.brotli else 'no'))
+        results = {}
+        try:
+            seed_jobs(max(0, count - Job.objects.count()))
+            for name, load, serialize in PATHS:
+                rows = load(count)
+                body = serialize(rows)
+                results[name] = {
+                    'total': summary(measure(
+                        lambda: serialize(load(count)), options['repeat'])),
+                    'serialize': summary(measure(
+                        lambda: serialize(rows), options['repeat'])),
+                    'bytes': len(body),
+                    'gzip_bytes': len(compress_string(body)),
+                }
+                result = results[name]
+                self.stdout.write(
+                    '%-12s %5d jobs  total p50 %8.3f ms  serialize p50 '
+                    '%8.3f ms  %8d bytes  %7d gzip' % (
+                        name, len(rows), result['total']['p50_ms'],
+                        result['serialize']['p50_ms'], result['bytes'],
+                        result['gzip_bytes']))
+        finally:
+            if not options['keep']:
+                Job.all_objects.filter(id__gt=first_id).delete()
+        if options['json']:
+            write_results(options['json'], 'bench_api', options, results)
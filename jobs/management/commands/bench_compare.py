@@ -0,0 +1,68 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+
+def flatten(results, prefix=''):
+    """{'index': {'p50_ms': 1.0}} -> {'index.p50_ms': 1.0}"""
+    metrics = {}
+    for key, value in results.items():
+        name = '%s.%s' % (prefix, key) if prefix else key
+        if isinstance(value, dict):
+            metrics.update(flatten(value, name))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            metrics[name] = value
+    return metrics
+
+
+def regressed(name, old, new, threshold):
+    metric = name.rsplit('.', 1)[-1]
+    if metric in ('queries', 'max_queries', 'errors'):
+        return new > old
+    if metric in ('p50_ms', 'p95_ms'):
+        return new > old * (1 + threshold / 100)
+    if metric == 'rps':
+        return new < old * (1 - threshold / 100)
+    return False
+
+
+class Command(BaseCommand):
+    help = ('Compare two --json results of the same benchmark, e.g. from '
+            'two commits. Flags slower latencies and lower throughput '
+            'beyond --threshold percent and any extra query.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('baseline')
+        parser.add_argument('candidate')
+        parser.add_argument('--threshold', type=float, default=10,
+                            help='Percent of noise to tolerate.')
+        parser.add_argument('--fail', action='store_true',
+                            help='Exit with an error on regressions.')
+
+    def load(self, path):
+        with open(path, encoding='utf-8') as stream:
+            return json.load(stream)
+
+    def handle(self, *args, **options):
+        baseline = self.load(options['baseline'])
+        candidate = self.load(options['candidate'])
+        if baseline['command'] != candidate['command']:
+            raise CommandError('Results of %s and %s cannot be compared'
+                               % (baseline['command'], candidate['command']))
+        self.stdout.write('%s: %s (%s) -> %s (%s)' % (
+            baseline['command'], baseline['commit'], baseline['database'],
+            candidate['commit'], candidate['database']))
+        old, new = flatten(baseline['results']), flatten(candidate['results'])
+        regressions = []
+        for name in sorted(old.keys() & new.keys()):
+            change = ((new[name] - old[name]) / old[name] * 100
+                      if old[name] else 0)
+            flag = ''
+            if regressed(name, old[name], new[name], options['threshold']):
+                regressions.append(name)
+                flag = '  REGRESSION'
+            self.stdout.write('%-40s %12s %12s %+8.1f%%%s' % (
+                name, old[name], new[name], change, flag))
+        if regressions and options['fail']:
+            raise CommandError('%d regressions: %s' % (
+                len(regressions), ', '.join(regressions)))
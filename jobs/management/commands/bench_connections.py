@@ -0,0 +1,50 @@
+import time
+
+from django.core import signals
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from jobs.benchmarking import summary
+
+
+class Command(BaseCommand):
+    help = ('Measure the per-request cost of opening database connections: '
+            'a fresh connection per request versus the configured '
+            'persistent connection or pool. With DB_POOL=1 both runs go '
+            'through the pool; compare against a run with DB_POOL unset.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default')
+        parser.add_argument('--requests', type=int, default=200)
+
+    def simulate(self, alias, count):
+        # Same connection lifecycle as a real request: Django closes or
+        # recycles connections on request_started/request_finished.
+        connection = connections[alias]
+        samples = []
+        for _ in range(count):
+            start = time.perf_counter()
+            signals.request_started.send(sender=self.__class__)
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT 1')
+            signals.request_finished.send(sender=self.__class__)
+            samples.append((time.perf_counter() - start) * 1000)
+        return summary(samples)
+
+    def handle(self, *args, **options):
+        alias = options['database']
+        settings_dict = connections[alias].settings_dict
+        configured = settings_dict['CONN_MAX_AGE']
+        connections[alias].close()
+        settings_dict['CONN_MAX_AGE'] = 0
+        try:
+            fresh = self.simulate(alias, options['requests'])
+        finally:
+            connections[alias].close()
+            settings_dict['CONN_MAX_AGE'] = configured
+        reused = self.simulate(alias, options['requests'])
+        mode = ('pool' if settings_dict.get('OPTIONS', {}).get('pool')
+                else 'CONN_MAX_AGE=%s' % configured)
+        for name, result in (('new connection', fresh), (mode, reused)):
+            self.stdout.write('%-20s p50 %8.3f ms  p95 %8.3f ms' % (
+                name, result['p50_ms'], result['p95_ms']))
@@ -0,0 +1,93 @@
+import csv
+import os
+import random
+import resource
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from jobs.benchmarking import make_job
+from jobs.catalog_io import FIELDS, export_chunks, import_jobs
+from jobs.models import Job
+
+PREFIX = 'bench-import-'
+
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux.
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+                 1)
+
+
+class Command(BaseCommand):
+    help = ('Write a catalog file, then time importing it, repricing it '
+            'from a code,price file and exporting it again. Reports rows per '
+            'second and the peak RSS of the process after every phase. Run '
+            'it against a scratch database with DEBUG=False: DEBUG keeps '
+            'the SQL of every query in memory.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1_000_000)
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--method', choices=['auto', 'copy', 'orm'],
+                            default='auto')
+        parser.add_argument('--keep', action='store_true',
+                            help='Do not delete the imported jobs.')
+
+    def write_files(self, directory, rows):
+        rng = random.Random(0)
+        full = os.path.join(directory, 'jobs.csv')
+        prices = os.path.join(directory, 'prices.csv')
+        with open(full, 'w', encoding='utf-8', newline='') as jobs_file, \
+                open(prices, 'w', encoding='utf-8', newline='') as price_file:
+            jobs, repriced = csv.writer(jobs_file), csv.writer(price_file)
+            jobs.writerow(FIELDS)
+            repriced.writerow(['code', 'price'])
+            for i in range(rows):
+                job = make_job(rng)
+                code = '%s%d' % (PREFIX, i)
+                jobs.writerow([code, job.name, job.info, job.price, '',
+                               job.status])
+                repriced.writerow([code, job.price + 10])
+        return full, prices
+
+    def timed(self, name, rows, fn):
+        start = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - start
+        self.stdout.write('%-8s %9d rows %8.1f s %10.0f rows/s  peak RSS '
+                          '%7.1f MB' % (name, rows, elapsed, rows / elapsed,
+                                        peak_rss_mb()))
+
+    def handle(self, *args, **options):
+        rows, batch_size = options['rows'], options['batch_size']
+        method = options['method']
+
+        def load(path):
+            with open(path, encoding='utf-8', newline='') as stream:
+                import_jobs(stream, 'csv', batch_size, method)
+
+        def export(path):
+            with open(path, 'w', encoding='utf-8', newline='') as stream:
+                for chunk in export_chunks(
+                        Job.all_objects.filter(code__startswith=PREFIX),
+                        'csv', batch_size):
+                    stream.write(chunk)
+
+        with tempfile.TemporaryDirectory() as directory:
+            self.stdout.write('start    peak RSS %7.1f MB' % peak_rss_mb())
+            full, prices = self.write_files(directory, rows)
+            try:
+                self.timed('import', rows, lambda: load(full))
+                self.timed('reprice', rows, lambda: load(prices))
+                self.timed('export', rows, lambda: export(
+                    os.path.join(directory, 'export.csv')))
+            finally:
+                if not options['keep']:
+                    # QuerySet.delete() would load every job to send
+                    # post_delete.
+                    with connection.cursor() as cursor:
+                        cursor.execute('DELETE FROM jobs_job WHERE code LIKE '
+                                       '%s', [PREFIX + '%'])
@@ -0,0 +1,82 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from jobs.benchmarking import measure, seed_jobs, summary
+from jobs.cache import catalog_cache
+from jobs.models import Job
+
+UNCACHED_TEMPLATES = [{
+    **settings.TEMPLATES[0],
+    'OPTIONS': {
+        **settings.TEMPLATES[0]['OPTIONS'],
+        'loaders': [
+            'django.template.loaders.filesystem.Loader',
+            'django.template.loaders.app_directories.Loader',
+        ],
+    },
+}]
+# name, settings, clear the jobs cache before every request, conditional
+MODES = [
+    ('no cache', {'JOBS_PAGE_CACHE': False, 'TEMPLATES': UNCACHED_TEMPLATES},
+     True, False),
+    ('templates', {'JOBS_PAGE_CACHE': False}, True, False),
+    ('fragments', {'JOBS_PAGE_CACHE': False}, False, False),
+    ('full page', {}, False, False),
+    ('304', {}, False, True),
+]
+
+
+class Command(BaseCommand):
+    help = ('Time anonymous renders of the catalog and a job page without '
+            'any cache, with cached templates only, with cached card '
+            'fragments, from the full-page cache and as 304 answers to '
+            'conditional requests. Run it against a scratch database with '
+            'DEBUG=False.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--jobs', type=int, default=1000,
+                            help='Seed jobs up to this many visible ones.')
+        parser.add_argument('--repeat', type=int, default=200)
+        parser.add_argument('--keep', action='store_true',
+                            help='Do not delete the seeded jobs afterwards.')
+
+    def run(self, client, path, clear, conditional, repeat):
+        cache = catalog_cache()
+        headers = {}
+        if conditional:
+            headers['if-none-match'] = client.get(path)['ETag']
+
+        def get():
+            if clear:
+                cache.clear()
+            response = client.get(path, headers=headers)
+            assert response.status_code == (304 if conditional else 200)
+
+        get()
+        return summary(measure(get, repeat))
+
+    def handle(self, *args, **options):
+        first_id = (Job.all_objects.order_by('-id')
+                    .values_list('id', flat=True).first() or 0)
+        try:
+            seed_jobs(max(0, options['jobs'] - Job.objects.filter(
+                status='visible').count()))
+            job = Job.objects.filter(status='visible').first()
+            paths = [reverse('index'), reverse('job', args=[job.id])]
+            client = Client()
+            for name, overrides, clear, conditional in MODES:
+                with override_settings(ALLOWED_HOSTS=['testserver'],
+                                       **overrides):
+                    catalog_cache().clear()
+                    for path in paths:
+                        result = self.run(client, path, clear, conditional,
+                                          options['repeat'])
+                        self.stdout.write(
+                            '%-10s %-12s p50 %8.3f ms  p95 %8.3f ms'
+                            % (name, path, result['p50_ms'],
+                               result['p95_ms']))
+        finally:
+            if not options['keep']:
+                Job.all_objects.filter(id__gt=first_id).delete()
@@ -0,0 +1,72 @@
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+
+from jobs.benchmarking import (SERVERS, running_server, scenario_load,
+                               write_results)
+from jobs.cart import set_quantities
+from jobs.models import Job
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = ('Load test a local server with logged-in visitors who browse '
+            'the catalog, search, add a job to their cart and view the '
+            'cart, in a loop. Either point --url at a running server that '
+            'uses the same database or let --server start one. Seed the '
+            'database first, see seed_bench.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000')
+        parser.add_argument('--server', choices=sorted(SERVERS),
+                            help='Start this server instead of using --url.')
+        parser.add_argument('--port', type=int, default=8765)
+        parser.add_argument('--visitors', type=int, default=16)
+        parser.add_argument('--duration', type=float, default=10)
+        parser.add_argument('--json', help='Write the results to this file.')
+
+    def visitors(self, count, job_ids):
+        """A session cookie and a cart for each visitor."""
+        visitors, users = [], []
+        prefix = 'bench-scenario-%d' % time.time_ns()
+        for i in range(count):
+            user = User.objects.create_user('%s-%d' % (prefix, i))
+            users.append(user)
+            client = Client()
+            client.force_login(user)
+            session = client.cookies[settings.SESSION_COOKIE_NAME].value
+            draft_id = set_quantities(user.pk, {job_ids[0]: 1})
+            visitors.append(((settings.SESSION_COOKIE_NAME, session),
+                             draft_id))
+        return visitors, users
+
+    def handle(self, *args, **options):
+        job_ids = list(Job.objects.filter(status='visible').order_by('id')
+                       .values_list('id', flat=True)[:100])
+        if not job_ids:
+            raise CommandError('Seed some jobs first, see seed_bench.')
+        visitors, users = self.visitors(options['visitors'], job_ids)
+        try:
+            if options['server']:
+                name = options['server']
+                with running_server(name, SERVERS[name],
+                                    options['port']) as url:
+                    result = scenario_load(url, visitors, job_ids,
+                                           options['duration'])
+            else:
+                result = scenario_load(options['url'], visitors, job_ids,
+                                       options['duration'])
+        finally:
+            for user in users:
+                user.delete()
+        self.stdout.write('%d scenarios, %.1f req/s, %d errors' % (
+            result['scenarios'], result['rps'], result['errors']))
+        for name, step in result['steps'].items():
+            self.stdout.write('%-8s p50 %8.3f ms  p95 %8.3f ms' % (
+                name, step['p50_ms'], step['p95_ms']))
+        if options['json']:
+            write_results(options['json'], 'bench_scenario', options, result)
@@ -0,0 +1,77 @@
+from importlib import import_module
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from jobs.benchmarking import SEARCH_TERMS, measure, seed_jobs, summary
+from jobs.models import Job
+from jobs.search import search_jobs
+
+search_migration = import_module('jobs.migrations.0008_job_search_indexes')
+
+
+def legacy_search(term):
+    return Job.all_objects.filter(name__icontains=term.lower()).exclude(
+        status='deleted')
+
+
+def live_search(term):
+    return search_jobs(Job.objects.all(), term)
+
+
+class Command(BaseCommand):
+    help = ('Seed jobs and compare catalog search latency before and after '
+            'the search indexes. Run it against a scratch database.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+',
+                            default=[10_000, 100_000, 1_000_000])
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--limit', type=int, default=100)
+        parser.add_argument('--keep', action='store_true',
+                            help='Do not delete the seeded jobs afterwards.')
+
+    def run(self, build_queryset, repeat, limit):
+        samples = []
+        for term in SEARCH_TERMS:
+            samples += measure(
+                lambda: list(build_queryset(term).values_list(
+                    'id', flat=True)[:limit]),
+                repeat,
+            )
+        return summary(samples)
+
+    def run_without_indexes(self, repeat, limit):
+        if connection.vendor != 'postgresql':
+            return self.run(legacy_search, repeat, limit)
+        # DDL is transactional on PostgreSQL: drop the indexes, measure the
+        # old query and roll the drop back.
+        with transaction.atomic():
+            with connection.schema_editor(atomic=False) as schema_editor:
+                search_migration.drop_search_indexes(None, schema_editor)
+            result = self.run(legacy_search, repeat, limit)
+            transaction.set_rollback(True)
+        return result
+
+    def handle(self, *args, **options):
+        first_id = (Job.all_objects.order_by('-id')
+                    .values_list('id', flat=True).first() or 0)
+        try:
+            for size in sorted(options['sizes']):
+                missing = size - Job.all_objects.filter(
+                    id__gt=first_id).count()
+                seed_jobs(missing, seed=size)
+                if connection.vendor == 'postgresql':
+                    with connection.cursor() as cursor:
+                        cursor.execute('ANALYZE jobs_job')
+                before = self.run_without_indexes(options['repeat'],
+                                                  options['limit'])
+                after = self.run(live_search, options['repeat'],
+                                 options['limit'])
+                self.stdout.write(
+                    '%9d jobs  before p95 %9.3f ms  after p95 %9.3f ms'
+                    % (size, before['p95_ms'], after['p95_ms'])
+                )
+        finally:
+            if not options['keep']:
+                Job.all_objects.filter(id__gt=first_id).delete()
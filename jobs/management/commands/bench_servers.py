@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+
+from jobs.benchmarking import SERVERS, http_load, running_server, write_results
+
+
+class Command(BaseCommand):
+    help = ('Compare requests/sec and latency of the sync views under a WSGI '
+            'server and the async views under an ASGI server.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--port', type=int, default=8765)
+        parser.add_argument('--concurrency', type=int, default=32)
+        parser.add_argument('--duration', type=float, default=10)
+        parser.add_argument('--paths', nargs='+',
+                            default=['/', '/jobs/page', '/?job_name=laser'])
+        for name, command in SERVERS.items():
+            parser.add_argument('--%s-cmd' % name, default=command,
+                                help='Default: %s' % command)
+        parser.add_argument('--json', help='Write the results to this file.')
+
+    def run_server(self, name, command, options):
+        with running_server(name, command, options['port']) as url:
+            return http_load(url, options['paths'], options['concurrency'],
+                             options['duration'])
+
+    def handle(self, *args, **options):
+        results = {}
+        for name in SERVERS:
+            results[name] = self.run_server(name, options['%s_cmd' % name],
+                                            options)
+            self.stdout.write('%s  %8.1f req/s  p50 %8.3f ms  p95 %8.3f ms  '
+                              'errors %d' % (
+                                  name, results[name]['rps'],
+                                  results[name].get('p50_ms', 0),
+                                  results[name].get('p95_ms', 0),
+                                  results[name]['errors']))
+        if options['json']:
+            write_results(options['json'], 'bench_servers', options, results)
@@ -0,0 +1,134 @@
+import json
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from jobs.benchmarking import summary, write_results
+from jobs.cart import forget_cart, form_draft, set_quantities
+from jobs.models import Job, Printing
+
+User = get_user_model()
+
+
+def post_json(client, url, data):
+    return client.post(url, json.dumps(data), content_type='application/json')
+
+
+class Command(BaseCommand):
+    help = ('Time every view of jobs.views through the test client and '
+            'count its queries. Seed the database first (seed_bench) and run '
+            'it with DEBUG=False; --json stores the results for '
+            'bench_compare.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=50)
+        parser.add_argument('--warmup', type=int, default=3)
+        parser.add_argument('--only', nargs='+',
+                            help='Run only these cases.')
+        parser.add_argument('--json', help='Write the results to this file.')
+
+    def cases(self):
+        """(name, prepare, request) triples; prepare runs untimed."""
+        anonymous, user, staff = self.anonymous, self.user, self.staff
+        job, jobs = self.jobs[0], self.jobs[:3]
+        quantities = {'jobs': [{'id': pk, 'quantity': 2} for pk in jobs]}
+
+        def nothing():
+            pass
+
+        def fill_cart():
+            self.draft_id = set_quantities(self.user_id, {pk: 1
+                                                          for pk in jobs})
+            forget_cart(self.user_id)
+
+        def formed():
+            fill_cart()
+            self.formed_id = form_draft(self.user_id)
+
+        return [
+            ('index anonymous', nothing,
+             lambda: anonymous.get(reverse('index'))),
+            ('index', nothing, lambda: user.get(reverse('index'))),
+            ('index search', nothing,
+             lambda: user.get(reverse('index'), {'job_name': 'laser'})),
+            ('jobs_page', nothing,
+             lambda: user.get(reverse('jobs_page'), {'order': 'price'})),
+            ('job_detail anonymous', nothing,
+             lambda: anonymous.get(reverse('job', args=[job]))),
+            ('job_detail', nothing,
+             lambda: user.get(reverse('job', args=[job]))),
+            ('add_to_printing', nothing,
+             lambda: user.post(reverse('add_to_printing', args=[job]))),
+            ('add_many_to_printing', nothing,
+             lambda: post_json(user, reverse('add_many_to_printing'),
+                               quantities)),
+            ('printing_detail', fill_cart,
+             lambda: user.get(reverse('printing', args=[self.draft_id]))),
+            ('form_printing', fill_cart,
+             lambda: user.post(reverse('form_printing'))),
+            ('delete_printing', fill_cart,
+             lambda: user.post(reverse('delete_printing',
+                                       args=[self.draft_id]))),
+            ('queue', nothing, lambda: staff.get(reverse('moderation_queue'))),
+            ('moderate', formed,
+             lambda: post_json(staff, reverse('complete_printings'),
+                               {'ids': [self.formed_id]})),
+            ('cache_stats', nothing,
+             lambda: staff.get(reverse('cache_stats'))),
+            ('metrics', nothing, lambda: staff.get(reverse('metrics'))),
+        ]
+
+    def run(self, prepare, request, warmup, repeat):
+        samples, queries = [], []
+        for i in range(warmup + repeat):
+            prepare()
+            with CaptureQueriesContext(connection) as captured:
+                start = time.perf_counter()
+                response = request()
+                elapsed = (time.perf_counter() - start) * 1000
+            if response.status_code >= 400:
+                raise CommandError('%s %s' % (response.status_code,
+                                              response.content[:200]))
+            if i >= warmup:
+                samples.append(elapsed)
+                queries.append(len(captured))
+        queries.sort()
+        return {**summary(samples), 'queries': queries[len(queries) // 2],
+                'max_queries': queries[-1]}
+
+    def handle(self, *args, **options):
+        self.jobs = list(Job.objects.filter(status='visible').order_by('id')
+                         .values_list('id', flat=True)[:3])
+        if len(self.jobs) < 3:
+            raise CommandError('Seed some jobs first, see seed_bench.')
+        user = User.objects.create_user('bench-views-%d' % time.time_ns())
+        staff = User.objects.create_user('bench-views-staff-%d'
+                                         % time.time_ns(), is_staff=True)
+        self.user_id = user.pk
+        self.anonymous, self.user, self.staff = Client(), Client(), Client()
+        self.user.force_login(user)
+        self.staff.force_login(staff)
+        results = {}
+        try:
+            with override_settings(ALLOWED_HOSTS=['testserver']):
+                for name, prepare, request in self.cases():
+                    if options['only'] and name not in options['only']:
+                        continue
+                    results[name] = result = self.run(
+                        prepare, request, options['warmup'],
+                        options['repeat'])
+                    self.stdout.write(
+                        '%-22s p50 %8.3f ms  p95 %8.3f ms  %3d queries'
+                        % (name, result['p50_ms'], result['p95_ms'],
+                           result['queries']))
+        finally:
+            Printing.all_objects.filter(author__in=[user, staff]).delete()
+            user.delete()
+            staff.delete()
+        if options['json']:
+            write_results(options['json'], 'bench_views', options, results)
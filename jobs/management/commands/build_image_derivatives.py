@@ -0,0 +1,24 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+
+from jobs.images import run_build
+from jobs.models import Job
+
+
+class Command(BaseCommand):
+    help = ('Render the thumbnails and WebP/AVIF derivatives of every job '
+            'image. Derivatives that already exist for the same image '
+            'content are not rendered again.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4)
+
+    def handle(self, *args, **options):
+        jobs = Job.objects.exclude(image__isnull=True).exclude(image='')
+        ids = list(jobs.order_by('id').values_list('id', flat=True))
+        with ThreadPoolExecutor(options['workers']) as pool:
+            list(pool.map(run_build, ids))
+        done = jobs.filter(image_variants__isnull=False).count()
+        self.stdout.write('%d of %d job images have derivatives' % (
+            done, len(ids)))
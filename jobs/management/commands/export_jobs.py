@@ -0,0 +1,31 @@
+import sys
+
+from django.core.management.base import BaseCommand
+
+from jobs.catalog_io import BATCH_SIZE, detect_format, export_chunks
+from jobs.models import Job
+
+
+class Command(BaseCommand):
+    help = ('Export the catalog to CSV or JSONL in import_jobs format. Rows '
+            'are streamed, so memory use does not depend on catalog size.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='File to write, - for stdout.')
+        parser.add_argument('--format', choices=['csv', 'jsonl'])
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+        parser.add_argument('--include-deleted', action='store_true')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or detect_format(path)
+        jobs = (Job.all_objects.all() if options['include_deleted']
+                else Job.objects.all())
+        stream = (sys.stdout if path == '-'
+                  else open(path, 'w', encoding='utf-8', newline=''))
+        try:
+            for chunk in export_chunks(jobs, fmt, options['batch_size']):
+                stream.write(chunk)
+        finally:
+            if stream is not sys.stdout:
+                stream.close()
@@ -0,0 +1,37 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from jobs.catalog_io import (BATCH_SIZE, InvalidRow, detect_format,
+                             import_jobs)
+
+
+class Command(BaseCommand):
+    help = ('Import jobs from a CSV or JSONL file matched on their code. '
+            'Files with name and price insert or update jobs; files with '
+            'only some columns, e.g. code,price, update known codes.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='File to read, - for stdin.')
+        parser.add_argument('--format', choices=['csv', 'jsonl'])
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+        parser.add_argument('--method', choices=['auto', 'copy', 'orm'],
+                            default='auto',
+                            help='copy needs PostgreSQL.')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or detect_format(path)
+        stream = (sys.stdin if path == '-'
+                  else open(path, encoding='utf-8', newline=''))
+        try:
+            imported, skipped = import_jobs(stream, fmt,
+                                            options['batch_size'],
+                                            options['method'])
+        except InvalidRow as exc:
+            raise CommandError(exc)
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+        self.stdout.write('%d jobs imported, %d unknown codes skipped'
+                          % (imported, skipped))
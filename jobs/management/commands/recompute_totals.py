@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from jobs.models import Printing
+from jobs.totals import recompute_totals, stale_totals
+
+
+class Command(BaseCommand):
+    help = ('Check Printing.total_price and item_count against the '
+            'PrintingJob lines in batches and fix the stale ones. With '
+            '--verify only report them and fail if there are any.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--verify', action='store_true')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def batches(self, size):
+        last = 0
+        while True:
+            ids = list(Printing.all_objects.filter(id__gt=last).order_by('id')
+                       .values_list('id', flat=True)[:size])
+            if not ids:
+                return
+            last = ids[-1]
+            yield ids
+
+    def handle(self, *args, **options):
+        checked = stale = 0
+        for ids in self.batches(options['batch_size']):
+            checked += len(ids)
+            with transaction.atomic():
+                found = list(stale_totals(
+                    Printing.all_objects.filter(id__in=ids))
+                    .values_list('id', flat=True))
+                if found and not options['verify']:
+                    recompute_totals(found)
+            stale += len(found)
+        action = 'stale' if options['verify'] else 'fixed'
+        self.stdout.write('%d printings checked, %d %s' % (checked, stale,
+                                                           action))
+        if options['verify'] and stale:
+            raise CommandError('%d printings have stale totals' % stale)
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from jobs.rollups import refresh, refreshed_to
+
+
+class Command(BaseCommand):
+    help = ('Rebuild the reporting rollups of the days with printings '
+            'formed, completed, rejected or deleted since the last run. '
+            'Run it from cron, one at a time.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true',
+                            help='Rebuild every day, e.g. after editing '
+                                 'formed_at or complete_at in the admin.')
+        parser.add_argument('--max-days', type=int, default=31,
+                            help='Days rebuilt per transaction.')
+
+    def handle(self, *args, **options):
+        days = refresh(options['full'], options['max_days'])
+        self.stdout.write('%d days rebuilt, refreshed to %s' % (
+            len(days), refreshed_to().isoformat()))
@@ -0,0 +1,53 @@
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from jobs.tasks import claim, purge_done, requeue_stale, run_task
+
+# Seconds between looking for stale and old finished tasks.
+HOUSEKEEPING_INTERVAL = 60
+
+
+class Command(BaseCommand):
+    help = ('Run queued background tasks (see jobs/tasks.py) in a thread '
+            'pool, polling the database for new ones. Start as many as '
+            'needed; they do not claim the same task twice.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int,
+                            default=settings.JOBS_TASKS_WORKERS)
+        parser.add_argument('--poll', type=float, default=1.0,
+                            help='Seconds to sleep when nothing is due.')
+        parser.add_argument('--once', action='store_true',
+                            help='Exit when no task is due.')
+
+    def handle(self, *args, **options):
+        workers = options['workers']
+        done = failed = 0
+        running = set()
+        housekeeping = 0
+        with ThreadPoolExecutor(workers,
+                                thread_name_prefix='jobs-tasks') as pool:
+            while True:
+                if time.monotonic() - housekeeping > HOUSEKEEPING_INTERVAL:
+                    requeue_stale()
+                    purge_done()
+                    housekeeping = time.monotonic()
+                if len(running) < workers:
+                    for task in claim(workers - len(running)):
+                        running.add(pool.submit(run_task, task))
+                if not running:
+                    if options['once']:
+                        break
+                    time.sleep(options['poll'])
+                    continue
+                finished, running = wait(running, timeout=options['poll'],
+                                         return_when=FIRST_COMPLETED)
+                for future in finished:
+                    if future.result():
+                        done += 1
+                    else:
+                        failed += 1
+        self.stdout.write('%d tasks done, %d attempts failed' % (done, failed))
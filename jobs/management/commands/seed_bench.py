@@ -0,0 +1,68 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from jobs.benchmarking import (seed_jobs, seed_printing_jobs, seed_printings,
+                               seed_users)
+from jobs.cache import bump_catalog_version
+from jobs.models import Job, Printing
+from jobs.totals import recompute_totals
+
+# Seeded jobs are sampled for printing lines from this many visible ones.
+JOB_POOL = 10_000
+
+
+class Command(BaseCommand):
+    help = ('Seed a scratch database with jobs, users, printings and their '
+            'lines for the benchmarks. Seeded users are named '
+            '<prefix>-<n> and have unusable passwords.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--jobs', type=int, default=10_000)
+        parser.add_argument('--users', type=int, default=1_000)
+        parser.add_argument('--printings', type=int, default=10_000)
+        parser.add_argument('--max-lines', type=int, default=5,
+                            help='Jobs per printing, 1 to this many.')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--prefix', default='bench')
+
+    def timed(self, name, fn):
+        start = time.perf_counter()
+        count = fn()
+        self.stdout.write('%-14s %9d in %6.1f s' % (
+            name, count, time.perf_counter() - start))
+        return count
+
+    def handle(self, *args, **options):
+        batch_size, seed = options['batch_size'], options['seed']
+        self.timed('jobs', lambda: seed_jobs(options['jobs'], batch_size,
+                                             seed))
+        user_ids = seed_users(options['users'], batch_size, options['prefix'])
+        self.stdout.write('%-14s %9d' % ('users', len(user_ids)))
+        if not user_ids or not options['printings']:
+            bump_catalog_version()
+            return
+        last_printing = (Printing.all_objects.order_by('-id')
+                         .values_list('id', flat=True).first() or 0)
+        self.timed('printings', lambda: seed_printings(
+            user_ids, options['printings'], batch_size, seed))
+        printings = list(Printing.all_objects.filter(id__gt=last_printing)
+                         .values_list('id', 'status'))
+        jobs = list(Job.objects.filter(status='visible').order_by('-id')
+                    .values_list('id', 'price')[:JOB_POOL])
+        if jobs:
+            self.timed('printing jobs', lambda: seed_printing_jobs(
+                printings, jobs, options['max_lines'], batch_size, seed))
+
+        def totals():
+            for start in range(0, len(printings), batch_size):
+                with transaction.atomic():
+                    recompute_totals([pk for pk, status in
+                                      printings[start:start + batch_size]])
+            return len(printings)
+
+        self.timed('totals', totals)
+        # bulk_create sends no post_save.
+        bump_catalog_version()
@@ -0,0 +1,40 @@
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+SEARCH_INDEXES = {
+    # Serve name__icontains / info__icontains, which Django compiles to
+    # UPPER("col"::text) LIKE UPPER(%s).
+    'jobs_job_name_upper_trgm': '(UPPER(name::text)) gin_trgm_ops',
+    'jobs_job_info_upper_trgm': '(UPPER(info::text)) gin_trgm_ops',
+    # Serves name__trigram_word_similar (typo tolerant matching).
+    'jobs_job_name_trgm': 'name gin_trgm_ops',
+}
+
+
+def create_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name, expression in SEARCH_INDEXES.items():
+        schema_editor.execute(
+            'CREATE INDEX IF NOT EXISTS %s ON jobs_job USING gin (%s)'
+            % (name, expression)
+        )
+
+
+def drop_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name in SEARCH_INDEXES:
+        schema_editor.execute('DROP INDEX IF EXISTS %s' % name)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('jobs', '0007_alter_job_image'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.RunPython(create_search_indexes, drop_search_indexes),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.1.2 on 2026-10-18 10:03
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def drop_duplicate_drafts(apps, schema_editor):
+    # Keep the oldest draft of every author, the one the views used to pick.
+    Printing = apps.get_model('jobs', 'Printing')
+    duplicated = (Printing.objects.filter(status='draft')
+                  .values('author_id')
+                  .annotate(drafts=Count('id'), keep=Min('id'))
+                  .filter(drafts__gt=1))
+    for row in duplicated:
+        (Printing.objects.filter(author_id=row['author_id'], status='draft')
+         .exclude(id=row['keep'])
+         .update(status='deleted'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('jobs', '0008_job_search_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_duplicate_drafts,
+                             migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='job',
+            index=models.Index(condition=models.Q(('status', 'deleted'), _negated=True), fields=['price', 'id'], name='jobs_job_live_price'),
+        ),
+        migrations.AddIndex(
+            model_name='printing',
+            index=models.Index(condition=models.Q(('status', 'formed')), fields=['formed_at', 'id'], name='jobs_printing_formed_queue'),
+        ),
+        migrations.AddConstraint(
+            model_name='printing',
+            constraint=models.UniqueConstraint(condition=models.Q(('status', 'draft')), fields=('author',), name='jobs_printing_one_draft'),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.1.2 on 2026-10-18 10:13
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def freeze_formed_prices(apps, schema_editor):
+    # Printings formed before snapshots existed get the current price, the
+    # best approximation left. Totals are filled by the recompute_totals
+    # command, in batches.
+    Job = apps.get_model('jobs', 'Job')
+    PrintingJob = apps.get_model('jobs', 'PrintingJob')
+    (PrintingJob.objects.exclude(printing__status='draft')
+     .update(price=Subquery(Job.objects.filter(pk=OuterRef('job_id'))
+                            .values('price')[:1])))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('jobs', '0009_printing_status_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='printing',
+            name='item_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='printingjob',
+            name='price',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.RunPython(freeze_formed_prices,
+                             migrations.RunPython.noop),
+    ]
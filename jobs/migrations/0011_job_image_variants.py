@@ -0,0 +1,18 @@
+# Generated by Django 5.1.2 on 2026-10-18 10:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('jobs', '0010_printing_totals'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='job',
+            name='image_variants',
+            field=models.JSONField(blank=True, editable=False, null=True),
+        ),
+    ]
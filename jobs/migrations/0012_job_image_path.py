@@ -0,0 +1,18 @@
+# Generated by Django 5.1.2 on 2026-10-18 10:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('jobs', '0011_job_image_variants'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='job',
+            name='image',
+            field=models.CharField(blank=True, max_length=200, null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.2 on 2026-10-18 10:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('jobs', '0012_job_image_path'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='job',
+            name='code',
+            field=models.CharField(blank=True, max_length=50, null=True, unique=True),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.1.2 on 2026-10-18 10:30
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('jobs', '0013_job_code'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='printing',
+            index=models.Index(fields=['status', 'id'], name='jobs_printing_status_id'),
+        ),
+        migrations.AddIndex(
+            model_name='printing',
+            index=models.Index(fields=['formed_at'], name='jobs_printing_formed_at'),
+        ),
+    ]
@@ -0,0 +1,109 @@
+# Generated by Django 5.1.2 on 2026-10-18 10:48
+
+import django.db.models.deletion
+import django.db.models.manager
+from django.conf import settings
+from django.db import migrations, models
+
+SEARCH_INDEXES = {
+    'jobs_job_name_upper_trgm': '(UPPER(name::text)) gin_trgm_ops',
+    'jobs_job_info_upper_trgm': '(UPPER(info::text)) gin_trgm_ops',
+    'jobs_job_name_trgm': 'name gin_trgm_ops',
+}
+
+
+def recreate_search_indexes(apps, schema_editor, where):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name, expression in SEARCH_INDEXES.items():
+        schema_editor.execute('DROP INDEX IF EXISTS %s' % name)
+        schema_editor.execute('CREATE INDEX %s ON jobs_job USING gin (%s)%s'
+                              % (name, expression, where))
+
+
+def live_search_indexes(apps, schema_editor):
+    # Search always excludes deleted jobs: index the live ones only.
+    recreate_search_indexes(apps, schema_editor,
+                            " WHERE NOT (status = 'deleted')")
+
+
+def full_search_indexes(apps, schema_editor):
+    recreate_search_indexes(apps, schema_editor, '')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('jobs', '0014_admin_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedPrinting',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('name', models.CharField(blank=True, max_length=100, null=True)),
+                ('status', models.CharField(choices=[('draft', 'Черновик'), ('deleted', 'Удалена'), ('complete', 'Завершена'), ('formed', 'Сформирована'), ('rejected', 'Отклонена')], max_length=10)),
+                ('created_at', models.DateTimeField()),
+                ('formed_at', models.DateTimeField(blank=True, null=True)),
+                ('complete_at', models.DateTimeField(blank=True, null=True)),
+                ('total_price', models.PositiveIntegerField(blank=True, null=True)),
+                ('item_count', models.PositiveIntegerField(default=0)),
+                ('archived_at', models.DateTimeField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ArchivedPrintingJob',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('quantity', models.PositiveIntegerField(blank=True, null=True)),
+                ('price', models.PositiveIntegerField(blank=True, null=True)),
+            ],
+        ),
+        migrations.AlterModelOptions(
+            name='job',
+            options={'default_manager_name': 'all_objects'},
+        ),
+        migrations.AlterModelOptions(
+            name='printing',
+            options={'default_manager_name': 'all_objects'},
+        ),
+        migrations.AlterModelManagers(
+            name='job',
+            managers=[
+                ('all_objects', django.db.models.manager.Manager()),
+            ],
+        ),
+        migrations.AlterModelManagers(
+            name='printing',
+            managers=[
+                ('all_objects', django.db.models.manager.Manager()),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='job',
+            index=models.Index(condition=models.Q(('status', 'deleted'), _negated=True), fields=['id'], name='jobs_job_live_id'),
+        ),
+        migrations.AddField(
+            model_name='archivedprinting',
+            name='author',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='archivedprinting',
+            name='moderator',
+            field=models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='archivedprintingjob',
+            name='job',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='jobs.job'),
+        ),
+        migrations.AddField(
+            model_name='archivedprintingjob',
+            name='printing',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='lines', to='jobs.archivedprinting'),
+        ),
+        migrations.RunPython(live_search_indexes, full_search_indexes),
+    ]
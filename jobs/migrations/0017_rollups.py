@@ -0,0 +1,83 @@
+# Generated by Django 5.1.2 on 2026-10-18 11:09
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('jobs', '0016_task_queue'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='JobSales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('printings', models.PositiveIntegerField()),
+                ('quantity', models.PositiveIntegerField()),
+                ('revenue', models.PositiveBigIntegerField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ModeratorWorkload',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('formed', models.PositiveIntegerField(default=0)),
+                ('completed', models.PositiveIntegerField(default=0)),
+                ('rejected', models.PositiveIntegerField(default=0)),
+                ('revenue', models.PositiveBigIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='RollupWatermark',
+            fields=[
+                ('name', models.CharField(max_length=50, primary_key=True, serialize=False)),
+                ('refreshed_to', models.DateTimeField()),
+            ],
+        ),
+        migrations.AddField(
+            model_name='printing',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddIndex(
+            model_name='printing',
+            index=models.Index(fields=['complete_at'], name='jobs_printing_complete_at'),
+        ),
+        migrations.AddIndex(
+            model_name='printing',
+            index=models.Index(fields=['updated_at'], name='jobs_printing_updated_at'),
+        ),
+        migrations.AddField(
+            model_name='jobsales',
+            name='job',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='jobs.job'),
+        ),
+        migrations.AddField(
+            model_name='moderatorworkload',
+            name='moderator',
+            field=models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='jobsales',
+            index=models.Index(fields=['job', 'day'], name='jobs_jobsales_job_day'),
+        ),
+        migrations.AddConstraint(
+            model_name='jobsales',
+            constraint=models.UniqueConstraint(fields=('day', 'job'), name='jobs_jobsales_day_job'),
+        ),
+        migrations.AddIndex(
+            model_name='moderatorworkload',
+            index=models.Index(fields=['day'], name='jobs_workload_day'),
+        ),
+        migrations.AddIndex(
+            model_name='moderatorworkload',
+            index=models.Index(fields=['moderator', 'day'], name='jobs_workload_moderator_day'),
+        ),
+    ]
@@ -1,14 +1,30 @@
 from django.contrib.auth import get_user_model
 from django.db import models
+from django.db.models import Q
+from django.utils import timezone
 
 User = get_user_model()
 
 
+class LiveManager(models.Manager):
+    """Rows that are not soft deleted (status 'deleted')."""
+
+    def get_queryset(self):
+        return super().get_queryset().exclude(status='deleted')
+
+
 class Job(models.Model):
+    # Catalog code, the natural key of bulk imports (see jobs/catalog_io.py).
+    code = models.CharField(max_length=50, unique=True, blank=True,
+                            null=True)
     name = models.CharField(max_length=100)
     info = models.TextField()
     price = models.PositiveIntegerField()
-    image = models.URLField(max_length=200, blank=True, null=True)
+    # MEDIA_URL path of an image in the media storage (see jobs/images.py)
+    # or an external URL.
+    image = models.CharField(max_length=200, blank=True, null=True)
+    # Resized WebP/AVIF copies of the image, filled in by jobs/images.py.
+    image_variants = models.JSONField(blank=True, null=True, editable=False)
     statuses = [
         ('visible', 'Показана'),
         ('deleted', 'Удалена')
@@ -16,6 +32,25 @@ class Job(models.Model):
     status = models.CharField(max_length=10, choices=statuses,
                               default='default')
 
+    objects = LiveManager()
+    # Deleted jobs too. Also what the admin, unique validation and dumpdata
+    # use, see default_manager_name.
+    all_objects = models.Manager()
+
+    class Meta:
+        default_manager_name = 'all_objects'
+        indexes = [
+            # Catalog pages ordered by price or id, see jobs/pagination.py.
+            models.Index(fields=['price', 'id'],
+                         condition=~Q(status='deleted'),
+                         name='jobs_job_live_price'),
+            models.Index(fields=['id'], condition=~Q(status='deleted'),
+                         name='jobs_job_live_id'),
+        ]
+
+    def __str__(self):
+        return self.name
+
 
 class Printing(models.Model):
     name = models.CharField(max_length=100, null=True, blank=True)
@@ -35,12 +70,183 @@ class Printing(models.Model):
     formed_at = models.DateTimeField(null=True, blank=True)
     complete_at = models.DateTimeField(null=True, blank=True)
     total_price = models.PositiveIntegerField(blank=True, null=True)
+    # Sum of PrintingJob.quantity, kept up to date with total_price by
+    # jobs/totals.py.
+    item_count = models.PositiveIntegerField(default=0)
+    # Set by every write, raw SQL included: the refresh_rollups watermark.
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = LiveManager()
+    all_objects = models.Manager()
+
+    class Meta:
+        default_manager_name = 'all_objects'
+        constraints = [
+            models.UniqueConstraint(fields=['author'],
+                                    condition=Q(status='draft'),
+                                    name='jobs_printing_one_draft'),
+        ]
+        indexes = [
+            # Moderator queue.
+            models.Index(fields=['formed_at', 'id'],
+                         condition=Q(status='formed'),
+                         name='jobs_printing_formed_queue'),
+            # Admin changelist filters, newest first.
+            models.Index(fields=['status', 'id'],
+                         name='jobs_printing_status_id'),
+            models.Index(fields=['formed_at'],
+                         name='jobs_printing_formed_at'),
+            # Days recomputed by jobs/rollups.py.
+            models.Index(fields=['complete_at'],
+                         name='jobs_printing_complete_at'),
+            models.Index(fields=['updated_at'],
+                         name='jobs_printing_updated_at'),
+        ]
+
+    def __str__(self):
+        return 'Заявка №%s' % self.pk
 
 
 class PrintingJob(models.Model):
     job = models.ForeignKey(Job, on_delete=models.CASCADE)
     printing = models.ForeignKey(Printing, on_delete=models.CASCADE)
     quantity = models.PositiveIntegerField(blank=True, null=True)
+    # Job.price frozen when the printing is formed; drafts use the live price.
+    price = models.PositiveIntegerField(blank=True, null=True)
 
     class Meta:
         unique_together = (('job', 'printing'),)
+
+
+class ArchivedPrinting(models.Model):
+    """
+    Printing moved out of the hot table by the archive_printings command,
+    with the same id. Users may be deleted after the fact, so the user
+    columns carry no foreign key constraint.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    name = models.CharField(max_length=100, null=True, blank=True)
+    author = models.ForeignKey(User, on_delete=models.DO_NOTHING,
+                               db_constraint=False, related_name='+')
+    moderator = models.ForeignKey(User, on_delete=models.DO_NOTHING,
+                                  db_constraint=False, null=True, blank=True,
+                                  related_name='+')
+    status = models.CharField(max_length=10, choices=Printing.statuses)
+    created_at = models.DateTimeField()
+    formed_at = models.DateTimeField(null=True, blank=True)
+    complete_at = models.DateTimeField(null=True, blank=True)
+    total_price = models.PositiveIntegerField(blank=True, null=True)
+    item_count = models.PositiveIntegerField(default=0)
+    archived_at = models.DateTimeField()
+
+    def __str__(self):
+        return 'Заявка №%s' % self.pk
+
+
+class ArchivedPrintingJob(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    job = models.ForeignKey(Job, on_delete=models.DO_NOTHING,
+                            db_constraint=False, related_name='+')
+    printing = models.ForeignKey(ArchivedPrinting, on_delete=models.CASCADE,
+                                 related_name='lines')
+    quantity = models.PositiveIntegerField(blank=True, null=True)
+    price = models.PositiveIntegerField(blank=True, null=True)
+
+
+class JobSales(models.Model):
+    """
+    Lines of the printings completed on a day (complete_at in TIME_ZONE),
+    per job. Rebuilt a day at a time by jobs/rollups.py, archived printings
+    included.
+    """
+    day = models.DateField()
+    job = models.ForeignKey(Job, on_delete=models.DO_NOTHING,
+                            db_constraint=False, related_name='+')
+    printings = models.PositiveIntegerField()
+    quantity = models.PositiveIntegerField()
+    revenue = models.PositiveBigIntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'job'],
+                                    name='jobs_jobsales_day_job'),
+        ]
+        indexes = [
+            models.Index(fields=['job', 'day'], name='jobs_jobsales_job_day'),
+        ]
+
+
+class ModeratorWorkload(models.Model):
+    """
+    Printings formed (by formed_at), completed and rejected (by complete_at)
+    on a day, per moderator; formed printings still in the queue have none.
+    Rebuilt a day at a time by jobs/rollups.py.
+    """
+    day = models.DateField()
+    moderator = models.ForeignKey(User, on_delete=models.DO_NOTHING,
+                                  db_constraint=False, null=True, blank=True,
+                                  related_name='+')
+    formed = models.PositiveIntegerField(default=0)
+    completed = models.PositiveIntegerField(default=0)
+    rejected = models.PositiveIntegerField(default=0)
+    # total_price of the completed ones.
+    revenue = models.PositiveBigIntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['day'], name='jobs_workload_day'),
+            models.Index(fields=['moderator', 'day'],
+                         name='jobs_workload_moderator_day'),
+        ]
+
+
+class RollupWatermark(models.Model):
+    """Printing.updated_at up to which the rollups are refreshed."""
+    name = models.CharField(max_length=50, primary_key=True)
+    refreshed_to = models.DateTimeField()
+
+    def __str__(self):
+        return self.name
+
+
+class Task(models.Model):
+    """A call queued by jobs.tasks and run by the run_tasks command."""
+    name = models.CharField(max_length=200)
+    args = models.JSONField(default=list)
+    # Idempotency key: queueing a task with a key that was used before is a
+    # no-op, for as long as the old row is kept (JOBS_TASKS_KEEP_DAYS).
+    key = models.CharField(max_length=200, unique=True, null=True,
+                           blank=True)
+    statuses = [
+        ('queued', 'В очереди'),
+        ('running', 'Выполняется'),
+        ('done', 'Выполнена'),
+        ('failed', 'Ошибка'),
+    ]
+    status = models.CharField(max_length=10, choices=statuses,
+                              default='queued')
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    # Not before; pushed back after each failed attempt.
+    run_at = models.DateTimeField(default=timezone.now)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True, default='')
+
+    class Meta:
+        indexes = [
+            # What the workers poll.
+            models.Index(fields=['run_at', 'id'],
+                         condition=Q(status='queued'),
+                         name='jobs_task_queued'),
+            models.Index(fields=['started_at'],
+                         condition=Q(status='running'),
+                         name='jobs_task_running'),
+            models.Index(fields=['finished_at'],
+                         condition=Q(status='done'),
+                         name='jobs_task_done'),
+        ]
+
+    def __str__(self):
+        return '%s %s' % (self.name, self.args)
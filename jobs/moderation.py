@@ -0,0 +1,70 @@
+import json
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from jobs.events import EVENT_COLUMNS, printing_changed
+from jobs.models import Printing
+from jobs.notifications import notify_status
+
+QUEUE_ORDERING = ('formed_at', 'id')
+MAX_BULK_PRINTINGS = 500
+
+# Moderator actions and the status they move a formed printing to. Only
+# formed printings can be completed or rejected; the guard is part of the
+# UPDATE, so concurrent moderators cannot decide the same printing twice.
+TRANSITIONS = {
+    'complete': 'complete',
+    'reject': 'rejected',
+}
+TRANSITION = '''
+    UPDATE jobs_printing
+    SET status = %%s, moderator_id = %%s, complete_at = %%s, updated_at = %%s
+    WHERE status = 'formed' AND id IN (%s)
+    RETURNING ''' + EVENT_COLUMNS
+
+
+def moderation_queue():
+    """Formed printings, oldest first, read off the partial queue index."""
+    return (Printing.objects.filter(status='formed')
+            .select_related('author')
+            .only('id', 'name', 'formed_at', 'total_price', 'item_count',
+                  'author__username'))
+
+
+def queue_json(printing):
+    return {
+        'id': printing.id,
+        'name': printing.name,
+        'author': printing.author.username,
+        'formed_at': printing.formed_at,
+        'total_price': printing.total_price,
+        'item_count': printing.item_count,
+    }
+
+
+def parse_ids(body):
+    ids = json.loads(body)['ids']
+    if not isinstance(ids, list) or not 0 < len(ids) <= MAX_BULK_PRINTINGS:
+        raise ValueError(ids)
+    if not all(isinstance(pk, int) for pk in ids):
+        raise ValueError(ids)
+    return sorted(set(ids))
+
+
+def transition(action, ids, moderator_id):
+    """
+    Apply ``action`` to every formed printing of ``ids`` in one UPDATE,
+    queue the emails to their authors and return the ids that moved. The
+    rest were not formed (any more).
+    """
+    placeholders = ', '.join(['%s'] * len(ids))
+    now = timezone.now()
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(TRANSITION % placeholders,
+                       [TRANSITIONS[action], moderator_id, now, now, *ids])
+        rows = cursor.fetchall()
+        moved = sorted(row[0] for row in rows)
+        notify_status(moved, TRANSITIONS[action])
+        printing_changed(rows, left_queue=True)
+    return moved
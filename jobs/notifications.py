@@ -0,0 +1,31 @@
+"""
+Emails to the author of a printing when it is formed and when it is
+moderated, sent by background tasks so that SMTP never holds up a request.
+"""
+from django.core.mail import send_mail
+
+from jobs.models import Printing
+from jobs.tasks import enqueue_many, task
+
+MESSAGES = {
+    'formed': 'Заявка №%s сформирована и ждёт модерации.',
+    'complete': 'Заявка №%s выполнена.',
+    'rejected': 'Заявка №%s отклонена.',
+}
+
+
+@task()
+def notify_author(printing_id, status):
+    printing = (Printing.all_objects.select_related('author')
+                .only('id', 'author__email').filter(pk=printing_id).first())
+    if printing is None or not printing.author.email:
+        return
+    message = MESSAGES[status] % printing_id
+    send_mail('Заявка №%s' % printing_id, message, None,
+              [printing.author.email])
+
+
+def notify_status(ids, status):
+    """Queue one email per printing; a status is announced only once."""
+    enqueue_many(notify_author, [((pk, status), 'notify:%s:%s' % (pk, status))
+                                 for pk in ids])
@@ -0,0 +1,128 @@
+import base64
+import json
+from functools import partial
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+PAGE_SIZE = 24
+MAX_PAGE_SIZE = 100
+
+ORDERINGS = {
+    'id': ('id',),
+    'price': ('price', 'id'),
+}
+SEARCH_ORDERING = ('-rank', 'id')
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def is_integer(value):
+    # bool is an int too; bigint columns hold 64 bits.
+    return (isinstance(value, int) and not isinstance(value, bool)
+            and -2 ** 63 <= value < 2 ** 63)
+
+
+def is_number(value):
+    return is_integer(value) or (isinstance(value, float)
+                                 and value == value and abs(value) < 1e308)
+
+
+def is_datetime(value):
+    try:
+        return isinstance(value, str) and parse_datetime(value) is not None
+    except ValueError:
+        return False
+
+
+# What a cursor may hold for each ordering field; anything else would only
+# fail once the filter is built.
+CURSOR_VALUES = {
+    'id': is_integer,
+    'price': is_integer,
+    'rank': is_number,
+    'formed_at': is_datetime,
+}
+
+
+def encode_cursor(values):
+    # Datetimes go in as full precision ISO strings, which the DateTimeField
+    # lookups in after() parse back.
+    raw = json.dumps(values, separators=(',', ':'),
+                     default=lambda value: value.isoformat()).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor, ordering):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        values = json.loads(raw)
+    except ValueError as exc:
+        raise InvalidCursor(cursor) from exc
+    if not isinstance(values, list) or len(values) != len(ordering):
+        raise InvalidCursor(cursor)
+    for field, value in zip(ordering, values):
+        if not CURSOR_VALUES[field.lstrip('-')](value):
+            raise InvalidCursor(cursor)
+    return values
+
+
+def clamp_page_size(value, default=PAGE_SIZE):
+    try:
+        size = int(value)
+    except (TypeError, ValueError):
+        return default
+    return max(1, min(size, MAX_PAGE_SIZE))
+
+
+def after(ordering, values):
+    """
+    Build the keyset condition "row comes after ``values``" for ``ordering``,
+    e.g. ('price', 'id') -> price > p OR (price = p AND id > i).
+    """
+    condition = Q()
+    for position, field in enumerate(ordering):
+        name = field.lstrip('-')
+        lookup = 'lt' if field.startswith('-') else 'gt'
+        step = Q(**{'%s__%s' % (name, lookup): values[position]})
+        for prev_field, prev_value in zip(ordering, values[:position]):
+            step &= Q(**{prev_field.lstrip('-'): prev_value})
+        condition |= step
+    return condition
+
+
+def page_queryset(queryset, ordering, cursor, size):
+    queryset = queryset.order_by(*ordering)
+    if cursor:
+        queryset = queryset.filter(after(ordering, decode_cursor(cursor,
+                                                                 ordering)))
+    # One extra row tells whether there is a next page.
+    return queryset[:size + 1]
+
+
+def page_result(items, ordering, size):
+    if len(items) <= size:
+        return items, None
+    items = items[:size]
+    last = items[-1]
+    # Model instances or .values() rows.
+    value = last.get if isinstance(last, dict) else partial(getattr, last)
+    return items, encode_cursor([value(field.lstrip('-'))
+                                 for field in ordering])
+
+
+def paginate(queryset, ordering, cursor=None, size=PAGE_SIZE):
+    """
+    Return one page of ``queryset`` ordered by ``ordering`` together with the
+    cursor of the next page (None on the last page).
+    """
+    items = list(page_queryset(queryset, ordering, cursor, size))
+    return page_result(items, ordering, size)
+
+
+async def apaginate(queryset, ordering, cursor=None, size=PAGE_SIZE):
+    items = [item async for item in
+             page_queryset(queryset, ordering, cursor, size)]
+    return page_result(items, ordering, size)
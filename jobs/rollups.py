@@ -0,0 +1,205 @@
+"""
+Reporting rollups, JobSales and ModeratorWorkload, refreshed by the
+refresh_rollups command; the reports views read nothing else.
+
+Printing.updated_at is the watermark. A refresh collects the days (of
+formed_at and complete_at, in TIME_ZONE) of the printings written since
+RollupWatermark.refreshed_to and rebuilds the rollups of those days only,
+from the hot and the archive tables, a run of consecutive days per
+transaction. Whole days are rebuilt rather than adjusted by deltas, so an
+interrupted or repeated refresh never counts a printing twice.
+
+Printings written less than JOBS_ROLLUP_LAG seconds ago are left to the
+next refresh: the transactions writing them may not have committed yet.
+Editing formed_at or complete_at in the admin does not revisit the old day;
+refresh with --full afterwards.
+"""
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, Sum, Value
+from django.db.models.functions import Coalesce, TruncDate
+from django.utils import timezone
+
+from jobs.models import (ArchivedPrinting, ArchivedPrintingJob, JobSales,
+                         ModeratorWorkload, Printing, PrintingJob,
+                         RollupWatermark)
+
+WATERMARK = 'rollups'
+FORMED = ('formed', 'complete', 'rejected')
+DECIDED = ('complete', 'rejected')
+MAX_REPORT_DAYS = 366
+
+
+def day_bounds(first, last):
+    """[start, end) datetimes of the days first to last in TIME_ZONE."""
+    tz = timezone.get_current_timezone()
+    return (timezone.make_aware(datetime.combine(first, time.min), tz),
+            timezone.make_aware(
+                datetime.combine(last + timedelta(days=1), time.min), tz))
+
+
+def printing_days(printings):
+    days = set()
+    for field in ('formed_at', 'complete_at'):
+        days.update(printings.exclude(**{field: None}).order_by()
+                    .annotate(day=TruncDate(field))
+                    .values_list('day', flat=True).distinct())
+    return days
+
+
+def changed_days(since, until):
+    """Days of the printings written in (since, until], of every printing
+    and archived printing without since."""
+    if since is not None:
+        return sorted(printing_days(Printing.all_objects.filter(
+            updated_at__gt=since, updated_at__lte=until)))
+    return sorted(printing_days(Printing.all_objects.all())
+                  | printing_days(ArchivedPrinting.objects.all()))
+
+
+def day_runs(days, max_days):
+    """Sorted days grouped into (first, last) runs of consecutive days."""
+    runs = []
+    for day in days:
+        if runs and (day - runs[-1][1]).days == 1 \
+                and (day - runs[-1][0]).days < max_days:
+            runs[-1][1] = day
+        else:
+            runs.append([day, day])
+    return [tuple(run) for run in runs]
+
+
+def daily_sales(lines, start, end):
+    """Completed lines of ``lines`` per day and job."""
+    return (lines.filter(printing__status='complete',
+                         printing__complete_at__gte=start,
+                         printing__complete_at__lt=end)
+            .annotate(day=TruncDate('printing__complete_at'))
+            .values('day', 'job_id')
+            .annotate(printings=Count('printing_id'),
+                      items=Coalesce(Sum('quantity'), Value(0)),
+                      amount=Coalesce(Sum(F('quantity') * F('price')),
+                                      Value(0)))
+            .order_by())
+
+
+def daily_formed(printings, start, end):
+    return (printings.filter(status__in=FORMED, formed_at__gte=start,
+                             formed_at__lt=end)
+            .annotate(day=TruncDate('formed_at'))
+            .values('day', 'moderator_id')
+            .annotate(count=Count('id'))
+            .order_by())
+
+
+def daily_decided(printings, start, end):
+    return (printings.filter(status__in=DECIDED, complete_at__gte=start,
+                             complete_at__lt=end)
+            .annotate(day=TruncDate('complete_at'))
+            .values('day', 'moderator_id', 'status')
+            .annotate(count=Count('id'),
+                      revenue=Coalesce(Sum('total_price'), Value(0)))
+            .order_by())
+
+
+def rebuild(first, last):
+    """Replace the rollups of the days first to last; return row counts."""
+    start, end = day_bounds(first, last)
+    sales, workload = {}, {}
+    for lines in (PrintingJob.objects.all(),
+                  ArchivedPrintingJob.objects.all()):
+        for row in daily_sales(lines, start, end):
+            key = (row['day'], row['job_id'])
+            if key not in sales:
+                sales[key] = JobSales(day=row['day'], job_id=row['job_id'],
+                                      printings=0, quantity=0, revenue=0)
+            sales[key].printings += row['printings']
+            sales[key].quantity += row['items']
+            sales[key].revenue += row['amount']
+
+    def moderator_day(row):
+        key = (row['day'], row['moderator_id'])
+        if key not in workload:
+            workload[key] = ModeratorWorkload(
+                day=row['day'], moderator_id=row['moderator_id'])
+        return workload[key]
+
+    for printings in (Printing.all_objects.all(),
+                      ArchivedPrinting.objects.all()):
+        for row in daily_formed(printings, start, end):
+            moderator_day(row).formed += row['count']
+        for row in daily_decided(printings, start, end):
+            item = moderator_day(row)
+            if row['status'] == 'complete':
+                item.completed += row['count']
+                item.revenue += row['revenue']
+            else:
+                item.rejected += row['count']
+    with transaction.atomic():
+        JobSales.objects.filter(day__range=(first, last)).delete()
+        ModeratorWorkload.objects.filter(day__range=(first, last)).delete()
+        JobSales.objects.bulk_create(sales.values(), batch_size=1000)
+        ModeratorWorkload.objects.bulk_create(workload.values(),
+                                              batch_size=1000)
+    return len(sales), len(workload)
+
+
+def refresh(full=False, max_days=31):
+    """
+    Rebuild the days changed since the watermark (every day with ``full``)
+    and move the watermark; return the days rebuilt. Run one at a time;
+    during a full one the reports miss the days not rebuilt yet.
+    """
+    until = timezone.now() - timedelta(seconds=settings.JOBS_ROLLUP_LAG)
+    watermark = RollupWatermark.objects.filter(name=WATERMARK).first()
+    since = None if full or watermark is None else watermark.refreshed_to
+    if since is not None and since >= until:
+        return []
+    days = changed_days(since, until)
+    if full:
+        with transaction.atomic():
+            JobSales.objects.all().delete()
+            ModeratorWorkload.objects.all().delete()
+    for first, last in day_runs(days, max_days):
+        rebuild(first, last)
+    RollupWatermark.objects.update_or_create(
+        name=WATERMARK, defaults={'refreshed_to': until})
+    return days
+
+
+def refreshed_to():
+    return (RollupWatermark.objects.filter(name=WATERMARK)
+            .values_list('refreshed_to', flat=True).first())
+
+
+def sales_report(first, last, job_id=None, by=None):
+    """JobSales rows of the days first to last, summed up ``by`` 'day' or
+    'job' when given."""
+    rows = JobSales.objects.filter(day__range=(first, last))
+    if job_id is not None:
+        rows = rows.filter(job_id=job_id)
+    if by is None:
+        return rows.order_by('day', 'job_id').values(
+            'day', 'job_id', 'printings', 'quantity', 'revenue')
+    group = 'job_id' if by == 'job' else by
+    return (rows.values(group).order_by(group)
+            .annotate(printings=Sum('printings'), quantity=Sum('quantity'),
+                      revenue=Sum('revenue')))
+
+
+def workload_report(first, last, moderator_id=None, by=None):
+    """ModeratorWorkload rows of the days first to last, summed up ``by``
+    'day' or 'moderator' when given."""
+    rows = ModeratorWorkload.objects.filter(day__range=(first, last))
+    if moderator_id is not None:
+        rows = rows.filter(moderator_id=moderator_id)
+    if by is None:
+        return rows.order_by('day', 'moderator_id').values(
+            'day', 'moderator_id', 'formed', 'completed', 'rejected',
+            'revenue')
+    group = 'moderator_id' if by == 'moderator' else by
+    return (rows.values(group).order_by(group)
+            .annotate(formed=Sum('formed'), completed=Sum('completed'),
+                      rejected=Sum('rejected'), revenue=Sum('revenue')))
@@ -0,0 +1,60 @@
+from contextvars import ContextVar
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction
+
+from jobs.cache import recently_changed
+
+_catalog_reads = ContextVar('catalog_reads', default=False)
+
+CATALOG_MODELS = {'job'}
+
+
+def catalog_reads(view):
+    """
+    Mark a read-only catalog view: while it runs, Job reads may go to the
+    replica. Cart and order reads always stay on the primary.
+    """
+    if iscoroutinefunction(view):
+        @wraps(view)
+        async def wrapper(*args, **kwargs):
+            token = _catalog_reads.set(True)
+            try:
+                return await view(*args, **kwargs)
+            finally:
+                _catalog_reads.reset(token)
+    else:
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            token = _catalog_reads.set(True)
+            try:
+                return view(*args, **kwargs)
+            finally:
+                _catalog_reads.reset(token)
+    return wrapper
+
+
+class CatalogReplicaRouter:
+    """
+    Catalog reads go to the replica, except for JOBS_REPLICA_LAG seconds
+    after a catalog change: a replica that has not applied the change yet
+    would fill the cache with old rows under the new catalog version. Cache
+    hits run no query, so only fills pay for the check.
+    """
+    replica = 'replica'
+
+    def db_for_read(self, model, **hints):
+        if (_catalog_reads.get() and model._meta.app_label == 'jobs'
+                and model._meta.model_name in CATALOG_MODELS
+                and not recently_changed()):
+            return self.replica
+        return None
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == 'default'
@@ -0,0 +1,82 @@
+from django.conf import settings
+from django.contrib.postgres.search import TrigramWordSimilarity
+from django.db import connections
+from django.db.models import Case, FloatField, Func, Q, Value, When
+from django.db.models.functions import Greatest
+
+
+def normalize(term):
+    return ' '.join(term.split()).lower()
+
+
+def trigrams(text):
+    # Same shape as pg_trgm: every word is padded with two leading spaces
+    # and one trailing space before it is cut into trigrams.
+    result = set()
+    for word in normalize(text).split():
+        padded = '  %s ' % word
+        result.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return result
+
+
+def word_similarity(term, text):
+    """
+    Local stand-in for pg_trgm's word_similarity(): the share of the term's
+    trigrams found in the best matching word of the text.
+    """
+    if not term or not text:
+        return 0.0
+    term, text = normalize(term), normalize(text)
+    if term in text:
+        return 1.0
+    needle = trigrams(term)
+    if not needle:
+        return 0.0
+    best = max((len(needle & trigrams(word)) for word in text.split()),
+               default=0)
+    return best / len(needle)
+
+
+class WordSimilarity(Func):
+    output_field = FloatField()
+
+    def __init__(self, term, expression, **extra):
+        super().__init__(Value(term), expression, **extra)
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        return self.as_sql(compiler, connection,
+                           function='JOBS_WORD_SIMILARITY', **extra_context)
+
+
+def register_sqlite_functions(sender, connection, **kwargs):
+    if connection.vendor == 'sqlite':
+        connection.connection.create_function(
+            'JOBS_WORD_SIMILARITY', 2, word_similarity, deterministic=True
+        )
+
+
+def search_jobs(queryset, term):
+    """
+    Filter and rank ``queryset`` by ``term`` against Job.name and Job.info.
+
+    On PostgreSQL the filter only uses operators served by the pg_trgm GIN
+    indexes from migration 0008; elsewhere matching falls back to a Python
+    trigram function so results stay comparable in tests.
+    """
+    term = normalize(term)
+    if not term:
+        return queryset
+    vendor = connections[queryset.db].vendor
+    if vendor == 'postgresql':
+        matches = (Q(name__icontains=term) | Q(info__icontains=term)
+                   | Q(name__trigram_word_similar=term))
+        name_rank = TrigramWordSimilarity(term, 'name')
+    else:
+        name_rank = WordSimilarity(term, 'name')
+        matches = None
+    info_rank = Case(When(info__icontains=term, then=Value(0.5)),
+                     default=Value(0.0), output_field=FloatField())
+    queryset = queryset.annotate(rank=Greatest(name_rank, info_rank))
+    if matches is None:
+        matches = Q(rank__gte=settings.JOBS_SEARCH_THRESHOLD)
+    return queryset.filter(matches).order_by('-rank', 'id')
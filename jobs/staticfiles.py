@@ -0,0 +1,284 @@
+"""
+Static asset pipeline: collectstatic with AssetStorage builds it,
+StaticFilesMiddleware serves it.
+
+AssetStorage is ManifestStaticFilesStorage plus, before hashing, minified
+CSS, the JOBS_CSS_BUNDLES concatenations and recompressed JPEGs, and after
+hashing .gz (and .br when the brotli module is installed) siblings of the
+text files. Sources are always read from the finders, never from
+STATIC_ROOT, so running collectstatic again does not recompress twice.
+
+StaticFilesMiddleware answers STATIC_URL requests from an index of
+STATIC_ROOT built at startup, before sessions, auth and the URL resolver.
+Hashed names are served with Cache-Control: immutable, so browsers do not
+ask for them again; the precompressed sibling is picked by Accept-Encoding.
+"""
+import gzip
+import json
+import mimetypes
+import os
+import re
+from io import BytesIO
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.contrib.staticfiles.storage import (ManifestStaticFilesStorage,
+                                               staticfiles_storage)
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.files.base import ContentFile
+from django.http import FileResponse, HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from PIL import Image
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE = ('.css', '.js', '.mjs', '.map', '.svg', '.json', '.txt',
+                '.html', '.xml')
+IMMUTABLE = 'public, max-age=31536000, immutable'
+# Unhashed names may change under the same URL.
+REVALIDATE = 'public, max-age=0, must-revalidate'
+
+STRING = r'"(?:[^"\\]|\\.)*"|\'(?:[^\'\\]|\\.)*\''
+IMPORT = re.compile(r'@import\s+(?:url\(\s*(?:%s|[^)]*)\s*\)|%s)[^;]*;'
+                    % (STRING, STRING), re.I)
+CSS_TOKENS = re.compile(r'(%s)|/\*.*?\*/|\s+' % STRING, re.S)
+CSS_PUNCTUATION = re.compile(r'\s*([{};,>])\s*|(:)\s+')
+
+
+def minify_css(css):
+    """Drop comments and whitespace that carries no meaning, not strings."""
+    def token(match):
+        if match.group(1):
+            return match.group(1)
+        # A comment or a run of whitespace.
+        return ' ' if match.group(0)[:2] != '/*' else ''
+
+    parts = []
+    for piece in re.split(r'(%s)' % STRING, CSS_TOKENS.sub(token, css)):
+        if piece[:1] in ('"', "'"):
+            parts.append(piece)
+        else:
+            parts.append(CSS_PUNCTUATION.sub(
+                lambda match: match.group(1) or match.group(2), piece))
+    return ''.join(parts).replace(';}', '}').strip()
+
+
+def bundle_css(sources):
+    """Concatenate stylesheets; their @import rules must come first."""
+    imports, rules = [], []
+    for css in sources:
+        for rule in IMPORT.findall(css):
+            if rule not in imports:
+                imports.append(rule)
+        rules.append(IMPORT.sub('', css))
+    return minify_css('\n'.join(imports + rules))
+
+
+def recompress_jpeg(data):
+    """The JPEG at JOBS_STATIC_JPEG_QUALITY, progressive, resized down to
+    JOBS_STATIC_MAX_IMAGE_WIDTH; None if that is not smaller."""
+    image = Image.open(BytesIO(data))
+    max_width = settings.JOBS_STATIC_MAX_IMAGE_WIDTH
+    if image.width > max_width:
+        image = image.resize(
+            (max_width, round(image.height * max_width / image.width)),
+            Image.LANCZOS)
+    output = BytesIO()
+    image.convert('RGB').save(output, 'JPEG', optimize=True, progressive=True,
+                              quality=settings.JOBS_STATIC_JPEG_QUALITY)
+    result = output.getvalue()
+    return result if len(result) < len(data) else None
+
+
+def compressed_siblings(data):
+    """(suffix, bytes) of the encodings worth storing next to data."""
+    siblings = [('.gz', gzip.compress(data, 9, mtime=0))]
+    if brotli is not None:
+        siblings.append(('.br', brotli.compress(data, quality=11)))
+    return [(suffix, body) for suffix, body in siblings
+            if len(body) < len(data)]
+
+
+class AssetStorage(ManifestStaticFilesStorage):
+
+    def replace(self, name, data):
+        if self.exists(name):
+            self.delete(name)
+        self._save(name, ContentFile(data))
+
+    def read_source(self, paths, name):
+        storage, path = paths[name]
+        with storage.open(path) as source:
+            return source.read()
+
+    def prepare(self, paths):
+        """Rewrite stylesheets and JPEGs in place before they are hashed."""
+        for name in list(paths):
+            lower = name.lower()
+            if lower.endswith('.css'):
+                data = minify_css(self.read_source(paths, name).decode())
+                data = data.encode()
+            elif lower.endswith(('.jpg', '.jpeg')):
+                data = recompress_jpeg(self.read_source(paths, name))
+            else:
+                continue
+            if data is not None:
+                self.replace(name, data)
+                paths[name] = (self, name)
+        for bundle, sources in settings.JOBS_CSS_BUNDLES.items():
+            if all(source in paths for source in sources):
+                self.replace(bundle, bundle_css(
+                    [self.read_source(paths, source).decode()
+                     for source in sources]).encode())
+                paths[bundle] = (self, bundle)
+
+    def compress(self):
+        for name in set(self.hashed_files.values()):
+            if not name.lower().endswith(COMPRESSIBLE):
+                continue
+            with self.open(name) as source:
+                data = source.read()
+            for suffix, body in compressed_siblings(data):
+                self.replace(name + suffix, body)
+
+    def post_process(self, paths, dry_run=False, **options):
+        if dry_run:
+            return
+        paths = dict(paths)
+        self.prepare(paths)
+        yield from super().post_process(paths, dry_run=dry_run, **options)
+        self.compress()
+
+    def stored_name(self, name):
+        try:
+            return super().stored_name(name)
+        except ValueError:
+            # Not collected (yet), e.g. a new file in development.
+            return name
+
+
+def bundled(name):
+    """Whether collectstatic built the bundle ``name``."""
+    hashed_files = getattr(staticfiles_storage, 'hashed_files', {})
+    return name in hashed_files
+
+
+class StaticFile:
+    __slots__ = ('path', 'size', 'content_type', 'last_modified', 'etag',
+                 'cache_control', 'encodings')
+
+    def __init__(self, path, immutable):
+        stat = os.stat(path)
+        self.path = path
+        self.size = stat.st_size
+        self.content_type = (mimetypes.guess_type(path)[0]
+                             or 'application/octet-stream')
+        if self.content_type.startswith('text/'):
+            self.content_type += '; charset=utf-8'
+        self.last_modified = int(stat.st_mtime)
+        self.etag = '"%x-%x"' % (stat.st_mtime_ns, stat.st_size)
+        self.cache_control = IMMUTABLE if immutable else REVALIDATE
+        self.encodings = []
+        for coding, suffix in (('br', '.br'), ('gzip', '.gz')):
+            if os.path.exists(path + suffix):
+                self.encodings.append(
+                    (coding, path + suffix, os.path.getsize(path + suffix)))
+
+
+def index_static_root(root, url):
+    """STATIC_URL paths of the files in root, without compressed siblings."""
+    manifest = os.path.join(root, ManifestStaticFilesStorage.manifest_name)
+    try:
+        with open(manifest, encoding='utf-8') as stream:
+            hashed = set(json.load(stream)['paths'].values())
+    except (OSError, ValueError, KeyError):
+        hashed = set()
+    files = {}
+    for directory, _, names in os.walk(root):
+        for name in names:
+            if name.endswith(('.gz', '.br')):
+                continue
+            path = os.path.join(directory, name)
+            relative = os.path.relpath(path, root).replace(os.sep, '/')
+            files[url + relative] = StaticFile(path, relative in hashed)
+    return files
+
+
+def accepts(request, coding):
+    for item in request.headers.get('Accept-Encoding', '').split(','):
+        name, _, params = item.partition(';')
+        if name.strip().lower() == coding:
+            quality = params.replace(' ', '').lower()
+            return not (quality.startswith('q=')
+                        and not quality[2:].strip('0.'))
+    return False
+
+
+class StaticFilesMiddleware:
+    """
+    Put it first in MIDDLEWARE. Files collected after startup are served
+    once the process restarts; until then requests fall through to Django.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.JOBS_STATIC_SERVE or not settings.STATIC_ROOT:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.files = index_static_root(str(settings.STATIC_ROOT),
+                                       settings.STATIC_URL)
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        return self.serve(request, stream=True) or self.get_response(request)
+
+    async def __acall__(self, request):
+        # Under ASGI a file iterator would be consumed in a thread; the
+        # collected files are small enough to send in one piece.
+        response = self.serve(request, stream=False)
+        if response is None:
+            response = await self.get_response(request)
+        return response
+
+    def serve(self, request, stream):
+        if request.method not in ('GET', 'HEAD'):
+            return None
+        static = self.files.get(request.path_info)
+        if static is None:
+            return None
+        path, size, coding = static.path, static.size, None
+        for name, encoded_path, encoded_size in static.encodings:
+            if accepts(request, name):
+                path, size, coding = encoded_path, encoded_size, name
+                break
+        etag = static.etag[:-1] + ('-%s"' % coding if coding else '"')
+        response = get_conditional_response(
+            request, etag=etag, last_modified=static.last_modified)
+        if response is None:
+            if request.method == 'HEAD':
+                response = HttpResponse()
+            elif stream:
+                response = FileResponse(open(path, 'rb'))
+                del response['Content-Disposition']
+            else:
+                with open(path, 'rb') as source:
+                    response = HttpResponse(source.read())
+            response['Content-Type'] = static.content_type
+            response['Content-Length'] = size
+            if coding:
+                response['Content-Encoding'] = coding
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(static.last_modified)
+        response['Cache-Control'] = static.cache_control
+        if static.encodings:
+            response['Vary'] = 'Accept-Encoding'
+        return response
@@ -0,0 +1,144 @@
+"""
+A task queue in the database for side effects that should not hold up a
+request: image derivatives and status emails.
+
+Functions decorated with @task are queued with ``fn.delay(*args)``: a row in
+jobs_task, written in the caller's transaction, so a rolled back request
+queues nothing. The run_tasks command claims due rows (SKIP LOCKED where
+the database has it), runs them in a thread pool and retries failures with
+exponential backoff until max_attempts. A ``key`` makes queueing
+idempotent. With JOBS_TASKS_EAGER tasks run inline instead, which is what
+the tests use. Arguments must be JSON serializable.
+"""
+import random
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import (IntegrityError, close_old_connections, connection,
+                       transaction)
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from jobs.models import Task
+
+CLAIM = '''
+    UPDATE jobs_task
+    SET status = 'running', attempts = attempts + 1, started_at = %%s
+    WHERE id IN (
+        SELECT id FROM jobs_task
+        WHERE status = 'queued' AND run_at <= %%s
+        ORDER BY run_at, id
+        LIMIT %%s%s
+    )
+    RETURNING id
+'''
+
+_registry = {}
+
+
+def task(max_attempts=5):
+    def register(fn):
+        fn.task_name = '%s.%s' % (fn.__module__, fn.__qualname__)
+        fn.max_attempts = max_attempts
+        fn.delay = lambda *args, **options: enqueue(fn, args, **options)
+        _registry[fn.task_name] = fn
+        return fn
+    return register
+
+
+def new_task(fn, args, key=None, countdown=0):
+    return Task(name=fn.task_name, args=list(args), key=key,
+                max_attempts=fn.max_attempts,
+                run_at=timezone.now() + timedelta(seconds=countdown))
+
+
+def enqueue(fn, args, key=None, countdown=0):
+    """
+    Queue fn(*args) and return the Task, or None when it ran eagerly or
+    the key was used before.
+    """
+    if settings.JOBS_TASKS_EAGER:
+        fn(*args)
+        return None
+    try:
+        with transaction.atomic():
+            queued = new_task(fn, args, key, countdown)
+            queued.save()
+            return queued
+    except IntegrityError:
+        return None
+
+
+def enqueue_many(fn, calls):
+    """Queue fn once per (args, key) pair in one INSERT."""
+    if settings.JOBS_TASKS_EAGER:
+        for args, key in calls:
+            fn(*args)
+        return
+    Task.objects.bulk_create([new_task(fn, args, key) for args, key in calls],
+                             ignore_conflicts=True)
+
+
+def claim(limit):
+    """Mark up to limit due tasks running and return them."""
+    now = timezone.now()
+    lock = (' FOR UPDATE SKIP LOCKED'
+            if connection.features.has_select_for_update_skip_locked else '')
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(CLAIM % lock, [now, now, limit])
+        ids = [row[0] for row in cursor.fetchall()]
+    return list(Task.objects.filter(id__in=ids).order_by('run_at', 'id'))
+
+
+def retry_delay(attempts):
+    """Seconds before the next attempt: doubling, capped, jittered."""
+    delay = min(settings.JOBS_TASKS_RETRY_DELAY * 2 ** (attempts - 1),
+                settings.JOBS_TASKS_MAX_RETRY_DELAY)
+    return delay * random.uniform(0.5, 1)
+
+
+def lookup(name):
+    fn = _registry.get(name)
+    if fn is None:
+        # Defining the function registers it.
+        fn = import_string(name)
+        if getattr(fn, 'task_name', None) != name:
+            raise LookupError('%s is not a task' % name)
+    return fn
+
+
+def run_task(task):
+    """Run a claimed task and record the outcome. Returns True on success."""
+    try:
+        lookup(task.name)(*task.args)
+    except Exception:
+        now = timezone.now()
+        error = traceback.format_exc()
+        if task.attempts >= task.max_attempts:
+            update = {'status': 'failed', 'finished_at': now}
+        else:
+            update = {'status': 'queued', 'run_at': now + timedelta(
+                seconds=retry_delay(task.attempts))}
+        Task.objects.filter(pk=task.pk).update(last_error=error, **update)
+        return False
+    else:
+        Task.objects.filter(pk=task.pk).update(
+            status='done', finished_at=timezone.now(), last_error='')
+        return True
+    finally:
+        close_old_connections()
+
+
+def requeue_stale():
+    """Put back tasks of workers that died while running them."""
+    cutoff = timezone.now() - timedelta(seconds=settings.JOBS_TASKS_TIMEOUT)
+    return (Task.objects.filter(status='running', started_at__lt=cutoff)
+            .update(status='queued', run_at=timezone.now()))
+
+
+def purge_done():
+    """Forget finished tasks, and with them their keys, after a while."""
+    cutoff = timezone.now() - timedelta(days=settings.JOBS_TASKS_KEEP_DAYS)
+    return (Task.objects.filter(status='done', finished_at__lt=cutoff)
+            .delete()[0])
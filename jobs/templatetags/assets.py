@@ -0,0 +1,18 @@
+from django import template
+from django.conf import settings
+from django.templatetags.static import static
+from django.utils.html import format_html_join
+
+from jobs.staticfiles import bundled
+
+register = template.Library()
+
+
+@register.simple_tag
+def stylesheets(bundle):
+    """<link>s to a JOBS_CSS_BUNDLES bundle, or to its sources until
+    collectstatic has built it."""
+    names = [bundle] if bundled(bundle) else settings.JOBS_CSS_BUNDLES[bundle]
+    return format_html_join(
+        '\n    ', '<link rel="stylesheet" type="text/css" href="{}"/>',
+        ((static(name),) for name in names))
@@ -0,0 +1,15 @@
+from django import template
+
+from jobs.images import media_url, sources
+
+register = template.Library()
+
+
+@register.inclusion_tag('job_picture.html')
+def job_picture(job, css_class, sizes, loading='eager'):
+    """<picture> with WebP/AVIF srcsets of the job image and the original."""
+    variants = job.image_variants or {}
+    width, height = variants.get('size', (None, None))
+    return {'src': media_url(job.image), 'class': css_class, 'sizes': sizes,
+            'loading': loading, 'sources': sources(job), 'width': width,
+            'height': height}
@@ -1,3 +1,1894 @@
-from django.test import TestCase
+import asyncio
+import gzip
+import json
+import re
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from io import BytesIO, StringIO
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, sync_to_async
+from django.conf import settings
+from django.contrib.auth import (BACKEND_SESSION_KEY, authenticate,
+                                 get_user_model)
+from django.contrib.auth.hashers import check_password, make_password
+from django.core.cache import caches
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core import mail
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, connection as db_connection, transaction
+from django.template import engines
+from django.test import (Client, RequestFactory, SimpleTestCase, TestCase,
+                         TransactionTestCase, override_settings,
+                         skipUnlessDBFeature)
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+
+from fablab.settings import database
+from fablab.urls import media_patterns
+from jobs.archive import archive_batch
+from jobs.auth import LimitedArgon2PasswordHasher, clear_users
+from jobs.benchmarking import seed_jobs, seed_printings, seed_users
+from jobs.cache import (CSRF_PLACEHOLDER, CountingLocMemCache,
+                        bump_catalog_version, cache_stats, catalog_version)
+from jobs.catalog_io import InvalidRow, import_jobs
+from jobs.cart import (form_draft, get_cart, load_cart, set_quantities,
+                       toggle_job)
+from jobs.events import (EventsApplication, broker, event_stream, subscribe,
+                         user_channels)
+from jobs.explain import analyze, full_scans, used_indexes
+from jobs.images import supported_formats, upload_image
+from jobs.instrumentation import instrument, reset_metrics
+from jobs.models import (ArchivedPrinting, ArchivedPrintingJob, Job,
+                         JobSales, ModeratorWorkload, Printing, PrintingJob,
+                         Task)
+from jobs.moderation import MAX_BULK_PRINTINGS, transition
+from jobs.pagination import MAX_PAGE_SIZE, encode_cursor
+from jobs.rollups import day_runs, refresh
+from jobs.routers import CatalogReplicaRouter, catalog_reads
+from jobs.search import search_jobs, word_similarity
+from jobs.staticfiles import (StaticFilesMiddleware, bundle_css,
+                              minify_css)
+from jobs.storage import MinioStorage, content_hash
+from jobs.tasks import claim, run_task, task
+from jobs.totals import stale_totals
+from jobs.views import mark_deleted
+
+User = get_user_model()
+
+
+# A replica mirror is a separate connection that cannot see rows created
+# inside the test transaction, so view tests always read from default.
+# CatalogReplicaRouter itself is covered by RouterTests.
+@override_settings(DATABASE_ROUTERS=[], JOBS_TASKS_EAGER=True)
+class CatalogTestCase(TestCase):
+    def setUp(self):
+        caches[settings.JOBS_CACHE_ALIAS].clear()
+        # Rolled back users send no post_delete.
+        clear_users()
+
+
+class SearchTests(CatalogTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.printing = Job.objects.create(
+            name='3D печать', info='Печать изделий из PLA', price=500,
+            status='visible')
+        cls.laser = Job.objects.create(
+            name='Laser cutting', info='Резка фанеры и акрила', price=900,
+            status='visible')
+        cls.deleted = Job.objects.create(
+            name='3D печать (старая)', info='', price=100, status='deleted')
+
+    def search(self, term):
+        return list(search_jobs(Job.objects.all(), term))
+
+    def test_empty_term_returns_everything(self):
+        self.assertEqual(len(self.search('  ')), 2)
+
+    def test_exact_match(self):
+        self.assertEqual(self.search('печать'), [self.printing])
+        self.assertEqual(self.search('LASER'), [self.laser])
+
+    def test_typo_tolerance(self):
+        self.assertEqual(self.search('пичать'), [self.printing])
+        self.assertEqual(self.search('lazer'), [self.laser])
+
+    def test_info_match_ranks_below_name_match(self):
+        Job.objects.create(name='Фрезеровка', info='Без лазера, только laser',
+                           price=1, status='visible')
+        result = self.search('laser')
+        self.assertEqual(result[0], self.laser)
+        self.assertEqual(len(result), 2)
+
+    def test_ranked_results_paginate(self):
+        other = Job.objects.create(name='Engraving', info='laser engraving',
+                                   price=1, status='visible')
+        first = self.client.get(reverse('jobs_page'),
+                                {'job_name': 'laser', 'size': 1}).json()
+        second = self.client.get(reverse('jobs_page'), {
+            'job_name': 'laser', 'size': 1, 'cursor': first['next_cursor'],
+        }).json()
+        self.assertEqual(first['results'][0]['id'], self.laser.id)
+        self.assertEqual(second['results'][0]['id'], other.id)
+        self.assertIsNone(second['next_cursor'])
+
+    def test_word_similarity(self):
+        self.assertEqual(word_similarity('печ', '3D Печать'), 1.0)
+        self.assertGreater(word_similarity('пичать', '3D печать'), 0.5)
+        self.assertEqual(word_similarity('', 'печать'), 0.0)
+
+    def test_index_view_uses_search(self):
+        user = User.objects.create_user('client', password='password')
+        self.client.force_login(user)
+        response = self.client.get(reverse('index'), {'job_name': 'lazer'})
+        self.assertEqual(list(response.context['jobs']), [self.laser])
+
+
+class PaginationTests(CatalogTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.jobs = Job.objects.bulk_create(
+            Job(name='Job %d' % i, info='', price=1000 - i * 10 % 70,
+                status='visible')
+            for i in range(30)
+        )
+        Job.objects.create(name='Deleted', info='', price=1, status='deleted')
+
+    def walk(self, **params):
+        seen, cursor = [], None
+        while True:
+            if cursor:
+                params['cursor'] = cursor
+            page = self.client.get(reverse('jobs_page'), params).json()
+            seen += [job['id'] for job in page['results']]
+            cursor = page['next_cursor']
+            if not cursor:
+                return seen
+
+    def test_walks_catalog_by_id(self):
+        self.assertEqual(self.walk(size=7), [job.id for job in self.jobs])
+
+    def test_walks_catalog_by_price(self):
+        expected = [job.id for job in
+                    sorted(self.jobs, key=lambda job: (job.price, job.id))]
+        self.assertEqual(self.walk(size=4, order='price'), expected)
+
+    def test_page_size_is_capped(self):
+        Job.objects.bulk_create(
+            Job(name='Extra', info='', price=1, status='visible')
+            for _ in range(MAX_PAGE_SIZE)
+        )
+        page = self.client.get(reverse('jobs_page'), {'size': 10_000}).json()
+        self.assertEqual(len(page['results']), MAX_PAGE_SIZE)
+
+    def test_invalid_cursor(self):
+        for cursor in ('???', encode_cursor([1, 2, 3])):
+            response = self.client.get(reverse('jobs_page'),
+                                        {'cursor': cursor})
+            self.assertEqual(response.status_code, 400)
+
+    def test_cursor_with_wrong_typed_values(self):
+        for values in (['abc'], [None], [{'a': 1}], [True], [1.5], [2 ** 70]):
+            cursor = encode_cursor(values)
+            self.assertEqual(self.client.get(
+                reverse('jobs_page'), {'cursor': cursor}).status_code, 400)
+            self.assertEqual(self.client.get(
+                reverse('api_jobs'), {'cursor': cursor}).status_code, 400)
+            # The index falls back to the first page.
+            self.assertEqual(self.client.get(
+                reverse('index'), {'cursor': cursor}).status_code, 200)
+        cursor = encode_cursor([1000, 'x'])
+        self.assertEqual(self.client.get(reverse('jobs_page'), {
+            'order': 'price', 'cursor': cursor}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('jobs_page'), {
+            'job_name': 'job', 'cursor': encode_cursor(['x', 1]),
+        }).status_code, 400)
+
+    def test_index_renders_first_page(self):
+        user = User.objects.create_user('client', password='password')
+        self.client.force_login(user)
+        response = self.client.get(reverse('index'))
+        self.assertEqual(len(response.context['jobs']), 24)
+        self.assertIsNotNone(response.context['next_cursor'])
+
+    @override_settings(JOBS_INDEX_STREAMING=True, JOBS_STREAM_CHUNK_SIZE=5)
+    def test_streaming_index(self):
+        user = User.objects.create_user('client', password='password')
+        self.client.force_login(user)
+        response = self.client.get(reverse('index'))
+        self.assertTrue(response.streaming)
+        content = b''.join(response.streaming_content).decode()
+        self.assertEqual(content.count('class="card-container"'), 30)
+        self.assertNotIn('Deleted', content)
+        self.assertIn('</html>', content)
+
+
+class CatalogCacheTests(CatalogTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.job = Job.objects.create(name='Laser cutting', info='', price=900,
+                                     status='visible')
+
+    def test_job_detail_is_cached(self):
+        url = reverse('job', args=[self.job.id])
+        self.client.get(url)
+        with self.assertNumQueries(0):
+            response = self.client.get(url)
+        self.assertContains(response, 'Цена: 900 руб')
+
+    def test_save_invalidates_prices(self):
+        url = reverse('job', args=[self.job.id])
+        self.client.get(url)
+        self.job.price = 1200
+        self.job.save()
+        self.assertContains(self.client.get(url), 'Цена: 1200 руб')
+        page = self.client.get(reverse('jobs_page')).json()
+        self.assertEqual(page['results'][0]['price'], 1200)
+
+    def test_delete_invalidates_catalog(self):
+        self.client.get(reverse('jobs_page'))
+        self.job.delete()
+        self.assertEqual(
+            self.client.get(reverse('jobs_page')).json()['results'], [])
+
+    def test_fills_after_a_change_read_the_primary(self):
+        router = CatalogReplicaRouter()
+        read = catalog_reads(lambda: router.db_for_read(Job))
+        self.assertEqual(read(), 'replica')
+        bump_catalog_version()
+        self.assertIsNone(read())
+        with self.settings(JOBS_REPLICA_LAG=0):
+            bump_catalog_version()
+        self.assertEqual(read(), 'replica')
+
+    def test_version_bumps_on_commit(self):
+        version = catalog_version()
+        with self.captureOnCommitCallbacks(execute=True):
+            bump_catalog_version()
+        self.assertEqual(catalog_version(), version + 2)
+
+    def test_cached_cards_carry_a_valid_csrf_token(self):
+        client = Client(enforce_csrf_checks=True)
+        user = User.objects.create_user('client', password='password')
+        client.force_login(user)
+        client.get(reverse('index'))
+        content = client.get(reverse('index')).content.decode()
+        self.assertNotIn(CSRF_PLACEHOLDER, content)
+        token = re.search(r'csrfmiddlewaretoken" value="([^"]+)"',
+                          content).group(1)
+        response = client.post(reverse('add_to_printing', args=[self.job.id]),
+                               {'csrfmiddlewaretoken': token})
+        self.assertEqual(response.status_code, 302)
+
+    @override_settings(JOBS_PAGE_CACHE=False)
+    def test_stats(self):
+        url = reverse('job', args=[self.job.id])
+        before = cache_stats()
+        self.client.get(url)
+        self.client.get(url)
+        after = cache_stats()
+        self.assertEqual(after['misses'] - before['misses'], 1)
+        self.assertEqual(after['hits'] - before['hits'], 1)
+
+    def test_stats_endpoint_requires_staff(self):
+        self.assertEqual(self.client.get(reverse('cache_stats')).status_code,
+                         302)
+        staff = User.objects.create_user('staff', password='password',
+                                         is_staff=True)
+        self.client.force_login(staff)
+        response = self.client.get(reverse('cache_stats'))
+        self.assertIn('evictions', response.json())
+
+    def test_evictions_are_counted(self):
+        cache = CountingLocMemCache('evictions-test', {
+            'OPTIONS': {'MAX_ENTRIES': 3, 'CULL_FREQUENCY': 3}})
+        before = cache_stats()['evictions']
+        for i in range(5):
+            cache.set(i, i)
+        self.assertGreater(cache_stats()['evictions'], before)
+
+
+class PageCacheTests(CatalogTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.job = Job.objects.create(name='Laser cutting', info='', price=900,
+                                     status='visible')
+
+    def test_anonymous_pages_are_cached(self):
+        for url in (reverse('index'), reverse('job', args=[self.job.id])):
+            self.client.get(url)
+            with self.assertNumQueries(0):
+                response = self.client.get(url)
+            self.assertContains(response, 'Laser cutting')
+            self.assertIn('ETag', response)
+            self.assertIn('Last-Modified', response)
+            self.assertIn('private', response['Cache-Control'])
+
+    def test_conditional_get(self):
+        url = reverse('job', args=[self.job.id])
+        response = self.client.get(url)
+        self.assertEqual(self.client.get(
+            url, headers={'if-none-match': response['ETag']}).status_code,
+            304)
+        self.assertEqual(self.client.get(
+            url, headers={'if-modified-since': response['Last-Modified']}
+        ).status_code, 304)
+        self.assertEqual(self.client.get(
+            url, headers={'if-none-match': '"stale"'}).status_code, 200)
+
+    def test_keyed_on_version_and_search_term(self):
+        url = reverse('index')
+        etag = self.client.get(url)['ETag']
+        self.assertNotContains(self.client.get(url, {'job_name': 'pottery'}),
+                               'Laser cutting')
+        self.assertContains(self.client.get(url, {'job_name': 'laser'}),
+                            'value="laser"')
+        response = self.client.get(url, {'job_name': 'LASER'})
+        self.assertContains(response, 'Laser cutting')
+        self.assertContains(response, 'value="LASER"')
+        self.job.price = 1200
+        self.job.save()
+        response = self.client.get(url, headers={'if-none-match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, '1200')
+
+    def test_logged_in_users_bypass_the_cache(self):
+        self.client.get(reverse('index'))
+        user = User.objects.create_user('client', password='password')
+        self.client.force_login(user)
+        before = cache_stats()
+        response = self.client.get(reverse('index'))
+        self.assertNotIn('ETag', response)
+        self.assertEqual(cache_stats()['page_hits'], before['page_hits'])
+
+    def test_cached_page_carries_a_valid_csrf_token(self):
+        client = Client(enforce_csrf_checks=True)
+        client.get(reverse('index'))
+        response = client.get(reverse('index'))
+        content = response.content.decode()
+        self.assertNotIn(CSRF_PLACEHOLDER, content)
+        token = re.search(r'csrfmiddlewaretoken" value="([^"]+)"',
+                          content).group(1)
+        response = client.post(reverse('index'),
+                               {'csrfmiddlewaretoken': token})
+        self.assertEqual(response.status_code, 200)
+
+
+class CartTests(CatalogTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('client', password='password')
+        cls.jobs = Job.objects.bulk_create(
+            Job(name='Job %d' % i, info='', price=100, status='visible')
+            for i in range(3)
+        )
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.user)
+
+    def add(self, job):
+        return self.client.post(reverse('add_to_printing', args=[job.id]))
+
+    def test_load_cart_is_one_query(self):
+        draft = Printing.objects.create(author=self.user)
+        PrintingJob.objects.create(printing=draft, job=self.jobs[0],
+                                   quantity=1)
+        PrintingJob.objects.create(printing=draft, job=self.jobs[1],
+                                   quantity=1)
+        with self.assertNumQueries(1):
+            cart = load_cart(self.user.pk)
+        self.assertEqual(cart.id, draft.id)
+        self.assertEqual(cart.job_ids, {self.jobs[0].id, self.jobs[1].id})
+        self.assertEqual(cart.count, 2)
+
+    def test_empty_draft(self):
+        draft = Printing.objects.create(author=self.user)
+        cart = load_cart(self.user.pk)
+        self.assertEqual((cart.id, cart.count), (draft.id, 0))
+
+    def test_add_to_printing_updates_cart(self):
+        self.add(self.jobs[0])
+        self.add(self.jobs[1])
+        self.add(self.jobs[0])
+        draft = Printing.objects.get(author=self.user, status='draft')
+        with self.assertNumQueries(1):
+            cart = get_cart(self.user)
+        with self.assertNumQueries(0):
+            self.assertEqual(get_cart(self.user).job_ids, cart.job_ids)
+        self.assertEqual(cart.id, draft.id)
+        self.assertEqual(cart.job_ids, {self.jobs[1].id})
+
+    def test_cart_is_not_patched_from_a_stale_copy(self):
+        self.add(self.jobs[0])
+        get_cart(self.user)
+        # Another request's click, committed before this one's.
+        toggle_job(self.user.pk, self.jobs[1].id)
+        self.add(self.jobs[2])
+        self.assertEqual(get_cart(self.user).job_ids,
+                         {job.id for job in self.jobs})
+
+    def test_delete_printing_clears_cart(self):
+        self.add(self.jobs[0])
+        draft = Printing.objects.get(author=self.user, status='draft')
+        self.client.post(reverse('delete_printing', args=[draft.id]))
+        self.assertIsNone(get_cart(self.user).id)
+
+    def test_toggle_job_round_trips(self):
+        # savepoint, draft upsert, insert, totals, release
+        with self.assertNumQueries(5):
+            draft_id, added = toggle_job(self.user.pk, self.jobs[0].id)
+        self.assertTrue(added)
+        # savepoint, draft upsert, insert, delete, totals, release
+        with self.assertNumQueries(6):
+            self.assertEqual(toggle_job(self.user.pk, self.jobs[0].id),
+                             (draft_id, False))
+
+    def test_add_missing_or_deleted_job(self):
+        deleted = Job.objects.create(name='Old', info='', price=1,
+                                     status='deleted')
+        for job_id in (deleted.id, 0):
+            response = self.client.post(reverse('add_to_printing',
+                                                args=[job_id]))
+            self.assertEqual(response.status_code, 404)
+        self.assertFalse(Printing.objects.exists())
+
+    def test_add_many(self):
+        self.add(self.jobs[0])
+        response = self.client.post(
+            reverse('add_many_to_printing'),
+            {'jobs': [{'id': self.jobs[0].id, 'quantity': 3},
+                      {'id': self.jobs[1].id, 'quantity': 2}]},
+            content_type='application/json',
+        )
+        draft = Printing.objects.get(author=self.user, status='draft')
+        self.assertEqual(response.json()['id'], draft.id)
+        self.assertEqual(
+            dict(draft.printingjob_set.values_list('job_id', 'quantity')),
+            {self.jobs[0].id: 3, self.jobs[1].id: 2},
+        )
+        self.assertEqual(get_cart(self.user).count, 2)
+
+    def test_add_many_validation(self):
+        url = reverse('add_many_to_printing')
+        for body in ({}, {'jobs': []}, {'jobs': [{'id': 'x'}]},
+                     {'jobs': [{'id': self.jobs[0].id, 'quantity': 0}]}):
+            response = self.client.post(url, body,
+                                        content_type='application/json')
+            self.assertEqual(response.status_code, 400)
+        response = self.client.post(url, {'jobs': [{'id': 0}]},
+                                    content_type='application/json')
+        self.assertEqual(response.json(), {'missing': [0]})
+        self.assertFalse(Printing.objects.exists())
+
+    def test_anonymous_index(self):
+        self.client.logout()
+        response = self.client.get(reverse('index'))
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(response.context['cart'].id)
+
+    def test_index_query_count(self):
+        self.add(self.jobs[0])
+        self.add(self.jobs[1])
+        caches[settings.JOBS_CACHE_ALIAS].clear()
+        # cart, catalog page; the session and the user are cached
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('index'))
+        self.assertContains(response, '<span class="cart-count">2</span>')
+        with self.assertNumQueries(0):
+            self.client.get(reverse('index'))
+
+
+class TotalsTests(CatalogTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('client', password='password')
+        cls.cheap = Job.objects.create(name='Cheap', info='', price=100,
+                                       status='visible')
+        cls.dear = Job.objects.create(name='Dear', info='', price=250,
+                                      status='visible')
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.user)
+
+    def totals(self):
+        draft = Printing.objects.get(author=self.user)
+        return draft.total_price, draft.item_count
+
+    def test_toggle_and_requantify(self):
+        toggle_job(self.user.pk, self.cheap.id)
+        toggle_job(self.user.pk, self.dear.id)
+        self.assertEqual(self.totals(), (350, 2))
+        set_quantities(self.user.pk, {self.cheap.id: 3})
+        self.assertEqual(self.totals(), (550, 4))
+        toggle_job(self.user.pk, self.cheap.id)
+        self.assertEqual(self.totals(), (250, 1))
+
+    def test_drafts_follow_price_changes(self):
+        toggle_job(self.user.pk, self.cheap.id)
+        self.cheap.price = 120
+        self.cheap.save()
+        self.assertEqual(self.totals(), (120, 1))
+
+    @override_settings(JOBS_TASKS_EAGER=False)
+    def test_price_change_then_removal_without_worker(self):
+        toggle_job(self.user.pk, self.cheap.id)
+        self.cheap.price = 300
+        self.cheap.save()
+        self.assertEqual(self.totals(), (300, 1))
+        toggle_job(self.user.pk, self.cheap.id)
+        self.assertEqual(self.totals(), (0, 0))
+
+    def test_form_freezes_prices(self):
+        self.client.post(reverse('form_printing'))
+        self.assertFalse(Printing.objects.exclude(status='draft').exists())
+        set_quantities(self.user.pk, {self.cheap.id: 2, self.dear.id: 1})
+        response = self.client.post(reverse('form_printing'))
+        printing = Printing.objects.get(author=self.user)
+        self.assertRedirects(response, reverse('printing',
+                                               args=[printing.id]))
+        self.assertEqual(printing.status, 'formed')
+        self.assertIsNotNone(printing.formed_at)
+        self.assertIsNone(get_cart(self.user).id)
+        self.cheap.price = 1000
+        self.cheap.save()
+        self.assertEqual(self.totals(), (450, 3))
+        response = self.client.get(reverse('printing', args=[printing.id]))
+        self.assertContains(response, 'Цена: 100')
+
+    def test_recompute_command(self):
+        toggle_job(self.user.pk, self.cheap.id)
+        Printing.objects.update(total_price=None, item_count=0)
+        self.assertEqual(stale_totals(Printing.objects.all()).count(), 1)
+        with self.assertRaises(CommandError):
+            call_command('recompute_totals', verify=True, stdout=StringIO())
+        out = StringIO()
+        call_command('recompute_totals', batch_size=1, stdout=out)
+        self.assertIn('1 printings checked, 1 fixed', out.getvalue())
+        self.assertEqual(self.totals(), (100, 1))
+        call_command('recompute_totals', verify=True, stdout=StringIO())
+
+
+class PrintingDetailTests(CatalogTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('client', password='password')
+        cls.staff = User.objects.create_user('moderator', is_staff=True)
+        cls.jobs = [Job.objects.create(name='Job %d' % i, info='',
+                                       price=100 * i, status='visible')
+                    for i in (1, 2, 3)]
+
+    def setUp(self):
+        super().setUp()
+        self.draft_id = set_quantities(
+            self.user.pk, {job.id: i for i, job in enumerate(self.jobs, 1)})
+        self.url = reverse('printing', args=[self.draft_id])
+
+    def test_one_query(self):
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url)
+        self.assertContains(response, 'Сумма: 900')
+        self.assertContains(response, 'Итого: 1400')
+        self.assertIn('no-store', response['Cache-Control'])
+        empty = Printing.objects.create(author=self.staff, status='formed')
+        with self.assertNumQueries(2):
+            self.client.get(reverse('printing', args=[empty.id]))
+
+    def test_missing_printing(self):
+        self.assertEqual(
+            self.client.get(reverse('printing', args=[0])).status_code, 404)
+
+    def test_moderated_printing_is_cached(self):
+        form_draft(self.user.pk)
+        transition('complete', [self.draft_id], self.staff.pk)
+        response = self.client.get(self.url)
+        self.assertContains(response, 'Модератор: moderator')
+        with self.assertNumQueries(0):
+            cached = self.client.get(self.url)
+        self.assertContains(cached, 'Модератор: moderator')
+        self.assertNotContains(cached, CSRF_PLACEHOLDER)
+        self.assertEqual(self.client.get(
+            self.url, headers={'if-none-match': cached['ETag']}).status_code,
+            304)
+        Printing.objects.filter(pk=self.draft_id).get().save()
+        with self.assertNumQueries(1):
+            self.client.get(self.url)
+        self.client.post(reverse('delete_printing', args=[self.draft_id]))
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+
+
+class ApiTests(CatalogTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('client')
+        cls.other = User.objects.create_user('other')
+        cls.jobs = Job.objects.bulk_create(
+            Job(name='Laser %d' % i, info='', price=10 * i, status='visible')
+            for i in range(1, 6))
+        Job.objects.create(name='Laser old', info='', price=1,
+                           status='deleted')
+
+    def test_jobs(self):
+        url = reverse('api_jobs')
+        with self.assertNumQueries(1):
+            page = self.client.get(url, {'size': 3}).json()
+        self.assertEqual(page['results'][0], {
+            'id': self.jobs[0].id, 'name': 'Laser 1', 'price': 10,
+            'image': None, 'sources': []})
+        with self.assertNumQueries(0):
+            self.client.get(url, {'size': 3})
+        rest = self.client.get(url, {'size': 3, 'fields': 'id,price',
+                                     'cursor': page['next_cursor']}).json()
+        self.assertEqual(rest, {'results': [
+            {'id': job.id, 'price': job.price} for job in self.jobs[3:]],
+            'next_cursor': None})
+        found = self.client.get(url, {'job_name': 'laser',
+                                      'fields': 'name'}).json()
+        self.assertEqual(len(found['results']), 5)
+        response = self.client.get(url, {'fields': 'id,secret'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['fields'], ['secret'])
+        self.assertEqual(self.client.get(url, {'cursor': '!'}).status_code,
+                         400)
+
+    def test_job(self):
+        response = self.client.get(reverse('api_job', args=[self.jobs[1].id]),
+                                   {'fields': 'name,info'})
+        self.assertEqual(response.json(), {'name': 'Laser 2', 'info': ''})
+        deleted = Job.all_objects.get(status='deleted')
+        self.assertEqual(self.client.get(
+            reverse('api_job', args=[deleted.id])).status_code, 404)
+
+    def test_conditional_and_compressed(self):
+        url = reverse('api_jobs')
+        plain = self.client.get(url)
+        self.assertNotIn('Content-Encoding', plain)
+        self.assertIn('Accept-Encoding', plain['Vary'])
+        self.assertEqual(self.client.get(
+            url, headers={'if-none-match': plain['ETag']}).status_code, 304)
+        gzipped = self.client.get(url, headers={'accept-encoding': 'gzip'})
+        self.assertEqual(gzipped['Content-Encoding'], 'gzip')
+        self.assertNotEqual(gzipped['ETag'], plain['ETag'])
+        self.assertEqual(gzip.decompress(gzipped.content), plain.content)
+        self.assertEqual(self.client.get(url, headers={
+            'accept-encoding': 'gzip',
+            'if-none-match': gzipped['ETag']}).status_code, 304)
+        self.assertNotIn('Content-Encoding', self.client.get(
+            url, headers={'accept-encoding': 'gzip;q=0'}))
+        with mock.patch('jobs.api.compress_string') as compress:
+            again = self.client.get(url, headers={'accept-encoding': 'gzip'})
+        compress.assert_not_called()
+        self.assertEqual(again.content, gzipped.content)
+        job = Job.objects.get(pk=self.jobs[0].pk)
+        job.price = 15
+        job.save()
+        self.assertEqual(self.client.get(
+            url, headers={'if-none-match': plain['ETag']}).status_code, 200)
+
+    def test_printing_and_cart(self):
+        self.assertEqual(self.client.get(reverse('api_cart')).status_code,
+                         403)
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(reverse('api_cart')).json(),
+                         {'id': None, 'total_price': 0, 'item_count': 0,
+                          'lines': []})
+        draft_id = set_quantities(self.user.pk, {self.jobs[1].id: 3})
+        cart = self.client.get(reverse('api_cart'),
+                               {'fields': 'id,status,total_price'}).json()
+        self.assertEqual(cart, {
+            'id': draft_id, 'status': 'draft', 'total_price': 60,
+            'lines': [{'job': self.jobs[1].id, 'name': 'Laser 2',
+                       'quantity': 3, 'price': 20, 'subtotal': 60}]})
+        url = reverse('api_printing', args=[draft_id])
+        self.assertEqual(self.client.get(url).json()['author'], 'client')
+        self.client.force_login(self.other)
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+
+class ImageTests(CatalogTestCase):
+    def setUp(self):
+        super().setUp()
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.media = Path(media.name)
+        settings_override = self.settings(MEDIA_ROOT=media.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        (self.media / 'jobs').mkdir()
+        buffer = BytesIO()
+        Image.new('RGB', (700, 350), 'orange').save(buffer, 'PNG')
+        (self.media / 'jobs' / 'part.png').write_bytes(buffer.getvalue())
+
+    def create(self, name, image='/media/jobs/part.png'):
+        with self.captureOnCommitCallbacks(execute=True):
+            job = Job.objects.create(name=name, info='', price=1,
+                                     status='visible', image=image)
+        job.refresh_from_db()
+        return job
+
+    def test_derivatives(self):
+        job = self.create('Part')
+        variants = job.image_variants
+        self.assertEqual(variants['widths'], [320, 480, 640, 700])
+        self.assertEqual(variants['formats'], supported_formats())
+        self.assertIn('webp', variants['formats'])
+        thumb = self.media / 'derivatives' / variants['key'] / '320.webp'
+        self.assertEqual(Image.open(thumb).size, (320, 160))
+
+    def test_same_content_is_rendered_once(self):
+        first = self.create('Part')
+        files = sorted(self.media.glob('derivatives/*/*'))
+        second = self.create('Copy')
+        self.assertEqual(first.image_variants, second.image_variants)
+        self.assertEqual(sorted(self.media.glob('derivatives/*/*')), files)
+
+    def test_external_or_missing_images(self):
+        for image in ('https://example.com/part.png', '/media/jobs/none.png',
+                      None):
+            self.assertIsNone(self.create('Other', image).image_variants)
+
+    def test_srcset(self):
+        job = self.create('Part')
+        response = self.client.get(reverse('index'))
+        self.assertContains(response, 'type="image/webp"')
+        self.assertContains(response, '/media/derivatives/%s/320.webp 320w'
+                            % job.image_variants['key'])
+        response = self.client.get(reverse('job', args=[job.id]))
+        self.assertContains(response, '700w')
+        page = self.client.get(reverse('jobs_page')).json()
+        self.assertIn('image/webp', [source['type'] for source in
+                                     page['results'][0]['sources']])
+
+
+    def test_upload_is_content_addressed(self):
+        data = (self.media / 'jobs' / 'part.png').read_bytes()
+        url = upload_image(SimpleUploadedFile('Part.PNG', data))
+        name = url.removeprefix(settings.MEDIA_URL)
+        self.assertEqual(name, 'jobs/%s.png'
+                         % content_hash(ContentFile(data))[:32])
+        stored = (self.media / name).stat().st_mtime_ns
+        self.assertEqual(upload_image(SimpleUploadedFile('copy.png', data)),
+                         url)
+        self.assertEqual((self.media / name).stat().st_mtime_ns, stored)
+        self.assertEqual(len(list(self.media.glob('jobs/*'))), 2)
+
+    def test_admin_upload(self):
+        admin = User.objects.create_superuser('admin', password='password')
+        self.client.force_login(admin)
+        data = (self.media / 'jobs' / 'part.png').read_bytes()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('admin:jobs_job_add'), {
+                'name': 'Uploaded', 'info': 'x', 'price': 10,
+                'status': 'visible', 'image': '',
+                'image_file': SimpleUploadedFile('part.png', data),
+            })
+        job = Job.objects.get(name='Uploaded')
+        self.assertTrue(default_storage.exists(
+            job.image.removeprefix(settings.MEDIA_URL)))
+        self.assertIsNotNone(job.image_variants)
+
+
+class StaticPipelineTests(SimpleTestCase):
+    def setUp(self):
+        root = tempfile.TemporaryDirectory()
+        self.addCleanup(root.cleanup)
+        self.root = Path(root.name)
+        settings_override = self.settings(
+            STATIC_ROOT=root.name, JOBS_STATIC_SERVE=True,
+            STATICFILES_FINDERS=[
+                'django.contrib.staticfiles.finders.FileSystemFinder'],
+            STORAGES={**settings.STORAGES, 'staticfiles': {
+                'BACKEND': 'jobs.staticfiles.AssetStorage'}})
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def test_minify(self):
+        self.assertEqual(minify_css('a  >  b , c:hover {\n  color : red ;'
+                                    ' /* x */ content: "a  b" ; }'),
+                         'a>b,c:hover{color :red;content:"a  b"}')
+        self.assertEqual(
+            bundle_css(['p { margin: 0 }',
+                        '@import url("x.css?a=1;b=2");\ni { top: 0 }']),
+            '@import url("x.css?a=1;b=2");p{margin:0}i{top:0}')
+
+    def test_collect_and_serve(self):
+        call_command('collectstatic', interactive=False, verbosity=0)
+        manifest = json.loads((self.root / 'staticfiles.json').read_text())
+        bundle = manifest['paths']['styles/bundle.css']
+        self.assertTrue((self.root / (bundle + '.gz')).exists())
+        background = self.root / manifest['paths']['images/background.jpg']
+        self.assertLess(background.stat().st_size,
+                        (settings.BASE_DIR / 'static' / 'images' /
+                         'background.jpg').stat().st_size)
+
+        middleware = StaticFilesMiddleware(lambda request: None)
+        factory = RequestFactory()
+        response = middleware(factory.get(settings.STATIC_URL + bundle))
+        self.assertEqual(response['Cache-Control'],
+                         'public, max-age=31536000, immutable')
+        self.assertNotIn('Content-Encoding', response)
+        self.assertIn(b'@import', b''.join(response.streaming_content))
+        gzipped = middleware(factory.get(settings.STATIC_URL + bundle,
+                                         headers={'accept-encoding': 'gzip'}))
+        self.assertEqual(gzipped['Content-Encoding'], 'gzip')
+        self.assertEqual(
+            gzip.decompress(b''.join(gzipped.streaming_content)),
+            (self.root / bundle).read_bytes())
+        self.assertEqual(middleware(factory.get(
+            settings.STATIC_URL + bundle,
+            headers={'accept-encoding': 'gzip',
+                     'if-none-match': gzipped['ETag']})).status_code, 304)
+        plain = middleware(factory.get(settings.STATIC_URL +
+                                       'styles/bundle.css'))
+        self.assertIn('must-revalidate', plain['Cache-Control'])
+        self.assertIsNone(middleware(factory.get(settings.STATIC_URL +
+                                                 'missing.css')))
+
+        html = engines['django'].from_string(
+            "{% load assets %}{% stylesheets 'styles/bundle.css' %}").render()
+        self.assertIn(settings.STATIC_URL + bundle, html)
+
+    def test_sources_until_collected(self):
+        html = engines['django'].from_string(
+            "{% load assets %}{% stylesheets 'styles/bundle.css' %}").render()
+        self.assertEqual(html.count('<link'), 3)
+        self.assertIn('/static/styles/common.css', html)
+
+
+class MinioStorageTests(SimpleTestCase):
+    def storage(self, **options):
+        storage = MinioStorage('minio:9000', 'key', 'secret', 'fablab',
+                               secure=False, region='us-east-1', **options)
+        storage._client = mock.Mock(wraps=storage.client)
+        return storage
+
+    def test_urls(self):
+        storage = self.storage(base_url='https://cdn.example.com/media')
+        self.assertEqual(storage.url('jobs/a b.png'),
+                         'https://cdn.example.com/media/jobs/a%20b.png')
+        url = self.storage(url_expiry=60).url('jobs/a.png')
+        self.assertTrue(url.startswith('http://minio:9000/fablab/jobs/a.png?'))
+        self.assertIn('X-Amz-Expires=60', url)
+
+    def test_save_skips_identical_content(self):
+        storage = self.storage(upload_workers=6)
+        content = ContentFile(b'x' * 100, name='a.png')
+        storage.client.stat_object = mock.Mock(return_value=mock.Mock(
+            metadata={'x-amz-meta-sha256': content_hash(content)}))
+        storage.client.put_object = mock.Mock()
+        self.assertEqual(storage.save('jobs/a.png', content), 'jobs/a.png')
+        storage.client.put_object.assert_not_called()
+        storage.client.stat_object.return_value.metadata = {}
+        storage.save('jobs/a.png', content)
+        kwargs = storage.client.put_object.call_args.kwargs
+        self.assertEqual(kwargs['num_parallel_uploads'], 6)
+        self.assertEqual(kwargs['content_type'], 'image/png')
+
+    @override_settings(DEBUG=True)
+    def test_media_is_served_only_from_the_filesystem(self):
+        self.assertEqual(len(media_patterns()), 1)
+        backend = {'BACKEND': 'jobs.storage.MinioStorage'}
+        with self.settings(STORAGES={**settings.STORAGES,
+                                     'default': backend}):
+            self.assertEqual(media_patterns(), [])
+
+
+class ModerationTests(CatalogTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.moderator = User.objects.create_user('moderator', is_staff=True)
+        cls.client_user = User.objects.create_user('client')
+        start = timezone.now()
+        # Two printings per timestamp to exercise the (formed_at, id) keyset.
+        cls.formed = Printing.objects.bulk_create(
+            Printing(author=cls.client_user, status='formed',
+                     formed_at=start + timedelta(seconds=i // 2))
+            for i in range(7)
+        )
+        cls.draft = Printing.objects.create(author=cls.client_user)
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.moderator)
+
+    def walk(self):
+        seen, cursor = [], None
+        while True:
+            params = {'size': 3, **({'cursor': cursor} if cursor else {})}
+            page = self.client.get(reverse('moderation_queue'), params).json()
+            seen += [row['id'] for row in page['results']]
+            cursor = page['next_cursor']
+            if not cursor:
+                return seen
+
+    def moderate(self, action, ids):
+        return self.client.post(reverse('%s_printings' % action),
+                                {'ids': ids},
+                                content_type='application/json')
+
+    def test_cursor_with_wrong_typed_values(self):
+        for values in (['yesterday', 1], [None, 1], ['2024-02-30T00:00', 1],
+                       [timezone.now(), 'x']):
+            response = self.client.get(reverse('moderation_queue'),
+                                       {'cursor': encode_cursor(values)})
+            self.assertEqual(response.status_code, 400)
+
+    def test_queue(self):
+        self.assertEqual(self.walk(), [p.id for p in self.formed])
+
+    def test_staff_only(self):
+        self.client.force_login(self.client_user)
+        self.assertEqual(
+            self.client.get(reverse('moderation_queue')).status_code, 403)
+        self.assertEqual(self.moderate('complete', [self.formed[0].id])
+                         .status_code, 403)
+
+    def test_bulk_transitions(self):
+        ids = [p.id for p in self.formed[:4]]
+        response = self.moderate('complete', ids[:3] + [self.draft.id])
+        self.assertEqual(response.json(), {'complete': ids[:3],
+                                           'skipped': [self.draft.id]})
+        response = self.moderate('reject', ids)
+        self.assertEqual(response.json(), {'reject': ids[3:],
+                                           'skipped': ids[:3]})
+        statuses = dict(Printing.objects.values_list('id', 'status'))
+        self.assertEqual([statuses[pk] for pk in ids],
+                         ['complete'] * 3 + ['rejected'])
+        self.assertEqual(statuses[self.draft.id], 'draft')
+        decided = Printing.objects.get(pk=ids[0])
+        self.assertEqual(decided.moderator, self.moderator)
+        self.assertIsNotNone(decided.complete_at)
+        self.assertEqual(self.walk(), [p.id for p in self.formed[4:]])
+
+    @override_settings(JOBS_TASKS_EAGER=False)
+    def test_bulk_is_one_update(self):
+        ids = [p.id for p in self.formed]
+        with CaptureQueriesContext(db_connection) as queries:
+            self.assertEqual(transition('complete', ids, self.moderator.pk),
+                             ids)
+        # The UPDATE and one INSERT of the email tasks, between savepoints.
+        statements = [query['sql'].split()[0] for query in queries
+                      if 'SAVEPOINT' not in query['sql']]
+        self.assertEqual(statements, ['UPDATE', 'INSERT'])
+        self.assertEqual(Task.objects.filter(name__endswith='notify_author')
+                         .count(), len(ids))
+
+    def test_bulk_validation(self):
+        for ids in ([], ['x'], list(range(MAX_BULK_PRINTINGS + 1))):
+            self.assertEqual(self.moderate('reject', ids).status_code, 400)
+
+
+class CatalogIOTests(CatalogTestCase):
+    def import_text(self, text, fmt='csv', **kwargs):
+        return import_jobs(StringIO(text), fmt, **kwargs)
+
+    def test_upsert_on_code(self):
+        Job.objects.create(code='A', name='Old', info='old', price=1,
+                           status='visible')
+        version = catalog_version()
+        result = self.import_text(
+            'code,name,price\n'
+            'A,Laser,100\n'
+            'B,Mill,200\n'
+            'B,Mill,250\n', batch_size=2)
+        self.assertEqual(result, (3, 0))
+        self.assertEqual(
+            list(Job.objects.order_by('code')
+                 .values_list('code', 'name', 'info', 'price', 'status')),
+            [('A', 'Laser', 'old', 100, 'visible'),
+             ('B', 'Mill', '', 250, 'visible')])
+        self.assertGreater(catalog_version(), version)
+
+    def test_partial_rows_update_known_codes(self):
+        user = User.objects.create_user('client')
+        job = Job.objects.create(code='A', name='Laser', info='', price=100,
+                                 status='visible')
+        toggle_job(user.pk, job.id)
+        result = self.import_text('{"code": "A", "price": 120}\n'
+                                  '{"code": "Z", "price": 1}\n', 'jsonl')
+        self.assertEqual(result, (1, 1))
+        self.assertEqual(Job.objects.get().price, 120)
+        self.assertEqual(Printing.objects.get().total_price, 120)
+
+    def test_invalid_rows(self):
+        for text in ('name,price\nA,1\n', 'code,price\nA,x\n',
+                     'code,status\nA,gone\n', 'code,name,price\n,A,1\n',
+                     'code,price\n%s,1\n' % ('A' * 51),
+                     'code,name,price\nA,%s,1\n' % ('n' * 101),
+                     'code,image\nA,%s\n' % ('i' * 201),
+                     'code,price\nA,99999999999999999999\n',
+                     'code,price\nA,-1\n',
+                     '{"code": "A", "name": null, "price": 1}\n',
+                     '{"code": "A", "name": "A", "price": 1, "info": 1}\n'):
+            with self.assertRaises(InvalidRow):
+                self.import_text(text, 'jsonl' if text[0] == '{' else 'csv')
+        self.assertFalse(Job.objects.exists())
+        self.import_text('code,name,price\n%s,%s,2147483647\n'
+                         % ('A' * 50, 'n' * 100))
+        self.assertEqual(Job.objects.get().price, 2147483647)
+
+    def test_commands_round_trip(self):
+        Job.objects.create(code='A', name='Лазер, "резка"', info='a\nb',
+                           price=100, status='visible')
+        Job.objects.create(name='No code', info='', price=5,
+                           status='deleted')
+        with tempfile.TemporaryDirectory() as directory:
+            for fmt in ('csv', 'jsonl'):
+                path = str(Path(directory) / ('jobs.' + fmt))
+                call_command('export_jobs', path, stdout=StringIO())
+                Job.objects.filter(code='A').update(name='x', price=1)
+                out = StringIO()
+                call_command('import_jobs', path, stdout=out)
+                self.assertIn('1 jobs imported', out.getvalue())
+                self.assertEqual(
+                    Job.objects.values_list('name', 'info', 'price').get(
+                        code='A'), ('Лазер, "резка"', 'a\nb', 100))
+            Path(directory, 'bad.csv').write_text('code\nA\n')
+            with self.assertRaises(CommandError):
+                call_command('import_jobs', str(Path(directory, 'bad.csv')))
+
+    def test_admin(self):
+        admin = User.objects.create_superuser('admin', password='password')
+        self.client.force_login(admin)
+        upload = SimpleUploadedFile('jobs.csv',
+                                    'code,name,price\nA,Лазер,10\n'.encode())
+        response = self.client.post(reverse('admin:jobs_job_import'),
+                                    {'file': upload})
+        self.assertRedirects(response, reverse('admin:jobs_job_changelist'))
+        upload = SimpleUploadedFile(
+            'jobs.csv', 'code,price\nA,99999999999999999999\n'.encode())
+        response = self.client.post(reverse('admin:jobs_job_import'),
+                                    {'file': upload})
+        self.assertContains(response, 'bad price')
+        job = Job.objects.get(code='A')
+        response = self.client.post(reverse('admin:jobs_job_changelist'), {
+            'action': 'export_csv', '_selected_action': [job.id]})
+        self.assertEqual(b''.join(response.streaming_content).decode(),
+                         'code,name,info,price,image,status\r\n'
+                         'A,Лазер,,10,,visible\r\n')
+
+
+class SoftDeleteTests(CatalogTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('client')
+        cls.live = Job.objects.create(name='Live', info='', price=10,
+                                      status='visible')
+        cls.deleted = Job.objects.create(name='Deleted', info='', price=20,
+                                         status='deleted')
+
+    def test_managers(self):
+        self.assertEqual(list(Job.objects.all()), [self.live])
+        self.assertEqual(Job.all_objects.count(), 2)
+        self.assertIs(Job._default_manager, Job.all_objects)
+        printing = Printing.objects.create(author=self.user, status='deleted')
+        self.assertFalse(Printing.objects.filter(pk=printing.pk).exists())
+        self.assertTrue(Printing.all_objects.filter(pk=printing.pk).exists())
+
+    def test_job_detail(self):
+        self.assertEqual(self.client.get(
+            reverse('job', args=[self.live.id])).status_code, 200)
+        self.assertRedirects(
+            self.client.get(reverse('job', args=[self.deleted.id])), '/')
+        self.assertEqual(
+            self.client.get(reverse('job', args=[0])).status_code, 404)
+
+    def test_archive(self):
+        old = timezone.now() - timedelta(days=365)
+        done, recent, draft = Printing.objects.bulk_create([
+            Printing(author=self.user, status='complete', complete_at=old),
+            Printing(author=self.user, status='deleted'),
+            Printing(author=self.user, status='draft'),
+        ])
+        # Created long ago, deleted just now.
+        Printing.all_objects.filter(pk__in=[done.pk, recent.pk]).update(
+            created_at=old)
+        line = PrintingJob.objects.create(printing=done, job=self.live,
+                                          quantity=2, price=10)
+        self.assertEqual(archive_batch(timezone.now() - timedelta(days=30)),
+                         [done.id])
+        self.assertEqual(
+            set(Printing.all_objects.values_list('id', flat=True)),
+            {recent.id, draft.id})
+        archived = ArchivedPrinting.objects.get()
+        self.assertEqual((archived.id, archived.status, archived.author),
+                         (done.id, 'complete', self.user))
+        self.assertEqual(list(archived.lines.values_list('id', 'quantity')),
+                         [(line.id, 2)])
+        self.assertFalse(PrintingJob.objects.exists())
+        Printing.all_objects.filter(pk=recent.pk).update(updated_at=old)
+        self.assertEqual(archive_batch(timezone.now() - timedelta(days=30)),
+                         [recent.id])
+        Printing.objects.create(author=self.user, status='deleted')
+        out = StringIO()
+        call_command('archive_printings', '--older-than', '0', stdout=out)
+        self.assertEqual(out.getvalue(), '1 printings archived\n')
+        self.assertEqual(ArchivedPrintingJob.objects.count(), 1)
+        self.assertEqual(
+            self.client.get(reverse('printing', args=[done.id])).status_code,
+            404)
+
+
+calls = []
+
+
+@task(max_attempts=2)
+def record_call(value, fail=False):
+    if fail:
+        raise ValueError(value)
+    calls.append(value)
+
+
+@override_settings(JOBS_TASKS_EAGER=False)
+@override_settings(JOBS_ROLLUP_LAG=0)
+class RollupTests(CatalogTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.laser = Job.objects.create(name='Laser cutting', info='',
+                                       price=900, status='visible')
+        cls.print3d = Job.objects.create(name='3D printing', info='',
+                                         price=500, status='visible')
+        cls.author = User.objects.create_user('author')
+        cls.other = User.objects.create_user('other')
+        cls.staff = User.objects.create_user('staff', is_staff=True)
+
+    def complete(self, quantities):
+        set_quantities(self.author.pk, quantities)
+        printing_id = form_draft(self.author.pk)
+        transition('complete', [printing_id], self.staff.pk)
+        return printing_id
+
+    def sales(self):
+        return list(JobSales.objects.order_by('job_id').values_list(
+            'job_id', 'printings', 'quantity', 'revenue'))
+
+    def workload(self):
+        return list(ModeratorWorkload.objects.order_by('moderator_id')
+                    .values_list('moderator_id', 'formed', 'completed',
+                                 'revenue'))
+
+    def test_refresh(self):
+        today = timezone.localdate()
+        printing_id = self.complete({self.laser.id: 2, self.print3d.id: 1})
+        set_quantities(self.other.pk, {self.laser.id: 1})
+        form_draft(self.other.pk)
+        out = StringIO()
+        call_command('refresh_rollups', stdout=out)
+        self.assertRegex(out.getvalue(), r'^1 days rebuilt, refreshed to ')
+        self.assertEqual(self.sales(), [(self.laser.id, 1, 2, 1800),
+                                        (self.print3d.id, 1, 1, 500)])
+        self.assertEqual(self.workload(), [(None, 1, 0, 0),
+                                           (self.staff.id, 1, 1, 2300)])
+        self.assertEqual(set(JobSales.objects.values_list('day', flat=True)),
+                         {today})
+        self.assertEqual(refresh(), [])
+        self.client.force_login(self.author)
+        self.client.post(reverse('delete_printing', args=[printing_id]))
+        self.assertEqual(refresh(), [today])
+        self.assertEqual(self.sales(), [])
+        self.assertEqual(self.workload(), [(None, 1, 0, 0)])
+
+    def test_archived_printings_are_counted(self):
+        self.complete({self.laser.id: 3})
+        refresh()
+        archive_batch(timezone.now() + timedelta(days=1))
+        self.assertFalse(Printing.all_objects.exists())
+        refresh(full=True)
+        self.assertEqual(self.sales(), [(self.laser.id, 1, 3, 2700)])
+        self.assertEqual(self.workload(), [(self.staff.id, 1, 1, 2700)])
+
+    def test_day_runs(self):
+        days = [timezone.localdate() + timedelta(days=n)
+                for n in (0, 1, 2, 5, 6)]
+        self.assertEqual(day_runs(days, 31), [(days[0], days[2]),
+                                              (days[3], days[4])])
+        self.assertEqual(day_runs(days[:3], 2), [(days[0], days[1]),
+                                                 (days[2], days[2])])
+
+    def test_reports_read_rollups_only(self):
+        self.complete({self.laser.id: 2})
+        refresh()
+        self.client.force_login(self.staff)
+        with CaptureQueriesContext(db_connection) as queries:
+            response = self.client.get(reverse('sales_report'),
+                                       {'by': 'job'})
+        self.assertEqual(response.json()['rows'], [
+            {'job_id': self.laser.id, 'printings': 1, 'quantity': 2,
+             'revenue': 1800}])
+        self.assertFalse([query for query in queries
+                          if '"jobs_printing' in query['sql']])
+        response = self.client.get(reverse('workload_report'),
+                                   {'moderator': self.staff.id})
+        row, = response.json()['rows']
+        self.assertEqual((row['day'], row['completed']),
+                         (timezone.localdate().isoformat(), 1))
+        self.assertEqual(self.client.get(reverse('sales_report'), {
+            'from': '2020-01-01', 'to': '2026-01-01'}).status_code, 400)
+        self.client.force_login(self.author)
+        self.assertEqual(
+            self.client.get(reverse('sales_report')).status_code, 403)
+
+
+class TaskTests(TransactionTestCase):
+    def setUp(self):
+        calls.clear()
+
+    def test_worker(self):
+        record_call.delay(1)
+        record_call.delay(2, key='two')
+        self.assertIsNone(record_call.delay(3, key='two'))
+        with transaction.atomic():
+            record_call.delay(4)
+            transaction.set_rollback(True)
+        self.assertEqual(Task.objects.filter(status='queued').count(), 2)
+        out = StringIO()
+        call_command('run_tasks', '--once', '--workers', '2', stdout=out)
+        self.assertEqual(sorted(calls), [1, 2])
+        self.assertEqual(out.getvalue(), '2 tasks done, 0 attempts failed\n')
+        self.assertEqual(set(Task.objects.values_list('status', flat=True)),
+                         {'done'})
+
+    def test_retry_with_backoff(self):
+        queued = record_call.delay(1, True)
+        [claimed] = claim(10)
+        self.assertEqual(claim(10), [])
+        self.assertFalse(run_task(claimed))
+        queued.refresh_from_db()
+        self.assertEqual((queued.status, queued.attempts), ('queued', 1))
+        self.assertGreater(queued.run_at, timezone.now())
+        self.assertIn('ValueError: 1', queued.last_error)
+        self.assertEqual(claim(10), [])
+        Task.objects.update(run_at=timezone.now())
+        self.assertFalse(run_task(claim(10)[0]))
+        queued.refresh_from_db()
+        self.assertEqual((queued.status, queued.attempts), ('failed', 2))
+
+    def test_notifications(self):
+        user = User.objects.create_user('client', email='client@example.com')
+        staff = User.objects.create_user('moderator', is_staff=True)
+        job = Job.objects.create(name='Job', info='', price=10,
+                                 status='visible')
+        set_quantities(user.pk, {job.id: 1})
+        printing_id = form_draft(user.pk)
+        transition('complete', [printing_id], staff.pk)
+        transition('complete', [printing_id], staff.pk)
+        self.assertEqual(Task.objects.filter(name__endswith='notify_author')
+                         .count(), 2)
+        call_command('run_tasks', '--once', stdout=StringIO())
+        self.assertEqual(Task.objects.filter(name__endswith='notify_author')
+                         .exclude(status='done').count(), 0)
+        # Run by two threads, in either order.
+        self.assertEqual(sorted(message.body for message in mail.outbox), [
+            'Заявка №%s выполнена.' % printing_id,
+            'Заявка №%s сформирована и ждёт модерации.' % printing_id,
+        ])
+
+
+class AuthTests(CatalogTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('visitor')
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.user)
+
+    def user_queries(self):
+        with CaptureQueriesContext(db_connection) as queries:
+            response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, 403)
+        return [query['sql'] for query in queries
+                if User._meta.db_table in query['sql']]
+
+    def test_user_is_cached(self):
+        self.assertEqual(len(self.user_queries()), 1)
+        self.assertEqual(self.user_queries(), [])
+
+    def test_saved_user_is_reloaded(self):
+        self.user_queries()
+        self.user.is_staff = True
+        self.user.save()
+        self.assertEqual(self.client.get(reverse('metrics')).status_code,
+                         200)
+
+    def test_password_change_logs_out(self):
+        self.user_queries()
+        self.user.set_password('another password')
+        self.user.save()
+        response = self.client.get(reverse('metrics'))
+        self.assertFalse(response.wsgi_request.user.is_authenticated)
+
+    def test_model_backend_sessions_still_resolve(self):
+        session = self.client.session
+        session[BACKEND_SESSION_KEY] = (
+            'django.contrib.auth.backends.ModelBackend')
+        session.save()
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.wsgi_request.user, self.user)
+
+    def test_failed_login_hashes_once(self):
+        self.user.set_password('secret')
+        self.user.save()
+        hasher = LimitedArgon2PasswordHasher
+        with mock.patch.object(hasher, 'verify', autospec=True,
+                               side_effect=hasher.verify) as verify:
+            self.assertIsNone(authenticate(username='visitor',
+                                           password='wrong'))
+            self.assertEqual(verify.call_count, 1)
+            self.assertEqual(authenticate(username='visitor',
+                                          password='secret'), self.user)
+
+    def test_limited_hasher(self):
+        encoded = make_password('secret')
+        self.assertTrue(encoded.startswith('argon2$'))
+        self.assertTrue(check_password('secret', encoded))
+        self.assertFalse(check_password('wrong', encoded))
+        hasher = LimitedArgon2PasswordHasher()
+        with ThreadPoolExecutor(4) as pool:
+            self.assertEqual(list(pool.map(
+                lambda password: hasher.verify(password, encoded),
+                ['secret', 'wrong'] * 2)), [True, False] * 2)
+
+
+class AdminTests(CatalogTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin')
+        cls.clients = User.objects.bulk_create(
+            User(username='client-%d' % i) for i in range(3))
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.admin)
+
+    def seed(self, count):
+        jobs = Job.objects.bulk_create(
+            Job(name='Job %d' % i, info='', price=i, status='visible')
+            for i in range(count))
+        printings = Printing.objects.bulk_create(
+            Printing(author=self.clients[i % 3], moderator=self.admin,
+                     status='formed', formed_at=timezone.now())
+            for i in range(count))
+        PrintingJob.objects.bulk_create(
+            PrintingJob(printing=printing, job=job, quantity=1)
+            for printing, job in zip(printings, jobs))
+
+    def changelist_queries(self, model, **params):
+        url = reverse('admin:jobs_%s_changelist' % model)
+        with CaptureQueriesContext(db_connection) as queries:
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_changelist_queries_are_capped(self):
+        pages = [('job', {}), ('printing', {}),
+                 ('printing', {'status__exact': 'formed'}),
+                 ('printing', {'q': 'client-1'}), ('printingjob', {}),
+                 ('printingjob', {'q': '1'}), ('job', {'q': 'Job 1'}),
+                 ('archivedprinting', {}), ('task', {'q': '1 x'})]
+        self.seed(3)
+        # Loads the user into the user cache.
+        self.changelist_queries('job')
+        few = [self.changelist_queries(model, **params)
+               for model, params in pages]
+        self.seed(40)
+        many = [self.changelist_queries(model, **params)
+                for model, params in pages]
+        self.assertEqual(few, many)
+        # count, page rows and a savepoint pair at most
+        self.assertLessEqual(max(many), 4)
+
+    def test_exact_search(self):
+        self.seed(3)
+        job = Job.objects.first()
+        job.code = 'LZR'
+        job.save()
+        printing = Printing.objects.first()
+
+        def search(model, term):
+            url = reverse('admin:jobs_%s_changelist' % model)
+            with CaptureQueriesContext(db_connection) as queries:
+                response = self.client.get(url, {'q': term})
+            self.assertFalse([query for query in queries
+                              if 'UPPER' in query['sql']])
+            return list(response.context['cl'].result_list)
+
+        self.assertEqual(search('job', 'LZR'), [job])
+        self.assertEqual(search('job', 'lzr'), [])
+        self.assertEqual(search('printing', str(printing.id)), [printing])
+        self.assertEqual(search('printing', 'client-0'),
+                         list(Printing.objects.filter(
+                             author__username='client-0').order_by('-id')))
+        self.assertEqual(search('printing', '99999999999999999999'), [])
+        self.assertEqual(search('printingjob', 'LZR'),
+                         list(PrintingJob.objects.filter(job=job)))
+
+    def test_deleted_rows_listed(self):
+        Job.objects.create(name='Deleted job', info='', price=1,
+                           status='deleted')
+        response = self.client.get(reverse('admin:jobs_job_changelist'),
+                                   {'status__exact': 'deleted'})
+        self.assertContains(response, 'Deleted job')
+
+    def test_estimated_count(self):
+        self.seed(3)
+        with mock.patch('jobs.admin.estimated_count', return_value=50000):
+            response = self.client.get(
+                reverse('admin:jobs_printing_changelist'))
+        self.assertEqual(response.context['cl'].result_count, 50000)
+
+    def test_autocomplete(self):
+        self.seed(3)
+        response = self.client.get(reverse('admin:autocomplete'), {
+            'app_label': 'jobs', 'model_name': 'printingjob',
+            'field_name': 'job', 'term': 'Job 1'})
+        self.assertEqual([row['text'] for row in response.json()['results']],
+                         ['Job 1'])
+
+
+class InstrumentationTests(CatalogTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.job = Job.objects.create(name='Laser cutting', info='', price=900,
+                                     status='visible')
+        cls.staff = User.objects.create_user('staff', password='password',
+                                             is_staff=True)
+
+    def setUp(self):
+        super().setUp()
+        reset_metrics()
+
+    def test_counts_queries_and_duplicates(self):
+        with instrument() as metrics:
+            for job_id in (1, 2, 3):
+                Job.objects.filter(pk=job_id).first()
+            Printing.objects.count()
+            engines['django'].from_string('{{ job }}').render(
+                {'job': self.job})
+        self.assertEqual(metrics.queries, 4)
+        self.assertEqual(metrics.duplicates, 2)
+        self.assertEqual(metrics.duplicate_statements()[0][1], 3)
+        self.assertGreater(metrics.db_ms, 0)
+        self.assertGreater(metrics.render_ms, 0)
+        self.assertGreaterEqual(metrics.total_ms,
+                                metrics.db_ms + metrics.render_ms)
+
+    @override_settings(JOBS_SERVER_TIMING=True)
+    def test_server_timing(self):
+        response = self.client.get(reverse('job', args=[self.job.id]))
+        self.assertRegex(response['Server-Timing'],
+                         r'^db;dur=[\d.]+;desc="1 queries, 0 duplicates", '
+                         r'tpl;dur=[\d.]+, total;dur=[\d.]+$')
+
+    @override_settings(JOBS_SERVER_TIMING=False, JOBS_METRICS_TOKEN='secret')
+    def test_server_timing_needs_the_token(self):
+        url = reverse('job', args=[self.job.id])
+        self.assertNotIn('Server-Timing', self.client.get(url))
+        response = self.client.get(url, headers={
+            'authorization': 'Bearer secret'})
+        self.assertIn('Server-Timing', response)
+
+    def test_prometheus_endpoint(self):
+        self.client.get(reverse('index'))
+        self.client.get(reverse('index'))
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+        self.client.force_login(self.staff)
+        text = self.client.get(reverse('metrics')).content.decode()
+        self.assertIn('jobs_request_duration_seconds_count{view="index"} 2',
+                      text)
+        self.assertIn('jobs_queries_total{view="index"}', text)
+        self.client.logout()
+        with self.settings(JOBS_METRICS_TOKEN='secret'):
+            response = self.client.get(reverse('metrics'), headers={
+                'authorization': 'Bearer secret'})
+        self.assertEqual(response.status_code, 200)
+
+    def test_slow_requests_are_sampled(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = Path(directory) / 'slow.jsonl'
+            with self.settings(JOBS_SLOW_REQUEST_LOG=str(path),
+                               JOBS_SLOW_REQUEST_MS=0):
+                self.client.get(reverse('index'), {'job_name': 'laser'})
+                with self.settings(JOBS_SLOW_REQUEST_SAMPLE=0):
+                    self.client.get(reverse('index'))
+            lines = path.read_text(encoding='utf-8').splitlines()
+        self.assertEqual(len(lines), 1)
+        entry = json.loads(lines[0])
+        self.assertEqual(entry['view'], 'index')
+        self.assertEqual(entry['path'], '/?job_name=laser')
+        self.assertGreater(entry['queries'], 0)
+
+
+class BenchmarkTests(CatalogTestCase):
+    def test_seed(self):
+        call_command('seed_bench', jobs=40, users=4, printings=12,
+                     max_lines=3, stdout=StringIO())
+        self.assertEqual(Job.all_objects.count(), 40)
+        self.assertEqual(Printing.objects.filter(status='draft').count(), 4)
+        self.assertEqual(Printing.all_objects.count(), 12)
+        self.assertFalse(stale_totals(Printing.all_objects.all()).exists())
+        lines = PrintingJob.objects.exclude(printing__status='draft')
+        self.assertFalse(lines.filter(price=None).exists())
+
+    def test_views_and_compare(self):
+        seed_jobs(10)
+        with tempfile.TemporaryDirectory() as directory:
+            baseline = Path(directory) / 'baseline.json'
+            candidate = Path(directory) / 'candidate.json'
+            call_command('bench_views', repeat=2, warmup=1,
+                         json=str(baseline), stdout=StringIO())
+            results = json.loads(baseline.read_text(encoding='utf-8'))
+            self.assertEqual(results['database'], db_connection.vendor)
+            self.assertEqual(results['results']['job_detail anonymous']
+                             ['queries'], 0)
+            self.assertEqual(User.objects.count(), 0)
+            results['results']['index']['queries'] += 1
+            candidate.write_text(json.dumps(results), encoding='utf-8')
+            call_command('bench_compare', baseline, baseline, fail=True,
+                         stdout=StringIO())
+            with self.assertRaisesMessage(CommandError, 'index.queries'):
+                call_command('bench_compare', baseline, candidate, fail=True,
+                             stdout=StringIO())
+
+
+class QueryPlanTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        seed_jobs(20_000)
+        cls.user_ids = seed_users(2_000)
+        seed_printings(cls.user_ids, 20_000)
+        analyze()
+
+    def assertIndexScan(self, queryset, index):
+        self.assertIn(index, used_indexes(queryset))
+        self.assertFalse(full_scans(queryset))
+
+    def test_one_draft_per_author(self):
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Printing.objects.create(author_id=self.user_ids[0])
+        Printing.objects.create(author_id=self.user_ids[0], status='formed')
+
+    def test_cart_lookup(self):
+        self.assertIndexScan(
+            Printing.objects.filter(author_id=self.user_ids[0],
+                                    status='draft')
+            .values_list('id', 'printingjob__job_id'),
+            'jobs_printing_one_draft',
+        )
+
+    def test_moderator_queue(self):
+        self.assertIndexScan(
+            Printing.objects.filter(status='formed')
+            .order_by('formed_at', 'id')[:50],
+            'jobs_printing_formed_queue',
+        )
+
+    def test_catalog_pages(self):
+        self.assertIndexScan(
+            Job.objects.order_by('price', 'id')[:25],
+            'jobs_job_live_price',
+        )
+
+
+@skipUnlessDBFeature('has_select_for_update')
+class ConcurrentCartTests(TransactionTestCase):
+    threads = 8
+
+    def setUp(self):
+        caches[settings.JOBS_CACHE_ALIAS].clear()
+        self.user = User.objects.create_user('client', password='password')
+        self.jobs = Job.objects.bulk_create(
+            Job(name='Job %d' % i, info='', price=100, status='visible')
+            for i in range(self.threads)
+        )
+
+    def fire(self, requests):
+        barrier = threading.Barrier(len(requests))
+
+        def worker(request):
+            client = Client()
+            client.force_login(self.user)
+            try:
+                barrier.wait()
+                return request(client).status_code
+            finally:
+                db_connection.close()
+
+        with ThreadPoolExecutor(len(requests)) as pool:
+            return list(pool.map(worker, requests))
+
+    def test_parallel_adds_share_one_draft(self):
+        codes = self.fire([
+            lambda client, job=job: client.post(
+                reverse('add_to_printing', args=[job.id]))
+            for job in self.jobs
+        ])
+        self.assertEqual(codes, [302] * self.threads)
+        draft = Printing.objects.get(author=self.user, status='draft')
+        self.assertEqual(draft.printingjob_set.count(), self.threads)
+        self.assertEqual(get_cart(self.user).job_ids,
+                         {job.id for job in self.jobs})
+
+    def test_parallel_bulk_adds(self):
+        codes = self.fire([
+            lambda client, quantity=quantity: client.post(
+                reverse('add_many_to_printing'),
+                {'jobs': [{'id': job.id, 'quantity': quantity}
+                          for job in self.jobs]},
+                content_type='application/json')
+            for quantity in range(1, self.threads + 1)
+        ])
+        self.assertEqual(codes, [200] * self.threads)
+        draft = Printing.objects.get(author=self.user, status='draft')
+        quantities = set(draft.printingjob_set.values_list('quantity',
+                                                           flat=True))
+        self.assertEqual(len(quantities), 1)
+        self.assertEqual(get_cart(self.user).job_ids,
+                         {job.id for job in self.jobs})
+
+
+@override_settings(ROOT_URLCONF='fablab.async_urls')
+class AsyncViewsTests(CatalogTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('client', password='password')
+        cls.jobs = Job.objects.bulk_create(
+            Job(name='Job %d' % i, info='Info %d' % i, price=100 * i,
+                status='visible')
+            for i in range(30)
+        )
+
+    def setUp(self):
+        super().setUp()
+        self.async_client.force_login(self.user)
+        self.client.force_login(self.user)
+
+    def sync_get(self, url, **params):
+        with override_settings(ROOT_URLCONF='fablab.urls'):
+            return self.client.get(url, params)
+
+    def strip_tokens(self, response):
+        content = re.sub(r'csrfmiddlewaretoken" value="[^"]+"', '',
+                         response.content.decode())
+        # Only the ASGI URLconf has the events stream to subscribe to.
+        content = re.sub(r'<script>.*?EventSource.*?</script>', '', content,
+                         flags=re.S)
+        return re.sub(r'\n\s*\n', '\n', content)
+
+    async def assertSameAsSync(self, url, **params):
+        response = await self.async_client.get(url, params)
+        expected = await sync_to_async(self.sync_get)(url, **params)
+        self.assertEqual(response.status_code, expected.status_code)
+        self.assertEqual(self.strip_tokens(response),
+                         self.strip_tokens(expected))
+        return response
+
+    async def test_catalog(self):
+        await self.assertSameAsSync(reverse('index'))
+        await self.assertSameAsSync(reverse('index'), job_name='job 1')
+        response = await self.assertSameAsSync(reverse('jobs_page'), size=5,
+                                               order='price')
+        self.assertEqual(len(response.json()['results']), 5)
+        await self.assertSameAsSync(reverse('job', args=[self.jobs[3].id]))
+
+    async def test_cart_flow(self):
+        for job in self.jobs[:3]:
+            response = await self.async_client.post(
+                reverse('add_to_printing', args=[job.id]))
+            self.assertEqual(response.status_code, 302)
+        await self.async_client.post(
+            reverse('add_to_printing', args=[self.jobs[0].id]))
+        draft = await Printing.objects.aget(author=self.user, status='draft')
+        response = await self.assertSameAsSync(reverse('printing',
+                                                       args=[draft.id]))
+        self.assertContains(response, 'Job 2')
+        self.assertNotContains(response, 'Job 0<')
+        cart = await sync_to_async(get_cart)(self.user)
+        self.assertEqual(cart.job_ids, {self.jobs[1].id, self.jobs[2].id})
+
+        await self.async_client.post(reverse('delete_printing',
+                                             args=[draft.id]))
+        response = await self.async_client.get(reverse('printing',
+                                                       args=[draft.id]))
+        self.assertEqual(response.status_code, 404)
+        cart = await sync_to_async(get_cart)(self.user)
+        self.assertIsNone(cart.id)
+
+    async def test_anonymous_conditional_get(self):
+        await self.async_client.alogout()
+        url = reverse('index')
+        etag = (await self.async_client.get(url))['ETag']
+        response = await self.async_client.get(
+            url, headers={'if-none-match': etag})
+        self.assertEqual(response.status_code, 304)
+
+    @override_settings(JOBS_INDEX_STREAMING=True, JOBS_STREAM_CHUNK_SIZE=7)
+    async def test_streaming_index(self):
+        response = await self.async_client.get(reverse('index'))
+        content = b''.join([chunk async for chunk in
+                            response.streaming_content]).decode()
+        self.assertEqual(content.count('class="card-container"'), 30)
+        self.assertIn('</html>', content)
+
+
+def parse_event(event):
+    name, data = event.split('\n', 1)
+    return name[len('event: '):], json.loads(data[len('data: '):])
+
+
+@override_settings(ROOT_URLCONF='fablab.async_urls')
+class EventsTests(CatalogTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.job = Job.objects.create(name='Laser cutting', info='', price=900,
+                                     status='visible')
+        cls.author = User.objects.create_user('author')
+        cls.other = User.objects.create_user('other')
+        cls.staff = User.objects.create_user('staff', is_staff=True)
+
+    def form(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            set_quantities(self.author.pk, {self.job.id: 2})
+            return form_draft(self.author.pk)
+
+    def complete(self, printing_id):
+        with self.captureOnCommitCallbacks(execute=True):
+            transition('complete', [printing_id], self.staff.pk)
+
+    async def events(self, subscription, count):
+        return [parse_event(await asyncio.wait_for(subscription.get(), 1))
+                for i in range(count)]
+
+    async def test_status_and_queue_events(self):
+        author = subscribe(user_channels(self.author))
+        staff = subscribe(user_channels(self.staff))
+        other = subscribe(user_channels(self.other))
+        printing_id = await sync_to_async(self.form)()
+        draft, formed = await self.events(author, 2)
+        self.assertEqual(draft[1]['total_price'], 1800)
+        self.assertEqual(formed, ('printing', {
+            'id': printing_id, 'status': 'formed',
+            'status_display': 'Сформирована', 'total_price': 1800,
+            'item_count': 2}))
+        (name, added), = await self.events(staff, 1)
+        self.assertEqual((name, added['action'], added['id'],
+                          added['author_id']),
+                         ('queue', 'added', printing_id, self.author.pk))
+        await sync_to_async(self.complete)(printing_id)
+        (name, completed), = await self.events(author, 1)
+        self.assertEqual(completed['status'], 'complete')
+        self.assertEqual(await self.events(staff, 1), [
+            ('queue', {'action': 'removed', 'id': printing_id})])
+        self.assertTrue(other.queue.empty())
+        for subscription in (author, staff, other):
+            subscription.close()
+        self.assertFalse(broker.active())
+
+    def delete(self, printing_id):
+        with self.captureOnCommitCallbacks(execute=True):
+            mark_deleted(printing_id)
+
+    async def test_only_formed_deletions_leave_the_queue(self):
+        draft_id = await sync_to_async(set_quantities)(self.author.pk,
+                                                        {self.job.id: 1})
+        staff = subscribe(user_channels(self.staff))
+        await sync_to_async(self.delete)(draft_id)
+        printing_id = await sync_to_async(self.form)()
+        await sync_to_async(self.delete)(printing_id)
+        self.assertEqual([(data['action'], data['id'])
+                          for name, data in await self.events(staff, 2)],
+                         [('added', printing_id), ('removed', printing_id)])
+        self.assertTrue(staff.queue.empty())
+        staff.close()
+
+    async def test_publish_errors_are_logged(self):
+        author = subscribe(user_channels(self.author))
+        with mock.patch('jobs.events.publish', side_effect=ValueError), \
+                self.assertLogs('django', 'ERROR'):
+            printing_id = await sync_to_async(self.form)()
+        printing = await Printing.objects.aget(pk=printing_id)
+        self.assertEqual(printing.status, 'formed')
+        author.close()
+
+    @override_settings(JOBS_EVENTS_QUEUE_SIZE=2)
+    async def test_slow_client_is_dropped(self):
+        stream = event_stream(['author:1'])
+        self.assertEqual(await anext(stream), 'retry: 5000\n\n')
+        for event in ('a', 'b', 'c'):
+            broker.deliver('author:1 %s' % event)
+        self.assertEqual([event async for event in stream], ['b'])
+        self.assertFalse(broker.active())
+
+    async def test_events_application(self):
+        await self.async_client.aforce_login(self.author)
+        cookie = '%s=%s' % (
+            settings.SESSION_COOKIE_NAME,
+            self.async_client.cookies[settings.SESSION_COOKIE_NAME].value)
+        application = EventsApplication(None)
+        disconnect = asyncio.Event()
+        sent = []
+
+        async def receive():
+            await disconnect.wait()
+            return {'type': 'http.disconnect'}
+
+        async def send(message):
+            sent.append(message)
+
+        async def wait_for_messages(count):
+            while len(sent) < count:
+                await asyncio.sleep(0.01)
+
+        serving = asyncio.ensure_future(application(
+            {'type': 'http', 'path': reverse('events'),
+             'headers': [(b'cookie', cookie.encode())]}, receive, send))
+        await asyncio.wait_for(wait_for_messages(2), 1)
+        await sync_to_async(self.form)()
+        await asyncio.wait_for(wait_for_messages(4), 1)
+        disconnect.set()
+        await serving
+        self.assertEqual(sent[0]['status'], 200)
+        self.assertIn((b'content-type', b'text/event-stream'),
+                      sent[0]['headers'])
+        name, formed = parse_event(sent[3]['body'].decode())
+        self.assertEqual(formed['status'], 'formed')
+        self.assertFalse(broker.active())
+
+        sent.clear()
+        await application({'type': 'http', 'path': reverse('events'),
+                           'headers': []}, receive, send)
+        self.assertEqual(sent[0]['status'], 403)
+        response = await self.async_client.get(reverse('events'))
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        await self.async_client.alogout()
+        response = await self.async_client.get(reverse('events'))
+        self.assertEqual(response.status_code, 403)
+
+
+class RouterTests(SimpleTestCase):
+    router = CatalogReplicaRouter()
+
+    def setUp(self):
+        # No recent catalog change from other tests.
+        caches[settings.JOBS_CACHE_ALIAS].clear()
+
+    def test_catalog_views_read_jobs_from_replica(self):
+        @catalog_reads
+        def view():
+            return (self.router.db_for_read(Job),
+                    self.router.db_for_read(Printing))
+
+        self.assertEqual(view(), ('replica', None))
+        self.assertIsNone(self.router.db_for_read(Job))
+
+    def test_async_catalog_views(self):
+        @catalog_reads
+        async def view():
+            return self.router.db_for_read(Job)
+
+        self.assertEqual(async_to_sync(view)(), 'replica')
+        self.assertIsNone(self.router.db_for_read(Job))
+
+    def test_writes_and_migrations_stay_on_default(self):
+        self.assertEqual(self.router.db_for_write(Job), 'default')
+        self.assertTrue(self.router.allow_migrate('default', 'jobs'))
+        self.assertFalse(self.router.allow_migrate('replica', 'jobs'))
+
+
+class DatabaseSettingsTests(SimpleTestCase):
+    def test_url_options_are_kept(self):
+        config = database('postgres://user:secret@db:5432/fablab'
+                          '?sslmode=require&connect_timeout=5')
+        self.assertEqual(config['OPTIONS']['sslmode'], 'require')
+        self.assertEqual(config['OPTIONS']['connect_timeout'], 5)
+        self.assertIn('pg_trgm.word_similarity_threshold',
+                      config['OPTIONS']['options'])
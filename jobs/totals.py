@@ -0,0 +1,101 @@
+from django.core.exceptions import EmptyResultSet
+from django.db import connections
+from django.db.models import F, OuterRef, Q, QuerySet, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.db.models.sql import UpdateQuery
+from django.utils import timezone
+
+from jobs.events import EVENT_COLUMNS, printing_changed
+from jobs.models import Job, Printing, PrintingJob
+
+# Printing.total_price and item_count are kept in step with the PrintingJob
+# rows: raw SQL cart writes adjust them by the changed line, everything else
+# recomputes the affected printings. Draft lines are priced at the live
+# Job.price, formed ones at the PrintingJob.price snapshot.
+ADJUST_TOTALS = '''
+    UPDATE jobs_printing
+    SET item_count = item_count + %s,
+        total_price = COALESCE(total_price, 0)
+                      + %s * (SELECT price FROM jobs_job WHERE id = %s)
+    WHERE id = %s
+    RETURNING ''' + EVENT_COLUMNS
+
+
+def adjust_totals(cursor, printing_id, job_id, quantity):
+    """
+    Add ``quantity`` (negative to remove) of a job to a draft's totals and
+    return its EVENT_COLUMNS.
+    """
+    cursor.execute(ADJUST_TOTALS, [quantity, quantity, job_id, printing_id])
+    return cursor.fetchone()
+
+
+def line_totals():
+    lines = (PrintingJob.objects.filter(printing_id=OuterRef('pk'))
+             .order_by().values('printing_id'))
+    quantity = Coalesce('quantity', Value(0))
+    amount = lines.annotate(
+        total=Sum(quantity * Coalesce('price', 'job__price'))
+    ).values('total')
+    items = lines.annotate(total=Sum(quantity)).values('total')
+    return {
+        'expected_price': Coalesce(Subquery(amount), Value(0)),
+        'expected_count': Coalesce(Subquery(items), Value(0)),
+    }
+
+
+def stale_totals(queryset):
+    """Printings of ``queryset`` whose stored totals disagree with lines."""
+    return queryset.annotate(**line_totals()).filter(
+        ~Q(total_price=F('expected_price'))
+        | ~Q(item_count=F('expected_count'))
+        | Q(total_price__isnull=True)
+    )
+
+
+def recompute_totals(printings, returning=False):
+    """
+    Recompute the totals of ``printings`` (queryset or ids) at once. Return
+    the number of rows, or with ``returning`` their EVENT_COLUMNS.
+    """
+    if not isinstance(printings, QuerySet):
+        printings = Printing.all_objects.filter(pk__in=printings)
+    totals = line_totals()
+    values = {'total_price': totals['expected_price'],
+              'item_count': totals['expected_count'],
+              'updated_at': timezone.now()}
+    if not returning:
+        return printings.update(**values)
+    # QuerySet.update() with a RETURNING clause, still one statement.
+    query = printings.query.chain(UpdateQuery)
+    query.add_update_values(values)
+    try:
+        sql, params = query.get_compiler(printings.db).as_sql()
+    except EmptyResultSet:
+        return []
+    with connections[printings.db].cursor() as cursor:
+        cursor.execute('%s RETURNING %s' % (sql, EVENT_COLUMNS), params)
+        return cursor.fetchall()
+
+
+def freeze_prices(printing_id):
+    """
+    Snapshot the current Job.price into every line of the printing and
+    return its EVENT_COLUMNS.
+    """
+    PrintingJob.objects.filter(printing_id=printing_id).update(
+        price=Subquery(Job.all_objects.filter(pk=OuterRef('job_id'))
+                       .values('price')[:1])
+    )
+    return recompute_totals([printing_id], returning=True)[0]
+
+
+def reprice_drafts(sender, instance, created=False, **kwargs):
+    # Drafts follow the live price; formed printings keep their snapshot.
+    # Not a task: cart removals subtract the live price from the stored
+    # total, so it has to be repriced by the time Job.save returns.
+    if not created:
+        printing_changed(recompute_totals(
+            Printing.objects.filter(status='draft',
+                                    printingjob__job_id=instance.pk),
+            returning=True))
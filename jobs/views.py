@@ -1,34 +1,213 @@
-from django.db import IntegrityError, connection
-from django.db.models import F
-from django.http import HttpResponse
+import json
+from datetime import date, timedelta
+from itertools import islice
+
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
+from django.db import connection
+from django.db.models import Value
+from django.db.models.functions import Coalesce
+from django.http import (Http404, HttpResponse, HttpResponseBadRequest,
+                         HttpResponseForbidden, JsonResponse,
+                         StreamingHttpResponse)
+from django.middleware.csrf import get_token
 from django.shortcuts import render, redirect
+from django.template.loader import render_to_string
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import require_POST
 
+from jobs.cache import (CSRF_PLACEHOLDER, cache_stats as get_cache_stats,
+                        cached_job, cached_page, cached_page_response,
+                        catalog_version, forget_printing_page, page_cacheable,
+                        printing_page_key, render_cards)
+from jobs.cart import (forget_cart, form_draft, get_cart, set_quantities,
+                       toggle_job)
+from jobs.events import EVENT_COLUMNS, printing_changed
+from jobs.images import media_url, sources as image_sources
+from jobs.instrumentation import has_metrics_token, prometheus_text
 from jobs.models import Job, Printing, PrintingJob
+from jobs.moderation import (QUEUE_ORDERING, moderation_queue, parse_ids,
+                             queue_json, transition)
+from jobs.pagination import (ORDERINGS, SEARCH_ORDERING, InvalidCursor,
+                             clamp_page_size, paginate)
+from jobs.rollups import (MAX_REPORT_DAYS, refreshed_to, sales_report,
+                          workload_report)
+from jobs.routers import catalog_reads
+from jobs.search import normalize, search_jobs
 
-def index(request):
-    job_name = request.GET.get('job_name', '').lower()
-    jobs = Job.objects.filter(name__icontains=job_name).exclude(
-        status='deleted')
-    draft = Printing.objects.filter(author=request.user,
-                                    status='draft').first()
-    if draft:
-        draft_jobs = PrintingJob.objects.filter(printing=draft).values_list(
-            'id', flat=True)
+STREAM_MARKER = '<!-- job cards -->'
+MAX_BULK_JOBS = 100
+# Moderated printings no longer change: their page is cached.
+FINAL_STATUSES = ('complete', 'rejected')
+
+
+def catalog(request):
+    job_name = request.GET.get('job_name', '')
+    jobs = search_jobs(Job.objects.all(), job_name)
+    if normalize(job_name):
+        ordering = SEARCH_ORDERING
     else:
-        draft_jobs = []
+        ordering = ORDERINGS.get(request.GET.get('order'), ORDERINGS['id'])
+    return jobs, ordering
+
+
+def page_args(request):
+    jobs, ordering = catalog(request)
+    cursor = request.GET.get('cursor')
+    size = clamp_page_size(request.GET.get('size'))
+    params = (normalize(request.GET.get('job_name', '')), ordering, cursor,
+              size)
+    return jobs, ordering, cursor, size, params
+
+
+def catalog_page(request, version):
+    jobs, ordering, cursor, size, params = page_args(request)
+    return cached_page(version, params,
+                       lambda: paginate(jobs, ordering, cursor, size))
+
+
+def stream_index(request, context, jobs, version):
+    page = render_to_string('index.html',
+                            {**context, 'stream_marker': STREAM_MARKER},
+                            request)
+    head, tail = page.split(STREAM_MARKER)
+    csrf_token = get_token(request)
+
+    def chunks():
+        yield head
+        size = settings.JOBS_STREAM_CHUNK_SIZE
+        rows = jobs.iterator(chunk_size=size)
+        while batch := list(islice(rows, size)):
+            yield ''.join(render_cards(version, batch, csrf_token))
+        yield tail
+
+    return StreamingHttpResponse(chunks())
+
+
+def render_index(request, context, jobs, ordering, version, csrf_token):
+    try:
+        page, next_cursor = catalog_page(request, version)
+    except InvalidCursor:
+        page, next_cursor = paginate(jobs, ordering)
     return render(
         request,
         'index.html',
-        context={'jobs': jobs,
-                 'draft': draft,
-                 'draft_jobs': draft_jobs}
+        context={**context,
+                 'jobs': page,
+                 'cards': render_cards(version, page, csrf_token),
+                 'next_cursor': next_cursor,
+                 'csrf_token': csrf_token}
     )
 
 
-def job_detail(request, pk):
-    job = Job.objects.get(pk=pk)
-    if job.status == 'deleted':
-        return redirect('/')
+@catalog_reads
+def index(request):
+    jobs, ordering = catalog(request)
+    context = {'cart': get_cart(request.user)}
+    version = catalog_version()
+    if settings.JOBS_INDEX_STREAMING:
+        return stream_index(request, context, jobs.order_by(*ordering),
+                            version)
+    if page_cacheable(request, request.user):
+        return cached_page_response(request, version, lambda: render_index(
+            request, context, jobs, ordering, version, CSRF_PLACEHOLDER))
+    return render_index(request, context, jobs, ordering, version,
+                        get_token(request))
+
+
+def page_json(page, next_cursor):
+    return {
+        'results': [
+            {'id': job.id,
+             'name': job.name,
+             'price': job.price,
+             'image': media_url(job.image),
+             'sources': [{'type': mime, 'srcset': srcset}
+                         for mime, srcset in image_sources(job)],
+             'url': reverse('job', args=[job.id]),
+             'add_url': reverse('add_to_printing', args=[job.id])}
+            for job in page
+        ],
+        'next_cursor': next_cursor,
+    }
+
+
+@catalog_reads
+def jobs_page(request):
+    try:
+        page, next_cursor = catalog_page(request, catalog_version())
+    except InvalidCursor:
+        return HttpResponseBadRequest('Invalid cursor')
+    return JsonResponse(page_json(page, next_cursor))
+
+
+@staff_member_required
+def cache_stats(request):
+    return JsonResponse(get_cache_stats())
+
+
+def report_args(request, groups, key):
+    """(first, last, id, by) of a report request; ValueError if invalid."""
+    last = request.GET.get('to')
+    last = date.fromisoformat(last) if last else timezone.localdate()
+    first = request.GET.get('from')
+    first = (date.fromisoformat(first) if first
+             else last - timedelta(days=29))
+    if not 0 <= (last - first).days < MAX_REPORT_DAYS:
+        raise ValueError(first, last)
+    by = request.GET.get('by') or None
+    if by is not None and by not in groups:
+        raise ValueError(by)
+    pk = request.GET.get(key)
+    return first, last, int(pk) if pk else None, by
+
+
+def report(request, query, groups, key):
+    if not request.user.is_staff:
+        return HttpResponseForbidden()
+    try:
+        first, last, pk, by = report_args(request, groups, key)
+    except ValueError:
+        return HttpResponseBadRequest(
+            'Expected from and to dates at most %d days apart, by %s'
+            % (MAX_REPORT_DAYS, ' or '.join(groups)))
+    return JsonResponse({
+        'from': first,
+        'to': last,
+        'refreshed_to': refreshed_to(),
+        'rows': list(query(first, last, pk, by)),
+    })
+
+
+def sales(request):
+    return report(request, sales_report, ('day', 'job'), 'job')
+
+
+def workload(request):
+    return report(request, workload_report, ('day', 'moderator'),
+                  'moderator')
+
+
+def metrics(request):
+    if settings.JOBS_METRICS_TOKEN:
+        allowed = has_metrics_token(request)
+    else:
+        allowed = request.user.is_staff
+    if not allowed:
+        return HttpResponseForbidden()
+    return HttpResponse(prometheus_text(),
+                        content_type='text/plain; version=0.0.4')
+
+
+def render_job(request, version, pk):
+    job = cached_job(version, pk, lambda: Job.objects.filter(pk=pk).first())
+    if job is None:
+        # Deleted jobs lead back to the catalog.
+        if Job.all_objects.filter(pk=pk).exists():
+            return redirect('/')
+        return HttpResponse(status=404)
     return render(
         request,
         'job.html',
@@ -36,46 +215,190 @@ def job_detail(request, pk):
     )
 
 
-def printing_detail(request, pk):
-    printing = Printing.objects.get(pk=pk)
-    if printing.status == 'deleted':
+@catalog_reads
+def job_detail(request, pk):
+    version = catalog_version()
+    if page_cacheable(request, request.user):
+        return cached_page_response(
+            request, version, lambda: render_job(request, version, pk))
+    return render_job(request, version, pk)
+
+
+# What printing.html shows; the job descriptions and user rows are wide.
+PRINTING_FIELDS = (
+    'quantity', 'job__name', 'job__image', 'job__image_variants',
+    'printing__name', 'printing__status', 'printing__total_price',
+    'printing__item_count', 'printing__author__username',
+    'printing__moderator__username',
+)
+
+
+def printing_lines(pk):
+    # Formed printings keep the price they were ordered at, drafts follow
+    # the catalog. One annotate() call: resolving expressions is most of
+    # what compiling this query costs.
+    line_price = Coalesce('price', 'job__price')
+    return (PrintingJob.objects.filter(printing_id=pk)
+            .select_related('job', 'printing__author', 'printing__moderator')
+            .only(*PRINTING_FIELDS)
+            .annotate(line_price=line_price,
+                      subtotal=line_price * Coalesce('quantity', Value(0)))
+            .order_by('id'))
+
+
+def load_printing(pk):
+    """
+    The printing with its author, moderator and lines, in one query unless
+    it has no lines. None if there is no such printing.
+    """
+    lines = list(printing_lines(pk))
+    if lines:
+        return lines[0].printing, lines
+    printing = (Printing.objects.select_related('author', 'moderator')
+                .only(*[field[len('printing__'):] for field in
+                        PRINTING_FIELDS if field.startswith('printing__')])
+                .filter(pk=pk).first())
+    return printing, []
+
+
+def render_printing(request, printing, lines, csrf_token):
+    if printing is None or printing.status == 'deleted':
         return HttpResponse(status=404)
-    jobs = Job.objects.filter(printingjob__printing_id=pk).annotate(
-        quantity=F('printingjob__quantity')
-    )
-    return render(
+    response = render(
         request,
         'printing.html',
-        context={'printing': printing, 'jobs': jobs},
+        context={'printing': printing, 'lines': lines,
+                 'csrf_token': csrf_token},
     )
+    if printing.status not in FINAL_STATUSES:
+        patch_cache_control(response, no_store=True)
+    return response
+
+
+def printing_detail(request, pk):
+    if not settings.JOBS_PAGE_CACHE:
+        return render_printing(request, *load_printing(pk),
+                               get_token(request))
+
+    def build():
+        printing, lines = load_printing(pk)
+        final = printing is not None and printing.status in FINAL_STATUSES
+        return render_printing(request, printing, lines,
+                               CSRF_PLACEHOLDER if final
+                               else get_token(request))
+
+    version = catalog_version()
+    return cached_page_response(request, version, build,
+                                key=printing_page_key(version, pk))
 
 
 def add_to_printing(request, pk):
     if request.method == 'POST':
-        job = Job.objects.get(pk=pk)
-        printing = Printing.objects.filter(status='draft',
-                                           author=request.user).first()
-        if not printing:
-            printing = Printing.objects.create(
-                author=request.user
-            )
-
+        if not request.user.is_authenticated:
+            return HttpResponseForbidden()
         try:
-            PrintingJob.objects.create(
-                job=job,
-                printing=printing,
-                quantity=1
-            )
-        except IntegrityError:
-            PrintingJob.objects.filter(job=job, printing=printing).delete()
+            toggle_job(request.user.pk, pk)
+        except Job.DoesNotExist:
+            raise Http404
+        # Not patched: a copy read before the draft was locked may miss a
+        # concurrent click. The next page loads it again in one query.
+        forget_cart(request.user.pk)
+        return redirect('/')
+
+
+def parse_quantities(body):
+    items = json.loads(body)['jobs']
+    if not isinstance(items, list) or not 0 < len(items) <= MAX_BULK_JOBS:
+        raise ValueError(items)
+    quantities = {}
+    for item in items:
+        job_id, quantity = item['id'], item.get('quantity', 1)
+        if not (isinstance(job_id, int) and isinstance(quantity, int)
+                and quantity > 0):
+            raise ValueError(item)
+        quantities[job_id] = quantity
+    return quantities
+
+
+@require_POST
+def add_many_to_printing(request):
+    if not request.user.is_authenticated:
+        return HttpResponseForbidden()
+    try:
+        quantities = parse_quantities(request.body)
+    except (ValueError, KeyError, TypeError):
+        return HttpResponseBadRequest('Expected {"jobs": [{"id", "quantity"}]}')
+    try:
+        draft_id = set_quantities(request.user.pk, quantities)
+    except Job.DoesNotExist as exc:
+        return JsonResponse({'missing': exc.args[0]}, status=404)
+    forget_cart(request.user.pk)
+    return JsonResponse({'id': draft_id, 'jobs': quantities})
+
+
+@require_POST
+def form_printing(request):
+    if not request.user.is_authenticated:
+        return HttpResponseForbidden()
+    printing_id = form_draft(request.user.pk)
+    if printing_id is None:
         return redirect('/')
+    forget_cart(request.user.pk)
+    return redirect('printing', pk=printing_id)
+
+
+def moderation_page(page, next_cursor):
+    return {'results': [queue_json(printing) for printing in page],
+            'next_cursor': next_cursor}
+
+
+def queue(request):
+    if not request.user.is_staff:
+        return HttpResponseForbidden()
+    try:
+        page, next_cursor = paginate(
+            moderation_queue(), QUEUE_ORDERING, request.GET.get('cursor'),
+            clamp_page_size(request.GET.get('size')))
+    except InvalidCursor:
+        return HttpResponseBadRequest('Invalid cursor')
+    return JsonResponse(moderation_page(page, next_cursor))
+
+
+@require_POST
+def moderate(request, action):
+    if not request.user.is_staff:
+        return HttpResponseForbidden()
+    try:
+        ids = parse_ids(request.body)
+    except (ValueError, KeyError, TypeError):
+        return HttpResponseBadRequest('Expected {"ids": [...]}')
+    moved = transition(action, ids, request.user.pk)
+    return JsonResponse({action: moved,
+                         'skipped': sorted(set(ids) - set(moved))})
+
+
+def mark_deleted(pk):
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "UPDATE jobs_printing SET status = 'deleted', updated_at = %s "
+            "WHERE id = %s AND status <> 'deleted' "
+            "RETURNING " + EVENT_COLUMNS + ", formed_at, complete_at",
+            [timezone.now(), pk]
+        )
+        row = cursor.fetchone()
+    forget_printing_page(pk)
+    if row is None:
+        return None
+    # Only a formed printing, formed and not decided, was in the moderation
+    # queue; the UPDATE returns the new status.
+    printing_changed([row[:5]],
+                     left_queue=row[5] is not None and row[6] is None)
+    return row[1]
 
 
 def delete_printing(request, pk):
     if request.method == 'POST':
-        with connection.cursor() as cursor:
-            cursor.execute(
-                "UPDATE jobs_printing SET status = 'deleted' WHERE id = %s",
-                [pk]
-            )
+        author_id = mark_deleted(pk)
+        if author_id is not None:
+            forget_cart(author_id)
         return redirect('/')